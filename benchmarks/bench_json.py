@@ -0,0 +1,50 @@
+"""
+render_json encoder backends on a Model.all() shaped payload.
+
+Model.all() returns rows as dicts holding ints, strings, Decimal, datetime
+and NULLs; a list endpoint wraps them in the {"data": [...]} envelope.
+
+    python benchmarks/bench_json.py [rows]
+"""
+
+import sys
+import timeit
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from cloudoll.orm.mysql import AttrDict
+from cloudoll.web import encoder
+
+
+def rows(count):
+    start = datetime(2024, 1, 1)
+    return [
+        AttrDict(
+            id=1000000 + i,
+            name=f"product name {i}",
+            description="Lorem ipsum dolor sit amet, consectetur adipiscing elit.",
+            price=Decimal(f"{i % 1000}.99"),
+            stock=i % 37,
+            status=i % 3,
+            remark=None,
+            gmt_create=start + timedelta(minutes=i),
+            gmt_modify=start + timedelta(minutes=i, seconds=30),
+        )
+        for i in range(count)
+    ]
+
+
+def main(count):
+    payload = {"data": rows(count), "message": "OK", "code": 200}
+    for name in ("json", "orjson", "msgspec"):
+        if encoder.use_backend(name) != name:
+            print(f"{name:8} not installed")
+            continue
+        number = 20
+        cost = timeit.timeit(lambda: encoder.dumps(payload), number=number)
+        size = len(encoder.dumps(payload))
+        print(f"{name:8} {cost / number * 1000:8.2f}ms  {size / 1024:8.1f}KB")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
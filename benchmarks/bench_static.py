@@ -0,0 +1,76 @@
+"""
+StaticFiles against router.add_static, over a real socket.
+
+A small css file (served from memory), a 1MB file (sendfile) and a
+revalidation with If-None-Match, each fetched `count` times by 32
+concurrent clients.
+
+    python benchmarks/bench_static.py [count]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from cloudoll.web.static import StaticFiles
+
+CLIENTS = 32
+
+
+def make_files(root):
+    with open(os.path.join(root, "app.css"), "w") as f:
+        f.write("body { margin: 0; padding: 0; color: #333; }\n" * 200)
+    with open(os.path.join(root, "video.bin"), "wb") as f:
+        f.write(os.urandom(1024 * 1024))
+
+
+async def fetch(session, url, count, headers=None):
+    for _ in range(count):
+        async with session.get(url, headers=headers) as response:
+            await response.read()
+
+
+async def bench(app, count):
+    results = {}
+    async with TestServer(app) as server:
+        async with aiohttp.ClientSession() as session:
+            css = server.make_url("/static/app.css")
+            async with session.get(css) as response:
+                etag = response.headers["ETag"]
+            cases = (
+                ("small", css, None),
+                ("large", server.make_url("/static/video.bin"), None),
+                ("304", css, {"If-None-Match": etag}),
+            )
+            for name, url, headers in cases:
+                per_client = max(1, count // CLIENTS)
+                start = time.perf_counter()
+                await asyncio.gather(
+                    *(fetch(session, url, per_client, headers) for _ in range(CLIENTS))
+                )
+                elapsed = time.perf_counter() - start
+                results[name] = per_client * CLIENTS / elapsed
+    return results
+
+
+def main(count):
+    with tempfile.TemporaryDirectory() as root:
+        make_files(root)
+        add_static = web.Application()
+        add_static.router.add_static("/static", root)
+        static_files = web.Application()
+        static_files.router.add_get("/static/{filename:.*}", StaticFiles(root))
+        for name, app in (("add_static", add_static), ("StaticFiles", static_files)):
+            results = asyncio.run(bench(app, count))
+            row = "  ".join(f"{k} {v:9.0f} req/s" for k, v in results.items())
+            print(f"{name:12} {row}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
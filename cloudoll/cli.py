@@ -7,7 +7,7 @@ import sys
 from cloudoll.logging import error
 from cloudoll import __version__
 from typing import Any
-from cloudoll.clitool.cli_main import run_app, run_gen, create_project
+from cloudoll.clitool.cli_main import run_app, run_gen, run_worker, create_project
 from cloudoll.clitool.process import ProcessManager
 
 
@@ -84,6 +84,13 @@ def gen(**config: Any) -> None:
 @click.option(
     "-e", "--entry", help="Entry point model name. delfault name app", default="app"
 )
+@click.option(
+    "-w",
+    "--workers",
+    help="Pre-forked worker processes sharing the port, production mode only",
+    type=int,
+    default=1,
+)
 def start(**config: Any) -> None:
     """Start a service."""
     try:
@@ -95,6 +102,35 @@ def start(**config: Any) -> None:
         sys.exit(2)
 
 
+@cli.command()
+@click.option(
+    "-env", "--environment", help="Environment, local / test / prod", default="local"
+)
+@click.option(
+    "-n",
+    "--name",
+    help="Your worker's name, must be unique",
+    required=True,
+)
+@click.option(
+    "-e", "--entry", help="Entry point model name. delfault name app", default="app"
+)
+@click.option(
+    "-w",
+    "--workers",
+    help="Worker processes, each runs jobs.workers jobs at a time",
+    type=int,
+    default=1,
+)
+def worker(**config: Any) -> None:
+    """Run the background jobs queued in redis (jobs.redis)."""
+    try:
+        run_worker(**config)
+    except Exception as e:
+        error(f"Error: {e}")
+        sys.exit(2)
+
+
 @cli.command()
 @click.option(
     "-n",
@@ -102,9 +138,16 @@ def start(**config: Any) -> None:
     help="Your service name.",
     required=True,
 )
-def stop(name):
+@click.option(
+    "-t",
+    "--timeout",
+    help="Seconds to wait for in-flight requests before killing",
+    type=float,
+    default=40,
+)
+def stop(name, timeout):
     """Stop a service."""
-    ProcessManager.safe_exit(name)
+    ProcessManager.safe_exit(name, timeout)
 
 
 @cli.command()
@@ -120,7 +163,14 @@ def stop(name):
     help="Force restart even if the service is not running",
     required=False,
 )
-def restart(name, force):
+@click.option(
+    "-t",
+    "--timeout",
+    help="Seconds to wait for in-flight requests before killing",
+    type=float,
+    default=40,
+)
+def restart(name, force, timeout):
     """Restart a service."""
     pid = ProcessManager.get_running_pid(name)
     if not pid:
@@ -129,7 +179,7 @@ def restart(name, force):
             click.echo(f"⚠️  Service {name} not running，use --force to force restart")
             return
 
-    ProcessManager.safe_exit(name)
+    ProcessManager.safe_exit(name, timeout)
 
     args = ProcessManager.load_start_args(name)
     if not args:
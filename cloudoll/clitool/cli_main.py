@@ -9,6 +9,7 @@ from pathlib import Path
 from cloudoll.clitool.m2d import create_models, create_tables
 from cloudoll.orm import create_engine
 import os
+import socket
 from cloudoll.clitool.process import ProcessManager
 import sys
 from importlib.resources import files
@@ -32,6 +33,34 @@ def run_app(**config_kwargs: Any):
         if pid:
             error(f"⚠️  {config.name} is already running with PID {pid}. Exiting.")
             return
+        workers = int(config.workers or 1)
+        if workers > 1 and not hasattr(os, "fork"):
+            error("--workers needs fork(), starting a single process.")
+            workers = 1
+        if workers > 1:
+            try:
+                ProcessManager.save_pid(config.name, os.getpid())
+                sock = _bind_socket(config, app_config)
+
+                def serve(index):
+                    App = app.create(
+                        env=config.environment,
+                        config=app_config,
+                        entry_model=config.entry,
+                        workers=workers,
+                    )
+                    App.run(sock=sock)
+
+                # workers drain for server.shutdown_timeout before the master kills them
+                conf_server = app_config.get("server") or {}
+                stop_timeout = float(conf_server.get("shutdown_timeout") or 30) + 5
+                ProcessManager.run_workers(
+                    config.name, workers, serve, stop_timeout=stop_timeout
+                )
+            finally:
+                ProcessManager.cleanup(config.name)
+            return
+
         ProcessManager.register_signal_handlers(config.name)
         try:
             App = app.create(
@@ -65,6 +94,67 @@ def run_app(**config_kwargs: Any):
         )
 
 
+def run_worker(**config_kwargs: Any):
+    """consume the durable job queue, see `Application.run_worker`"""
+    config = Object(config_kwargs)
+    app_config = get_config(config.environment)
+    ProcessManager.ensure_runtime_dir()
+    ProcessManager.save_start_args(config.name, sys.argv[1:])
+    pid = ProcessManager.get_running_pid(config.name)
+    if pid:
+        error(f"⚠️  {config.name} is already running with PID {pid}. Exiting.")
+        return
+
+    def consume(index):
+        App = app.create(
+            env=config.environment,
+            config=app_config,
+            entry_model=config.entry,
+            workers=workers,
+        )
+        # the same name after a restart picks up the jobs left unfinished
+        App.run_worker(consumer=f"{socket.gethostname()}:{config.name}:{index}")
+
+    workers = int(config.workers or 1)
+    if workers > 1 and not hasattr(os, "fork"):
+        error("--workers needs fork(), starting a single process.")
+        workers = 1
+    try:
+        ProcessManager.save_pid(config.name, os.getpid())
+        if workers > 1:
+            conf_jobs = app_config.get("jobs") or {}
+            stop_timeout = float(conf_jobs.get("drain_timeout") or 30) + 5
+            ProcessManager.run_workers(
+                config.name, workers, consume, stop_timeout=stop_timeout
+            )
+        else:
+            consume(0)
+    finally:
+        ProcessManager.cleanup(config.name)
+
+
+def _bind_socket(config, app_config) -> socket.socket:
+    """The listening socket the pre-forked workers inherit."""
+    defaults = {"host": "0.0.0.0", "port": 9001, "path": None}
+    conf_server = app_config.get("server") or {}
+    env_server = {"host": config.host, "port": config.port, "path": config.path}
+    server = chainMap(defaults, conf_server, env_server)
+    if server.path:
+        if os.path.exists(server.path):
+            os.unlink(server.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(server.path)
+    else:
+        family = socket.AF_INET6 if ":" in str(server.host) else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((server.host, int(server.port)))
+    sock.listen(int(conf_server.get("backlog", 128)))
+    sock.set_inheritable(True)
+    info(f"Server running on {server.path or f'http://{server.host}:{server.port}'}")
+    return sock
+
+
 async def run_gen(**config_kwargs: Any):
     config = Object(config_kwargs)
     configs = get_config(config.environment)
@@ -8,10 +8,21 @@ import platform
 import signal
 import time
 import json
+import logging
+import traceback
 
 from tabulate import tabulate
 
 
+def exit_code(status: int) -> int:
+    """the exit code of a waitpid() status, -signal when killed"""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    if os.WIFEXITED(status):
+        return os.WEXITSTATUS(status)
+    return status
+
+
 class ProcessManager:
     @staticmethod
     def ensure_runtime_dir():
@@ -43,6 +54,36 @@ class ProcessManager:
         run_dir = ProcessManager.get_run_dir()
         return run_dir / f"{name}.pid"
 
+    @staticmethod
+    def get_worker_dir():
+        worker_dir = ProcessManager.get_run_dir() / "workers"
+        worker_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+        return worker_dir
+
+    @staticmethod
+    def get_worker_pid_path(name: str, index: int):
+        return ProcessManager.get_worker_dir() / f"{name}.{index}.pid"
+
+    @staticmethod
+    def get_worker_pids(name: str) -> list:
+        """pid of every worker file of a service, alive or not"""
+        pids = []
+        for pid_file in sorted(ProcessManager.get_worker_dir().glob(f"{name}.*.pid")):
+            try:
+                pids.append(int(pid_file.read_text().strip()))
+            except (ValueError, IOError):
+                continue
+        return pids
+
+    @staticmethod
+    def cleanup_workers(name: str, index: Optional[int] = None):
+        pattern = f"{name}.*.pid" if index is None else f"{name}.{index}.pid"
+        for pid_file in ProcessManager.get_worker_dir().glob(pattern):
+            try:
+                os.unlink(pid_file)
+            except (IOError, PermissionError):
+                pass
+
     @staticmethod
     def save_pid(name: str, pid: int) -> None:
         """save pid file"""
@@ -56,7 +97,11 @@ class ProcessManager:
             click.echo(f"⚠️ can't save pid file: {e}", err=True)
 
     @staticmethod
-    def safe_exit(service_name: str):
+    def safe_exit(service_name: str, timeout: float = 40):
+        """
+        SIGTERM the service and wait `timeout` seconds for it to drain,
+        it is killed after that.
+        """
         pid = 0
         try:
             pid = ProcessManager.get_running_pid(service_name)
@@ -70,14 +115,22 @@ class ProcessManager:
                 os.kill(pid, signal.SIGTERM)
 
             # wait to exit
-            for _ in range(10):
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
                 if not ProcessManager._valid_process(pid, service_name):
                     break
-                time.sleep(1)
+                time.sleep(0.2)
             else:
+                click.echo(f"⚠️  {service_name} did not exit in {timeout}s, killed.")
                 os.kill(pid, signal.SIGKILL)
 
+            # workers left behind by a killed master
+            for worker_pid in ProcessManager.get_worker_pids(service_name):
+                if ProcessManager.is_pid_alive(worker_pid):
+                    os.kill(worker_pid, signal.SIGKILL)
+
             ProcessManager.cleanup(service_name)
+            ProcessManager.cleanup_workers(service_name)
             click.echo(f"🛑 Already stop service (PID: {pid})")
         except ProcessLookupError:
             ProcessManager.cleanup(service_name)
@@ -134,9 +187,14 @@ class ProcessManager:
 
     @staticmethod
     def handle_shutdown(service_name: str):
-        """Elegant Closure Processing"""
+        """
+        Elegant Closure Processing.
+        Only reached before the server runs, aiohttp installs its own handlers
+        that drain in-flight requests and run on_shutdown / on_cleanup.
+        SystemExit unwinds normally, so finally blocks run and logs are flushed.
+        """
         ProcessManager.cleanup(service_name)
-        os._exit(0)
+        raise SystemExit(0)
 
     @staticmethod
     def register_signal_handlers(service_name: str):
@@ -151,7 +209,7 @@ class ProcessManager:
 
                 ProcessManager.handle_shutdown(service_name)
             except Exception as e:
-                os._exit(1)
+                raise SystemExit(1)
 
         sigmap = (
             {
@@ -169,6 +227,113 @@ class ProcessManager:
             except (ValueError, AttributeError) as e:
                 click.echo(f"can't register signal {name}: {e}")
 
+    @staticmethod
+    def run_workers(
+        service_name: str,
+        workers: int,
+        target,
+        stop_timeout: float = 30,
+        max_restart_delay: float = 30,
+    ):
+        """
+        Fork `workers` processes running `target(index)` and supervise them:
+        crashed workers are restarted with a growing delay, SIGTERM / SIGINT
+        are forwarded and the workers get `stop_timeout` seconds to exit.
+        """
+        children = {}  # pid -> index
+        started = {}  # index -> start time
+        delays = {}  # index -> next restart delay
+        state = {"stopping": False, "deadline": 0.0}
+
+        def spawn(index):
+            pid = os.fork()
+            if pid == 0:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                code = 0
+                try:
+                    target(index)
+                except SystemExit as e:
+                    code = e.code if isinstance(e.code, int) else 0
+                except BaseException:
+                    traceback.print_exc()
+                    code = 1
+                finally:
+                    logging.shutdown()
+                    os._exit(code)
+            children[pid] = index
+            started[index] = time.monotonic()
+            ProcessManager.save_worker_pid(service_name, index, pid)
+
+        def stop(signum, frame):
+            if state["stopping"]:
+                return
+            state["stopping"] = True
+            state["deadline"] = time.monotonic() + stop_timeout
+            for pid in list(children):
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        for index in range(workers):
+            spawn(index)
+        click.echo(f"🚀 {service_name} started {workers} workers")
+
+        pending = []  # (restart at, index)
+        while children or (pending and not state["stopping"]):
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid, status = 0, 0
+            if pid:
+                index = children.pop(pid, None)
+                if index is None:
+                    continue
+                ProcessManager.cleanup_workers(service_name, index)
+                if state["stopping"]:
+                    continue
+                # a worker that ran for a while restarts at once again
+                if time.monotonic() - started[index] > 10:
+                    delays[index] = 0
+                delay = delays.get(index, 0)
+                delays[index] = min(max(1, delay * 2), max_restart_delay)
+                click.echo(
+                    f"⚠️  worker {index} (PID {pid}) exited with "
+                    f"{exit_code(status)}, restart in {delay}s",
+                    err=True,
+                )
+                pending.append((time.monotonic() + delay, index))
+                continue
+
+            now = time.monotonic()
+            if state["stopping"]:
+                if now > state["deadline"]:
+                    for pid in list(children):
+                        try:
+                            os.kill(pid, signal.SIGKILL)
+                        except ProcessLookupError:
+                            pass
+            else:
+                for item in [p for p in pending if p[0] <= now]:
+                    pending.remove(item)
+                    spawn(item[1])
+            time.sleep(0.2)
+
+        ProcessManager.cleanup_workers(service_name)
+
+    @staticmethod
+    def save_worker_pid(name: str, index: int, pid: int) -> None:
+        try:
+            pid_file = ProcessManager.get_worker_pid_path(name, index)
+            with open(pid_file, "w") as f:
+                f.write(str(pid))
+        except (IOError, PermissionError) as e:
+            click.echo(f"⚠️ can't save worker pid file: {e}", err=True)
+
     @staticmethod
     def save_start_args(service_name: str, args: list):
         """Save startup parameters to file"""
@@ -208,6 +373,7 @@ class ProcessManager:
             "Services",
             "PID",
             "Status",
+            "Workers",
             "Env",
             "RunTime",
             "CPU%",
@@ -220,12 +386,21 @@ class ProcessManager:
             try:
                 pid = int(pid_file.read_text())
                 if not psutil.pid_exists(pid):
-                    rows.append([service, pid, "🔴 Exited", "-", "-", "-", "-"])
+                    rows.append([service, pid, "🔴 Exited", "-", "-", "-", "-", "-"])
                     continue
 
                 proc = psutil.Process(pid)
-                cpu_percent = proc.cpu_percent(interval=0.1)  # 采样
-                mem_mb = proc.memory_info().rss / 1024 / 1024
+                # pre-forked workers are summed into their service
+                worker_pids = ProcessManager.get_worker_pids(service)
+                procs = [proc] + [
+                    psutil.Process(p) for p in worker_pids if psutil.pid_exists(p)
+                ]
+                for p in procs:
+                    p.cpu_percent(None)
+                time.sleep(0.1)  # 采样
+                cpu_percent = sum(p.cpu_percent(None) for p in procs)
+                mem_mb = sum(p.memory_info().rss for p in procs) / 1024 / 1024
+                workers = f"{len(procs) - 1}/{len(worker_pids)}" if worker_pids else "-"
                 name = proc.name()
 
                 # runtime (current time - start time)
@@ -245,6 +420,7 @@ class ProcessManager:
                         service,
                         pid,
                         "🟢 Running",
+                        workers,
                         env_value,
                         runtime,
                         f"{cpu_percent:.1f}",
@@ -253,6 +429,6 @@ class ProcessManager:
                     ]
                 )
             except Exception as e:
-                rows.append([service, "???", "error", "-", "-", "-", str(e)])
+                rows.append([service, "???", "error", "-", "-", "-", "-", str(e)])
 
         click.echo(tabulate(rows, headers=headers, tablefmt="rounded_grid"))
@@ -64,6 +64,14 @@ class MeteBase:
     async def many(self, sql, params, size: int):
         return await self.query(sql, params, QueryTypes.MANY, size)
 
+    async def iterate(self, sql, params=None, size: int = 1000):
+        """
+        Yield rows one by one, fetched `size` at a time.
+        Drivers without server side cursors fetch the whole result first.
+        """
+        for row in await self.all(sql, params) or []:
+            yield row
+
     async def count(self, sql, params) -> int:
         return await self.query(sql, params, QueryTypes.COUNT)
 
@@ -388,6 +388,19 @@ class Model(metaclass=ModelMetaclass):
         self._reset()
         return await self.__pool__.all(sql, args)
 
+    def stream(self, size: int = 1000):
+        """
+        Async iterator over the rows, fetched `size` at a time.
+        Return it from a handler to stream the result as json.
+
+        eg: return Users.use(db).where(Users.status == 1).stream()
+        """
+        sql = self._sql()
+        sql = self._exchange_sql(sql)
+        args = self.__params__
+        self._reset()
+        return self.__pool__.iterate(sql, args, size)
+
     def _exchange_sql(self, sql: str):
         if self.__is_pg:
             sql = sql.replace("CURDATE()", "CURRENT_DATE")
@@ -17,6 +17,10 @@ class AttrDictCursor(aiomysql.DictCursor):
     dict_type = AttrDict
 
 
+class AttrSSDictCursor(aiomysql.SSDictCursor):
+    dict_type = AttrDict
+
+
 class Mysql(MeteBase):
     def __init__(self):
         self.pool: Optional[aiomysql.Pool] = None
@@ -93,6 +97,32 @@ class Mysql(MeteBase):
             error(f"[MYSQL] query error: {e}, SQL: {sql} ,params: {params}")
             raise e
 
+    async def iterate(self, sql, params=None, size: int = 1000):
+        """
+        Stream rows with an unbuffered cursor, only `size` rows are held in memory.
+        """
+        sql = sql.replace("?", "%s")
+        if not self.pool:
+            raise ValueError("must be create_engine first.")
+        if self.pool._closing or self.pool._closed:
+            return
+        try:
+            async with self.pool.acquire() as conn:
+                if conn.echo:
+                    info("sql: %s , %s", sql, params)
+                async with conn.cursor(AttrSSDictCursor) as cursor:
+                    await cursor.execute(sql, params)
+                    while True:
+                        rows = await cursor.fetchmany(size)
+                        if not rows:
+                            break
+                        for row in rows:
+                            yield row
+                await conn.commit()
+        except Exception as e:
+            error(f"[MYSQL] iterate error: {e}, SQL: {sql} ,params: {params}")
+            raise e
+
     async def create_engine(self, loop=None, **kw):
         try:
             self.pool = await aiomysql.create_pool(
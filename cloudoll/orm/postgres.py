@@ -1,4 +1,5 @@
 import aiopg
+import uuid
 from psycopg2.extras import RealDictCursor
 from cloudoll.logging import error
 from cloudoll.orm.base import MeteBase, QueryTypes
@@ -86,6 +87,48 @@ class Postgres(MeteBase):
             error(f"[PG] query error: {e}, SQL: {sql} ,params: {params}")
             error(e)
 
+    async def iterate(self, sql, params=None, size: int = 1000):
+        """
+        Stream the rows of a SELECT with a server-side cursor, only `size`
+        rows are held in memory.
+        """
+        sql = sql.replace("?", "%s").replace("`", '"')
+        if not self.pool:
+            raise ValueError("must be create_engine first.")
+        if self.pool._closing or self.pool._closed:
+            return
+        name = f"cloudoll_{uuid.uuid4().hex}"
+        try:
+            async with self.pool.acquire() as conn:
+                if conn.echo:
+                    info("sql: %s ,%s", sql, params)
+                async with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    # aiopg connections autocommit, and psycopg2 has no named
+                    # cursors in async mode: DECLARE one inside a transaction
+                    await cursor.execute("BEGIN")
+                    try:
+                        await cursor.execute(
+                            f"DECLARE {name} NO SCROLL CURSOR FOR {sql}", params
+                        )
+                        while True:
+                            await cursor.execute(f"FETCH {int(size)} FROM {name}")
+                            rows = await cursor.fetchall()
+                            if not rows:
+                                break
+                            for row in rows:
+                                yield row
+                        await cursor.execute("COMMIT")
+                    except BaseException:
+                        # a failed query, or the consumer stopped early
+                        try:
+                            await cursor.execute("ROLLBACK")
+                        except Exception:
+                            conn.close()
+                        raise
+        except Exception as e:
+            error(f"[PG] iterate error: {e}, SQL: {sql} ,params: {params}")
+            raise e
+
     async def create_engine(self, **kw):
         try:
             host = (kw.get("host", "localhost"),)
@@ -1,21 +1,22 @@
 import asyncio
-from cloudoll.web import get, WebStream
+from cloudoll.web import get, EventStream
 
 
 @get("/es", sa_ignore=True)
 async def es(ctx):
-    ev = await WebStream(
-        ctx,
-        headers={
-            "Content-Type": "text/event-stream",
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-        },
-    )
-    for x in range(10):
-        if ctx.transport is None or ctx.transport.is_closing():
-            break
-        msg = f"data: {x}\n\n"
-        await ev.write(msg.encode("utf-8"))
-        await asyncio.sleep(1)
-    return ev
+    async with EventStream(ctx) as stream:
+        for x in range(10):
+            # a client that went away raises ConnectionResetError here, the
+            # `async with` ends the stream quietly
+            await stream.send({"count": x}, event="count")
+            await asyncio.sleep(1)
+    return stream.response
+
+
+@get("/es/news", sa_ignore=True)
+async def news(ctx):
+    """
+    followers of the `news` channel, `await app.events("news").publish(...)`
+    reaches all of them, reconnects with Last-Event-ID get what they missed
+    """
+    return await ctx.app.events("news").subscribe(ctx)
@@ -1,22 +1,21 @@
-import asyncio
 from cloudoll.web import post
-from pathlib import Path
 
-@post("/api/upload", sa_ignore=True)
-async def upload(ctx, file):
+
+@post("/api/upload", sa_ignore=True, upload={"max_size": 1024**3, "max_files": 5})
+async def upload(ctx, upload):
     """
-    upload api
+    upload api, files are streamed to disk chunk by chunk
     """
-    file_name = file.filename  # Get the file name
-    file_content = await file.read()  # Get the file
-    file_dir = Path("static") / "upload"  # Define the upload directory
-    file_dir.mkdir(parents=True, exist_ok=True)  # Create the directory if it
-    save_path = file_dir / file_name
-    with open(save_path, "wb") as f:
-        f.write(file_content)
-
+    files = await upload.save("static/upload")
     return {
         "message": "upload success",
-        "file_name": file_name,
-        "file_size": len(file_content),
+        "fields": upload.fields,
+        "files": [
+            {
+                "file_name": f.path.name,
+                "file_size": f.size,
+                "sha256": f.hashes["sha256"],
+            }
+            for f in files
+        ],
     }
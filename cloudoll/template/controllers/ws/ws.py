@@ -1,18 +1,17 @@
-from cloudoll.web import get, WebSocket, WSMsgType, WebSocketResponse
+from cloudoll.web import get, WSMsgType
 
 
 @get("/ws", sa_ignore=True)
 async def ws(ctx):
-    ws = await WebSocket(ctx, timeout=3)
+    hub = ctx.app.hub
+    async with hub.connect(ctx, rooms=["lobby"], heartbeat=30) as conn:
+        async for msg in conn:
+            if msg.type == WSMsgType.text:
+                text = msg.data  # Received a message from the client
+                if text:
+                    # encoded once for every socket of the room, on every worker
+                    await hub.broadcast({"msg": text}, room="lobby")
+            elif msg.type == WSMsgType.error:
+                break
 
-    async for msg in ws:
-        if msg.type == WSMsgType.text:
-            text = msg.data  # Received a message from the client
-            if text:
-                await ws.send_json({"msg": text})
-        elif msg.type == WSMsgType.error:
-            break
-        elif msg.type == WSMsgType.close:
-            break
-
-    return ws
+    return conn.ws
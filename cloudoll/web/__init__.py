@@ -6,6 +6,10 @@ from typing import Tuple
 
 from cloudoll.web.settings import get_config
 from cloudoll.web import jwt
+from cloudoll.web.encoder import register_json_type
+from cloudoll.web.route import RouteOptions, route_options
+from cloudoll.web.upload import Upload, UploadedFile, UploadLimit
+from cloudoll.web.sse import EventStream
 from cloudoll.web.core import (
     Application,
     app,
@@ -21,6 +25,7 @@ from cloudoll.web.core import (
     delete,
     post,
     render_json,
+    render_stream,
     render_error,
     render_view,
     render,
@@ -43,6 +48,7 @@ __all__: Tuple[str, ...] = (
     "delete",
     "post",
     "render_json",
+    "render_stream",
     "render_error",
     "render_view",
     "render",
@@ -50,4 +56,11 @@ __all__: Tuple[str, ...] = (
     "redirect",
     "jwt",
     "get_config",
+    "register_json_type",
+    "RouteOptions",
+    "route_options",
+    "Upload",
+    "UploadedFile",
+    "UploadLimit",
+    "EventStream",
 )
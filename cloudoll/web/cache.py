@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "Qiu / smallerqiu@gmail.com"
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+from urllib import parse
+
+from aiohttp import hdrs
+from aiohttp.web import Response
+from aiohttp.web_request import Request
+from cloudoll.logging import warning
+
+# headers that belong to a single response and are never replayed
+_SKIP_HEADERS = {
+    h.lower()
+    for h in (
+        hdrs.CONTENT_TYPE,
+        hdrs.CONTENT_LENGTH,
+        hdrs.TRANSFER_ENCODING,
+        hdrs.DATE,
+        hdrs.SET_COOKIE,
+    )
+}
+
+
+class CachePolicy(object):
+    """
+    Response cache options of a route.
+
+    :params ttl seconds a response stays cached
+    :params vary request headers that are part of the key, e.g. ["Authorization"]
+    :params redis also share the response through the redis tier
+    """
+
+    __slots__ = ("ttl", "vary", "redis")
+
+    def __init__(self, ttl: float = 5, vary=(), redis: bool = True):
+        self.ttl = float(ttl)
+        self.vary = tuple(vary)
+        self.redis = redis
+
+    @classmethod
+    def parse(cls, cache: Union[None, bool, int, float, dict, "CachePolicy"]):
+        """cache=10, cache={"ttl": 10, "vary": ["Authorization"]}"""
+        if cache is None or cache is False:
+            return None
+        if isinstance(cache, CachePolicy):
+            return cache
+        if cache is True:
+            return cls()
+        if isinstance(cache, dict):
+            return cls(**cache)
+        return cls(ttl=cache)
+
+
+class LRUCache(object):
+    """Bounded in-process cache, entries expire after their own ttl."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float):
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CachedResponse(object):
+    __slots__ = (
+        "status",
+        "content_type",
+        "charset",
+        "headers",
+        "body",
+        "expires",
+        "etag_length",
+    )
+
+    def __init__(
+        self, status, content_type, charset, headers, body, expires, etag_length=None
+    ):
+        self.status = status
+        self.content_type = content_type
+        self.charset = charset
+        self.headers = headers
+        self.body = body
+        self.expires = expires
+        # the part of a render_json body the etag is hashed from
+        self.etag_length = etag_length
+
+    @classmethod
+    def from_response(cls, response: Response, ttl: float):
+        headers = [
+            (k, v)
+            for k, v in response.headers.items()
+            if k.lower() not in _SKIP_HEADERS
+        ]
+        return cls(
+            response.status,
+            response.content_type,
+            response.charset,
+            headers,
+            bytes(response.body),
+            time.time() + ttl,
+            getattr(response, "etag_length", None),
+        )
+
+    def to_response(self) -> Response:
+        response = Response(
+            status=self.status,
+            body=self.body,
+            content_type=self.content_type,
+            charset=self.charset,
+        )
+        for k, v in self.headers:
+            response.headers.add(k, v)
+        if self.etag_length is not None:
+            response.etag_length = self.etag_length
+        return response
+
+    def dumps(self) -> bytes:
+        meta = [
+            self.status,
+            self.content_type,
+            self.charset,
+            self.headers,
+            self.expires,
+            self.etag_length,
+        ]
+        return json.dumps(meta).encode("utf-8") + b"\n" + self.body
+
+    @classmethod
+    def loads(cls, raw: bytes):
+        meta, _, body = raw.partition(b"\n")
+        fields = json.loads(meta)
+        # entries written before etag_length was stored have 5 fields
+        return cls(*fields[:4], body, *fields[4:])
+
+
+def cache_key(request: Request, policy: CachePolicy) -> str:
+    """method, path, match_info, sorted query string and the `vary` headers"""
+    match_info = ",".join(f"{k}={v}" for k, v in sorted(request.match_info.items()))
+    query = parse.urlencode(sorted(parse.parse_qsl(request.query_string, True)))
+    key = f"{request.method}:{request.path}:{match_info}:{query}"
+    if policy.vary:
+        vary = ",".join(request.headers.get(h, "") for h in policy.vary)
+        key = f"{key}:{vary}"
+    return key
+
+
+class ResponseCache(object):
+    """
+    Two tiers: a bounded in-process LRU, then redis when configured.
+    Concurrent misses on the same key wait for a single computation.
+    """
+
+    def __init__(self, max_entries: int = 1024, redis=None, prefix="cloudoll:cache:"):
+        self.local = LRUCache(max_entries)
+        self.redis = redis
+        self.prefix = prefix
+        self._pending: Dict[str, "asyncio.Future[Optional[CachedResponse]]"] = {}
+
+    async def get(self, key: str, policy: CachePolicy) -> Optional[CachedResponse]:
+        entry = self.local.get(key)
+        if entry is not None:
+            return entry
+        if self.redis is None or not policy.redis:
+            return None
+        try:
+            raw = await self.redis.get(self.prefix + key)
+        except Exception as e:
+            warning(f"response cache redis get failed: {e}")
+            return None
+        if raw is None:
+            return None
+        entry = CachedResponse.loads(raw)
+        ttl = entry.expires - time.time()
+        if ttl <= 0:
+            return None
+        self.local.set(key, entry, ttl)
+        return entry
+
+    async def set(self, key: str, entry: CachedResponse, policy: CachePolicy):
+        self.local.set(key, entry, policy.ttl)
+        if self.redis is None or not policy.redis:
+            return
+        try:
+            await self.redis.set(
+                self.prefix + key, entry.dumps(), px=max(1, int(policy.ttl * 1000))
+            )
+        except Exception as e:
+            warning(f"response cache redis set failed: {e}")
+
+    async def delete(self, key: str):
+        self.local.delete(key)
+        if self.redis is not None:
+            await self.redis.delete(self.prefix + key)
+
+    async def fetch(
+        self,
+        request: Request,
+        policy: CachePolicy,
+        compute: Callable[[], Awaitable[Any]],
+    ):
+        """Return the cached response of `request`, or compute and cache it."""
+        if request.method not in (hdrs.METH_GET, hdrs.METH_HEAD):
+            return await compute()
+        key = cache_key(request, policy)
+        entry = await self.get(key, policy)
+        if entry is not None:
+            return entry.to_response()
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            entry = await asyncio.shield(pending)
+            if entry is not None:
+                return entry.to_response()
+            return await compute()
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        entry = None
+        try:
+            response = await compute()
+            if _cacheable(response):
+                entry = CachedResponse.from_response(response, policy.ttl)
+                await self.set(key, entry, policy)
+            return response
+        finally:
+            del self._pending[key]
+            future.set_result(entry)
+
+
+def _cacheable(response) -> bool:
+    return (
+        isinstance(response, Response)
+        and response.status == 200
+        and isinstance(response.body, (bytes, bytearray))
+        and hdrs.SET_COOKIE not in response.headers
+    )
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "Qiu / smallerqiu@gmail.com"
+
+import asyncio
+import zlib
+from typing import Callable, Dict, Iterable, Optional
+
+from aiohttp import hdrs
+from aiohttp.helpers import ETag
+from aiohttp.web import Response
+from aiohttp.web_request import Request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    from compression import zstd  # python 3.14+
+except ImportError:  # pragma: no cover
+    zstd = None
+    try:
+        import zstandard
+    except ImportError:
+        zstandard = None
+
+
+def _gzip(data: bytes, level: int) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _brotli(data: bytes, level: int) -> bytes:
+    return brotli.compress(data, quality=min(level, 11))
+
+
+def _zstd(data: bytes, level: int) -> bytes:
+    if zstd is not None:
+        return zstd.compress(data, level=level)
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+COMPRESSORS: Dict[str, Callable[[bytes, int], bytes]] = {"gzip": _gzip}
+if brotli is not None:
+    COMPRESSORS["br"] = _brotli
+if zstd is not None or zstandard is not None:
+    COMPRESSORS["zstd"] = _zstd
+
+# content types that are already compressed
+_INCOMPRESSIBLE = (
+    "image/",
+    "video/",
+    "audio/",
+    "font/woff",
+    "application/zip",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-7z-compressed",
+    "application/x-rar-compressed",
+    "application/x-brotli",
+    "application/zstd",
+    "application/octet-stream",
+    "application/pdf",
+)
+_COMPRESSIBLE_IMAGES = ("image/svg+xml", "image/x-icon", "image/bmp")
+
+
+def accepted_encodings(header: Optional[str]) -> Dict[str, float]:
+    """Accept-Encoding as {coding: q}"""
+    accepted = {}
+    if not header:
+        return accepted
+    for part in header.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if coding:
+            accepted[coding] = q
+    return accepted
+
+
+def negotiate(header: Optional[str], preference: Iterable[str]) -> Optional[str]:
+    """The first of `preference` the client accepts, None for identity."""
+    accepted = accepted_encodings(header)
+    if not accepted:
+        return None
+    default = accepted.get("*", 0.0)
+    for coding in preference:
+        if accepted.get(coding, default) > 0:
+            return coding
+    return None
+
+
+def _compressible(content_type: str) -> bool:
+    if content_type.startswith(_COMPRESSIBLE_IMAGES):
+        return True
+    return not content_type.startswith(_INCOMPRESSIBLE)
+
+
+def compress_middleware(
+    min_size: int = 1024,
+    level: int = 6,
+    executor_size: int = 64 * 1024,
+    encodings: Iterable[str] = ("zstd", "br", "gzip"),
+):
+    """
+    Compress response bodies the client accepts, in order of `encodings`.
+
+    :params min_size bodies smaller than this are sent as is
+    :params level compression level, brotli is capped to 11
+    :params executor_size bodies from this size are compressed in a thread
+    :params encodings server preference, unavailable codings are skipped
+    """
+    preference = tuple(e for e in encodings if e in COMPRESSORS)
+
+    async def compress(request: Request, handler):
+        response = await handler(request)
+        if (
+            not preference
+            or not isinstance(response, Response)
+            or response.status < 200
+            or response.status in (204, 206, 304)
+            or hdrs.CONTENT_ENCODING in response.headers
+        ):
+            return response
+        body = response.body
+        if not isinstance(body, (bytes, bytearray)) or len(body) < min_size:
+            return response
+        if not _compressible(response.content_type):
+            return response
+        coding = negotiate(request.headers.get(hdrs.ACCEPT_ENCODING), preference)
+        if "accept-encoding" not in response.headers.get(hdrs.VARY, "").lower():
+            response.headers.add(hdrs.VARY, hdrs.ACCEPT_ENCODING)
+        if coding is None:
+            return response
+
+        compressor = COMPRESSORS[coding]
+        if len(body) >= executor_size:
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(None, compressor, bytes(body), level)
+        else:
+            data = compressor(body, level)
+        if len(data) >= len(body):
+            return response
+        response.body = data
+        response.headers[hdrs.CONTENT_ENCODING] = coding
+        etag = response.etag
+        if etag is not None and not etag.is_weak:
+            # the compressed bytes differ, but the representation is the same
+            response.etag = ETag(value=etag.value, is_weak=True)
+        return response
+
+    return compress
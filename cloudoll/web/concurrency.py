@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "Qiu / smallerqiu@gmail.com"
+
+import asyncio
+from collections import deque
+from typing import Union
+
+
+class ConcurrencyLimit(object):
+    """
+    At most `limit` requests run at once, `queue` more wait up to `timeout`
+    seconds for a slot, the rest are shed right away.
+
+    :params limit requests handled at the same time
+    :params queue requests waiting for a slot, 0 sheds as soon as it is full
+    :params timeout longest wait in the queue, seconds
+    :params retry_after Retry-After of shed requests, seconds
+    """
+
+    __slots__ = ("limit", "queue", "timeout", "retry_after", "in_flight", "_waiters")
+
+    def __init__(
+        self,
+        limit: int,
+        queue: int = 0,
+        timeout: float = 1,
+        retry_after: int = 1,
+    ):
+        self.limit = int(limit)
+        self.queue = int(queue)
+        self.timeout = float(timeout)
+        self.retry_after = int(retry_after)
+        self.in_flight = 0
+        self._waiters: "deque[asyncio.Future]" = deque()
+
+    @classmethod
+    def parse(cls, limit: Union[None, bool, int, dict, "ConcurrencyLimit"]):
+        """concurrency=50, concurrency={"limit": 50, "queue": 100, "timeout": 2}"""
+        if limit is None or limit is False:
+            return None
+        if isinstance(limit, ConcurrencyLimit):
+            return limit
+        if isinstance(limit, dict):
+            return cls(**limit)
+        return cls(limit)
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> bool:
+        """False when the request has to be shed"""
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return True
+        if len(self._waiters) >= self.queue:
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # release() hands its slot over, in_flight stays the same
+            await asyncio.wait_for(waiter, self.timeout)
+            return True
+        except asyncio.TimeoutError:
+            # the slot may have been handed over just as the wait timed out
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            return False
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if not waiter.done() or waiter.cancelled():
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+
+    def release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
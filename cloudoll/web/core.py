@@ -10,10 +10,13 @@ import base64
 import importlib.util
 import inspect
 import json
+import os
+import random
+import signal
+from functools import partial
 from pathlib import Path
 import sys
 import time
-from types import SimpleNamespace
 from urllib import parse
 from aiohttp import web, hdrs
 from aiohttp.web import Response
@@ -22,96 +25,288 @@ from aiohttp.web_response import StreamResponse
 from aiohttp.web_request import Request
 from aiohttp.typedefs import LooseHeaders
 from aiohttp_session import (
-    get_session,
+    STORAGE_KEY,
     setup,
     redis_storage,
     memcached_storage,
-    cookie_storage,
 )
 from cloudoll.web.settings import get_config
-from cloudoll.logging import info
-from cloudoll.orm.model import Model
-from cloudoll.web import jwt
-from decimal import Decimal
-from datetime import datetime, date
+from cloudoll.logging import info, warning
+from cloudoll.web import jwt, encoder
+from cloudoll.web.encoder import JsonEncoder
+from cloudoll.web.cache import ResponseCache
+from cloudoll.web.etag import conditional, make_etag
+from cloudoll.web.compress import compress_middleware
+from cloudoll.web.metrics import Metrics, route_name
+from cloudoll.web.session import CookieStorage, LazySession, reads_session
+from cloudoll.web.sse import EventChannels
+from cloudoll.web.templates import TemplateResponse, Templates
+from cloudoll.web.static import StaticFiles
+from cloudoll.web.upload import Upload
+from cloudoll.web.concurrency import ConcurrencyLimit
+from cloudoll.web.executor import Executors, offload_context
+from cloudoll.web.hub import Hub
+from cloudoll.web.manifest import LazyHandler, LazyModule, Manifest
+from cloudoll.web.jobs import JobQueue
+from cloudoll.web.schedule import Scheduler
+from cloudoll.web.ratelimit import RateLimit, RateLimiter, retry_after
+from cloudoll.web.route import DEFAULT_OPTIONS, RouteOptions, compose, route_options
+from datetime import datetime
 from cloudoll.utils.common import chainMap, Object
 from cloudoll.orm import create_engine, parse_coon
-import uuid
-from typing import Optional, Iterable, Callable, Awaitable
+from contextlib import contextmanager
+from typing import Optional, Iterable, Callable, Awaitable, Dict
+
+# server.lazy_routes manifest, relative to the project
+MANIFEST_PATH = ".cloudoll/manifest.json"
+
+
+class DispatchPlan(object):
+    """
+    How a handler is invoked, resolved once when the route is registered
+    instead of inspecting the handler's signature on every request.
+    """
+
+    __slots__ = ("arity", "multipart", "decoders", "session")
+
+    def __init__(self, func):
+        props = inspect.getfullargspec(func)
+        args = list(props.args)
+        if "self" in args:
+            args.remove("self")
+        self.arity = len(args)
+        # (request, field) handlers receive the first multipart part, or the
+        # `Upload` of routes declared with `upload=`
+        self.multipart = self.arity == 2
+        # body decoders by content type, only needed by (request) handlers
+        self.decoders = _BODY_DECODERS if self.arity == 1 else None
+        # remote sessions are loaded up front for the handlers reading them,
+        # View methods reach it through self.request
+        self.session = reads_session(func)
+
+
+def _first_values(pairs) -> Object:
+    obj = Object()
+    for k, v in pairs:
+        if k not in obj:
+            obj[k] = v
+    return obj
+
+
+def _empty():
+    return Object()
+
+
+# Body decoders only pull the payload off the wire, they return a loader
+# that is run by `request.body` on first access.
+
+
+async def _decode_multipart(request: Request):
+    # multipart parts can only be consumed from the stream once
+    data = await request.post()
+    return lambda: _first_values(data.items())
+
+
+async def _decode_nothing(request: Request):
+    return _empty
+
+
+async def _decode_json(request: Request):
+    if not request.body_exists:
+        return _empty
+    raw = await request.read()
+    charset = request.charset or "utf-8"
+    return lambda: Object(json.loads(raw.decode(charset))) if raw else Object()
+
+
+async def _decode_form(request: Request):
+    if (
+        request.method not in request.POST_METHODS
+        or not request.body_exists
+        or request.content_type not in ("", "application/x-www-form-urlencoded")
+    ):
+        return _empty
+    raw = await request.read()
+    charset = request.charset or "utf-8"
+    return lambda: _first_values(
+        parse.parse_qsl(raw.rstrip().decode(charset), True, encoding=charset)
+    )
+
+
+_BODY_DECODERS = {
+    "multipart/form-data": _decode_multipart,
+    "application/json": _decode_json,
+}
+
+
+def _view_plans(cls):
+    """Build the dispatch plans for every http method a View implements."""
+    plans = {}
+    for method in hdrs.METH_ALL:
+        func = getattr(cls, method.lower(), None)
+        if func is not None and callable(func):
+            plans[method] = DispatchPlan(func)
+    return plans
 
 
 class RequestHandler(object):
-    def __init__(self, fn):
+    def __init__(self, fn, options: Optional[RouteOptions] = None):
         self.fn = fn
+        self.plan = DispatchPlan(fn)
+        self.route_options = options or DEFAULT_OPTIONS
+        self._chain = self._handle
+
+    def compile(self, middlewares):
+        """wrap the route's own middlewares around the handler"""
+        self._chain = compose(middlewares, self._handle)
 
     async def __call__(self, request: Request):
-        return await _render_result(request, self.fn)
+        return await self._chain(request)
+
+    async def _handle(self, request: Request):
+        options = self.route_options
+        if options.cache is not None:
+            response = await request.app.cache.fetch(
+                request,
+                options.cache,
+                lambda: _render_result(request, self.fn, self.plan),
+            )
+        else:
+            response = await _render_result(request, self.fn, self.plan)
+        return conditional(request, response, options.etag)
 
 
-async def _set_session_route(request: Request):
+async def _set_session_route(request: Request, preload: bool):
     params = dict()
     # match
     rt = request.match_info
     for k, v in rt.items():
         params[k] = v
     request.params = Object(params)
-    session = await get_session(request)
-    # session = await new_session(request)
-    request.session = session
+    # loaded on first use, routes that never touch it skip the store
+    request.session = LazySession(request)
+    storage = request.get(STORAGE_KEY)
+    if preload and storage is not None and not isinstance(storage, CookieStorage):
+        # redis / memcached need a round trip, ctx.session is used without await
+        await request.session.load()
 
 
-def _auto_reg_module(module_dir: str):
-    info(f"Auto-registration {module_dir}")
+def _module_files(module_dir: str):
+    """(manifest key, module name, path) of every module under `module_dir`"""
     base_path = Path(module_dir).resolve()
     if str(base_path.parent) not in sys.path:
         sys.path.insert(0, str(base_path.parent))
+    files = []
     for py_file in base_path.rglob("*.py"):
         if py_file.name == "__init__.py":
             continue
         relative_path = py_file.relative_to(base_path.parent)
         module_name = ".".join(relative_path.with_suffix("").parts)
+        files.append((relative_path.as_posix(), module_name, py_file))
+    return files
+
+
+def _exec_module(module_name: str, py_file: Path):
+    spec = importlib.util.spec_from_file_location(module_name, py_file)
+    if spec and spec.loader:
+        module = importlib.util.module_from_spec(spec)
+        module.__package__ = module_name.rpartition(".")[0]
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
 
-        spec = importlib.util.spec_from_file_location(module_name, py_file)
-        if spec and spec.loader:
-            module = importlib.util.module_from_spec(spec)
-            module.__package__ = module_name.rpartition(".")[0]
-            sys.modules[module_name] = module
-            spec.loader.exec_module(module)
 
+def _auto_reg_module(module_dir: str):
+    info(f"Auto-registration {module_dir}")
+    for _, module_name, py_file in _module_files(module_dir):
+        _exec_module(module_name, py_file)
+
+
+class LazyRequest(Request):
+    """
+    The requests of the app: `body` and `qs` are plain `Object`s decoded on
+    first access, a handler that never reads them never parses them.
+    """
+
+    ATTRS = Request.ATTRS | frozenset(["body", "qs", "_body_loader", "_qs_loader"])
+
+    _body_loader = _qs_loader = staticmethod(_empty)
+
+    def _lazy(self, name: str, loader_name: str) -> Object:
+        value = self.__dict__.get(name)
+        if value is None:
+            value = self.__dict__[name] = getattr(self, loader_name)()
+        return value
+
+    @property
+    def body(self) -> Object:
+        return self._lazy("_body", "_body_loader")
+
+    @body.setter
+    def body(self, value):
+        self.__dict__["_body"] = value
 
-async def _render_result(request: Request, func):
+    @property
+    def qs(self) -> Object:
+        return self._lazy("_qs", "_qs_loader")
+
+    @qs.setter
+    def qs(self, value):
+        self.__dict__["_qs"] = value
+
+
+def _set_body(request: Request, body_loader, qs_loader):
+    if isinstance(request, LazyRequest):
+        request._body_loader = body_loader
+        request._qs_loader = qs_loader
+    else:
+        # a request the app didn't make, e.g. a mocked one
+        request.body = body_loader()
+        request.qs = qs_loader()
+
+
+async def _render_result(request: Request, func, plan: Optional[DispatchPlan] = None):
+    if plan is None:
+        plan = DispatchPlan(func)
     content_type = request.content_type
-    # Get the names and default values of function parameters
-    props = inspect.getfullargspec(func)
-    args = list(props.args)
-    if "self" in args:
-        args.remove("self")
-
-    await _set_session_route(request)
-    if len(args) == 2 and content_type == "multipart/form-data":
+
+    options = route_options(request)
+    preload = options.session if options.session is not None else plan.session
+    await _set_session_route(request, preload)
+    upload = options.upload
+    if upload is not None:
+        # streamed by the handler, the body is never buffered
+        request.upload = Upload(request, upload)
+    if plan.multipart and upload is not None:
+        result = await func(request, request.upload)
+    elif plan.multipart and content_type == "multipart/form-data":
         multipart = await request.multipart()
         field = await multipart.next()
         result = await func(request, field)
-    elif len(args) == 1:
-        if content_type == "multipart/form-data":
-            data = await request.post()
-        elif content_type == "application/json":
-            data = await request.json()
+    elif plan.arity == 1:
+        if upload is not None and content_type == "multipart/form-data":
+            decoder = _decode_nothing
         else:
-            data = await request.post()
+            decoder = plan.decoders.get(content_type, _decode_form)
         query_string = request.query_string
-        body = {}
-        for k in data:
-            body[k] = data[k]
-        qs = {}
-        if query_string:
-            for k, v in parse.parse_qs(query_string, True).items():
-                qs[k] = v[0]
-        request.qs = Object(qs)
-        request.body = Object(body)
-        result = await func(request)
+        _set_body(
+            request,
+            await decoder(request),
+            lambda: _first_values(parse.parse_qsl(query_string, True)),
+        )
+        if options.executor is not None:
+            result = await _executors(request).run(
+                options.executor, func, offload_context(request)
+            )
+        else:
+            result = await func(request)
+    elif options.executor is not None:
+        result = await _executors(request).run(options.executor, func)
     else:
         result = await func()
+    if isinstance(result, TemplateResponse):
+        # rendered here so the cache / etag / compress steps see the body
+        await result.render()
+        return result
     try:
         if isinstance(result, Response):
             return result
@@ -119,6 +314,9 @@ async def _render_result(request: Request, func):
             return result
         if isinstance(result, WebSocketResponse):  # maybe catch error
             return result
+        # on the type, Object answers every attribute with None
+        if hasattr(type(result), "__aiter__"):
+            return render_stream(result)
         if "content_type" in result and "text/html" in result["content_type"]:
             return result
     except:
@@ -127,40 +325,137 @@ async def _render_result(request: Request, func):
     return render_json(result)
 
 
-def _sa_ignore_hash(method, path):
-    md5 = hashlib.md5()
-    hash_str = f"{method}{path}"
-    md5.update(hash_str.encode("utf-8"))
-    return md5.hexdigest()
+def _executors(request: Request) -> Executors:
+    """the pools of the request's app, the app singleton's for a foreign one"""
+    executors = getattr(request.app, "executors", None)
+    return executors if isinstance(executors, Executors) else app.executors
 
 
 def _parse_int(num):
     return eval(num) if isinstance(num, str) else num
 
 
-def _sa_ignore_middleware():
+def _sa_ignore_middleware(metrics: Optional[Metrics] = None, log_sample=1.0):
+    """
+    :params metrics record latency histograms and in-flight gauges per route
+    :params log_sample ratio of requests written to the log, 0 disables it
+    """
+    log_sample = float(log_sample)
+
     async def set_ignore(ctx, handler):
-        hash_str = _sa_ignore_hash(ctx.method, ctx.path)
-        ctx.is_sa_ignore = hash_str in ctx.app.ignore_paths
-        start_time = time.time()
-        response = await handler(ctx)
-        end_time = time.time()
-        elapsed_ms = (end_time - start_time) * 1000
-        info(f"{ctx.method} {response.status} {ctx.path} {elapsed_ms:.2f}ms")
-        return response
+        ctx.is_sa_ignore = route_options(ctx).sa_ignore
+        start_time = time.perf_counter()
+        status = 500
+        if metrics is not None:
+            route = route_name(ctx)
+            metrics.start(ctx.method, route)
+        try:
+            response = await handler(ctx)
+            status = response.status
+            return response
+        except web.HTTPException as e:
+            status = e.status
+            raise
+        finally:
+            elapsed = time.perf_counter() - start_time
+            if metrics is not None:
+                metrics.finish(ctx.method, route, status, elapsed)
+            if log_sample >= 1 or (log_sample > 0 and random.random() < log_sample):
+                info(f"{ctx.method} {status} {ctx.path} {elapsed * 1000:.2f}ms")
 
     return set_ignore
 
 
+def _rate_limit_middleware(limiter: RateLimiter, default: Optional[RateLimit] = None):
+    """
+    429 Too Many Requests with Retry-After once a client is over the limit of
+    its route, or over `default` on routes without one.
+    """
+
+    async def rate_limit(ctx, handler):
+        limit = route_options(ctx).rate_limit
+        if limit is None:
+            limit, scope = default, "*"
+        else:
+            scope = f"{ctx.method}:{route_name(ctx)}"
+        if limit:
+            allowed, wait = await limiter.check(ctx, limit, scope)
+            if not allowed:
+                response = render_error("Too Many Requests", status=429)
+                response.headers[hdrs.RETRY_AFTER] = retry_after(wait)
+                return response
+        return await handler(ctx)
+
+    return rate_limit
+
+
+def _concurrency_middleware(
+    default: Optional[ConcurrencyLimit] = None, metrics: Optional[Metrics] = None
+):
+    """
+    In-flight limits of the route and of the whole server, a request that gets
+    no slot in time is shed with a fast 503 and Retry-After.
+    """
+
+    async def limit_concurrency(ctx, handler):
+        route_limit = route_options(ctx).concurrency
+        if route_limit is False:
+            return await handler(ctx)
+        # the route's slot first, a request waiting on it holds no server slot
+        limits = [limit for limit in (route_limit, default) if limit]
+        acquired = []
+        try:
+            for limit in limits:
+                if not await limit.acquire():
+                    if metrics is not None:
+                        metrics.shed_request(ctx.method, route_name(ctx))
+                    response = render_error("Service Unavailable", status=503)
+                    response.headers[hdrs.RETRY_AFTER] = str(limit.retry_after)
+                    return response
+                acquired.append(limit)
+            return await handler(ctx)
+        finally:
+            for limit in acquired:
+                limit.release()
+
+    return limit_concurrency
+
+
 class Application(object):
     def __init__(self):
         self._loop = None
         self.env = None
+        self.templates = None
+        self.jwt_cache: Optional[jwt.TokenCache] = None
         self.app: Optional[web.Application] = None
         self._route_table = web.RouteTableDef()
         self._middleware = []
+        # tag -> middlewares of `@middleware(tag=...)`, used by routes only
+        self._route_middleware = {}
         self.config = {}
         self.clean_up = False
+        self.metrics: Optional[Metrics] = None
+        self.rate_limiter: Optional[RateLimiter] = None
+        self._limit_redis = None
+        # background jobs, `@app.jobs.task` works before create()
+        self.jobs = JobQueue()
+        self._jobs_redis = None
+        # periodic tasks of `@app.schedule`
+        self.scheduler = Scheduler()
+        # websocket connections and rooms
+        self.hub = Hub()
+        self._hub_redis = None
+        # server-sent event channels, `app.events(name)`
+        self.events = EventChannels()
+        self._events_redis = None
+        # pools of the `executor=` routes
+        self.executors = Executors()
+        # routes registered by the module being recorded for the manifest,
+        # handlers of the lazy module being loaded
+        self._recording: Optional[list] = None
+        self._capture: Optional[list] = None
+        # seconds spent in each startup phase, logged by run()
+        self.timings: Dict[str, float] = {}
 
     def _load_life_cycle(self, entry_model=None, func_name=None):
         try:
@@ -193,9 +488,26 @@ class Application(object):
         except:
             pass
 
-    def create(self, env: str, entry_model: str, config=None):
+    @contextmanager
+    def _timed(self, phase: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[phase] = self.timings.get(phase, 0) + (
+                time.perf_counter() - start
+            )
+
+    def create(self, env: str, entry_model: str, config=None, workers: int = 1):
+        """
+        :params workers processes serving the app, `-w`, they share the cpus
+            of the per process pools
+        """
         # self.init_parse()
+        created = time.perf_counter()
+        self.timings = {}
         self.env = env
+        self.workers = max(1, int(workers or 1))
         loop = asyncio.get_event_loop()
         if loop is None:
             loop = asyncio.new_event_loop()
@@ -207,30 +519,81 @@ class Application(object):
         # try to load func and override configuration
         self._load_life_cycle(entry_model, func_name="on_create")
 
-        sa_ignore_mid = _sa_ignore_middleware()
+        # metrics, server.metrics: true or {path: /metrics}
+        conf_metrics = (self.config.get("server") or {}).get("metrics")
+        self.metrics = None
+        if conf_metrics:
+            options = conf_metrics if isinstance(conf_metrics, dict) else {}
+            self.metrics = Metrics(
+                **{k: options[k] for k in ("allow", "token") if k in options}
+            )
+            if not options.get("allow") and not options.get("token"):
+                warning(
+                    "server.metrics: no `token` or `allow` set, /metrics answers "
+                    "404 to every client."
+                )
+        log_sample = (self.config.get("server") or {}).get("log_sample", 1.0)
+        sa_ignore_mid = _sa_ignore_middleware(self.metrics, log_sample)
         sa_ignore_mid.__middleware_version__ = 1
         self._middleware.append(sa_ignore_mid)
 
+        # rate limit, the `rate_limit` config is the default of every route
+        # `rate_limit: 100/s` or a dict with the redis / max_keys options too
+        conf_limit = self.config.get("rate_limit") or None
+        max_keys = 100000
+        self._limit_redis = None
+        if isinstance(conf_limit, dict):
+            conf_limit = dict(conf_limit)
+            self._limit_redis = conf_limit.pop("redis", None)
+            max_keys = conf_limit.pop("max_keys", max_keys)
+        self.rate_limiter = RateLimiter(max_keys=_parse_int(max_keys))
+        rate_limit_mid = _rate_limit_middleware(
+            self.rate_limiter, RateLimit.parse(conf_limit or None)
+        )
+        rate_limit_mid.__middleware_version__ = 1
+        self._middleware.append(rate_limit_mid)
+
+        # load shedding, server.concurrency: 200 or the ConcurrencyLimit options
+        conf_concurrency = (self.config.get("server") or {}).get("concurrency")
+        concurrency_mid = _concurrency_middleware(
+            ConcurrencyLimit.parse(conf_concurrency), self.metrics
+        )
+        concurrency_mid.__middleware_version__ = 1
+        self._middleware.append(concurrency_mid)
+
+        # compression, server.compress: true or the compress_middleware options
+        conf_compress = (self.config.get("server") or {}).get("compress")
+        if conf_compress:
+            options = conf_compress if isinstance(conf_compress, dict) else {}
+            compress_mid = compress_middleware(**options)
+            compress_mid.__middleware_version__ = 1
+            self._middleware.append(compress_mid)
+
         # middlewares
-        _auto_reg_module("middlewares")
+        with self._timed("middlewares"):
+            _auto_reg_module("middlewares")
 
         conf_server = self.config.get("server", {})
         client_max_size = 1024**2 * 2
+        json_backend = None
         if conf_server is not None:
             client_max_size = conf_server.get("client_max_size", client_max_size)
+            json_backend = conf_server.get("json")
+        info(f"json backend: {encoder.use_backend(json_backend)}")
         self.app = web.Application(
             logger=None,
             loop=loop,
             middlewares=self._middleware,
             client_max_size=_parse_int(client_max_size),
         )
+        # requests decoding body / qs on first access
+        self.app._make_request = partial(self.app._make_request, _cls=LazyRequest)
 
         # load life
         entry = conf_server.get("entry", entry_model)
         self._load_life_cycle(entry)
 
         # database
-        self.app.ignore_paths = set()
         self.app.db = Object()
         self.app.on_startup.append(self._init_database)
         self.app.on_cleanup.append(self._close_database)
@@ -238,29 +601,195 @@ class Application(object):
         self.app.env = env
         self.app.jwt_encode = self.jwt_encode
         self.app.jwt_decode = self.jwt_decode
+        # verified tokens, `jwt.cache: false` checks every one again
+        conf_jwt = self.config.get("jwt") or {}
+        conf_jwt_cache = conf_jwt.get("cache", {})
+        self.jwt_cache = None
+        if conf_jwt.get("key") and conf_jwt_cache is not False:
+            # `cache: true` or `cache:` alone keep the defaults
+            opts = conf_jwt_cache if isinstance(conf_jwt_cache, dict) else {}
+            self.jwt_cache = jwt.TokenCache(conf_jwt["key"], **opts)
         # session
         self.app.on_startup.append(self._init_session)
-        # router:
-        _auto_reg_module("controllers")
+        # response cache
+        conf_cache = self.config.get("cache") or {}
+        self.app.cache = ResponseCache(
+            max_entries=_parse_int(conf_cache.get("max_entries", 1024))
+        )
+        self.app.on_startup.append(self._init_cache)
+        self.app.rate_limiter = self.rate_limiter
+        self.app.on_startup.append(self._init_rate_limit)
+        # background jobs, drained before the pools are closed
+        conf_jobs = dict(self.config.get("jobs") or {})
+        self._jobs_redis = conf_jobs.pop("redis", None)
+        self.jobs.configure(**conf_jobs)
+        self.app.jobs = self.jobs
+        self.app.on_startup.append(self._init_jobs)
+        self.app.on_cleanup.insert(0, self._close_jobs)
+        # scheduled tasks stop before the jobs they may enqueue
+        self.app.on_startup.append(self._init_schedule)
+        self.app.on_cleanup.insert(0, self._close_schedule)
+        # websockets are closed on shutdown, they never finish on their own
+        conf_ws = dict(self.config.get("websocket") or {})
+        self._hub_redis = conf_ws.pop("redis", None)
+        self.hub.configure(**conf_ws)
+        self.app.hub = self.hub
+        self.app.on_startup.append(self._init_hub)
+        self.app.on_shutdown.append(self._close_hub)
+        conf_sse = dict(self.config.get("sse") or {})
+        self._events_redis = conf_sse.pop("redis", None)
+        self.events.configure(**conf_sse)
+        self.app.events = self.events
+        self.app.on_startup.append(self._init_events)
+        self.app.on_shutdown.append(self._close_events)
+        self.executors.configure(
+            workers=self.workers, **(self.config.get("executor") or {})
+        )
+        self.app.executors = self.executors
+        self.app.on_cleanup.append(self._close_executors)
+        self.app.on_startup.append(self._compile_routes)
+        # router, server.lazy_routes imports the modules on their first request
+        with self._timed("controllers"):
+            lazy_routes = (conf_server or {}).get("lazy_routes")
+            if lazy_routes:
+                manifest = (conf_server or {}).get("manifest") or MANIFEST_PATH
+                self._reg_controllers("controllers", manifest)
+            else:
+                _auto_reg_module("controllers")
 
         self.app.add_routes(self._route_table)
 
+        if self.metrics is not None:
+            metrics_path = "/metrics"
+            if isinstance(conf_metrics, dict):
+                metrics_path = conf_metrics.get("path", metrics_path)
+            self.app.metrics = self.metrics
+            self.app.router.add_get(
+                metrics_path,
+                RequestHandler(
+                    self.metrics.handler,
+                    RouteOptions(sa_ignore=True, rate_limit=False, concurrency=False),
+                ),
+            )
+
         # static
         if conf_server is not None:
             conf_st = conf_server.get("static", {})
             if conf_st:
-                self.app.router.add_static(**conf_st, path=Path("static"))
-                info("Suggest using nginx or others instead.")
+                self._add_static(dict(conf_st))
         templates_dir = Path("templates")
         if templates_dir.exists():
-            from jinja2 import Environment, FileSystemLoader
-
-            self.env = Environment(
-                loader=FileSystemLoader(templates_dir), autoescape=True
+            self.templates = Templates(
+                templates_dir, **(self.config.get("templates") or {})
             )
+            self.env = self.templates.env
+            self.app.on_startup.append(self._init_templates)
 
+        self.timings["setup"] = (
+            time.perf_counter() - created - sum(self.timings.values())
+        )
         return self
 
+    def _add_static(self, conf_st: dict):
+        """
+        StaticFiles serves the prefix, options only aiohttp's add_static
+        knows (show_index, append_version, chunk_size...) fall back to it
+        """
+        prefix = conf_st.pop("prefix").rstrip("/")
+        name = conf_st.pop("name", None)
+        static_keys = set(inspect.signature(StaticFiles).parameters) - {"directory"}
+        aiohttp_keys = set(inspect.signature(self.app.router.add_static).parameters)
+        aiohttp_keys -= {"prefix", "path", "name"}
+        unknown = set(conf_st) - static_keys - aiohttp_keys
+        if unknown:
+            warning(f"server.static: unknown options {sorted(unknown)} ignored.")
+        if any(conf_st.get(k) for k in aiohttp_keys - static_keys):
+            dropped = sorted(set(conf_st) - aiohttp_keys - unknown)
+            if dropped:
+                warning(
+                    f"server.static: {dropped} are not supported by add_static, ignored."
+                )
+            options = {k: v for k, v in conf_st.items() if k in aiohttp_keys}
+            # .gz / .br siblings are served when the client accepts them
+            self.app.router.add_static(prefix, Path("static"), name=name, **options)
+            return
+        options = {k: v for k, v in conf_st.items() if k in static_keys}
+        self.app.router.add_get(
+            prefix + "/{filename:.*}", StaticFiles(Path("static"), **options), name=name
+        )
+
+    def _registrations(self):
+        """what a module may register at import besides routes"""
+        return (
+            len(self._middleware),
+            sum(len(v) for v in self._route_middleware.values()),
+            len(self.scheduler.tasks),
+            len(self.jobs._jobs),
+            len(self.app.on_startup),
+            len(self.app.on_shutdown),
+            len(self.app.on_cleanup),
+            len(self.app.cleanup_ctx),
+        )
+
+    def _reg_controllers(self, module_dir: str, manifest_path):
+        """
+        Register stubs of the routes listed in the manifest, or import every
+        module and write the manifest when a file changed.
+        """
+        files = _module_files(module_dir)
+        manifest = Manifest(manifest_path)
+        entries = manifest.match(files)
+        if entries is None:
+            info(f"Auto-registration {module_dir}, writing {manifest_path}")
+            for key, module_name, py_file in files:
+                before = self._registrations()
+                self._recording = []
+                try:
+                    _exec_module(module_name, py_file)
+                finally:
+                    routes, self._recording = self._recording, None
+                eager = not routes or self._registrations() != before
+                manifest.put(key, module_name, py_file, routes, eager)
+            manifest.prune(files)
+            manifest.save()
+            return
+        imported = lazy = 0
+        for (key, module_name, py_file), entry in zip(files, entries):
+            if entry["eager"]:
+                _exec_module(module_name, py_file)
+                imported += 1
+                continue
+            module = LazyModule(self, module_name, py_file, entry["routes"])
+            for index, (method, path, name, kind) in enumerate(entry["routes"]):
+                stub = LazyHandler(module, index)
+                if kind == "view":
+                    self._route_table.route(method, path)(stub)
+                else:
+                    self.router.add_route(method, path, stub, name=name)
+            lazy += 1
+        manifest.save()
+        info(f"Auto-registration {module_dir}: {imported} imported, {lazy} lazy.")
+
+    def _load_lazy_module(self, module_name: str, py_file: Path) -> list:
+        """import a lazy module, its handlers in the order they were declared"""
+        start = time.perf_counter()
+        self._capture = []
+        try:
+            _exec_module(module_name, py_file)
+        except BaseException:
+            # a half-run module isn't left behind for other imports
+            sys.modules.pop(module_name, None)
+            raise
+        finally:
+            handlers, self._capture = self._capture, None
+        for handler in handlers:
+            self._compile_handler(handler)
+        info(
+            f"lazy routes: {module_name} imported in "
+            f"{(time.perf_counter() - start) * 1000:.1f}ms."
+        )
+        return handlers
+
     async def release(self):
         try:
             await self._close_database(self.app)
@@ -353,7 +882,7 @@ class Application(object):
             # fernet_key = fernet.Fernet.generate_key()
             # secret_key = base64.urlsafe_b64decode(fernet_key)
 
-            storage = cookie_storage.EncryptedCookieStorage(
+            storage = CookieStorage(
                 secret_key,
                 cookie_name=cookie_name,
                 max_age=_parse_int(max_age),
@@ -362,51 +891,279 @@ class Application(object):
             setup(apps, storage)
             info("starting local cookie.")
 
+    def _shared_redis(self, apps, redis_conf, usage: str):
+        """`true` is the session redis, a str is a key of `database`"""
+        if not redis_conf:
+            return None
+        if redis_conf is True:
+            redis = getattr(apps, "redis", None)
+        else:
+            redis = apps.db.get(redis_conf)
+        if redis is None:
+            info(f"{usage}: redis `{redis_conf}` not found, local only.")
+            return None
+        info(f"{usage} with redis.")
+        return redis
+
+    async def _init_cache(self, apps):
+        """
+        cache.redis: true shares the session redis, or a key of `database`
+        """
+        conf_cache = self.config.get("cache") or {}
+        redis = self._shared_redis(apps, conf_cache.get("redis"), "response cache")
+        if redis is not None:
+            apps.cache.redis = redis
+
+    async def _init_rate_limit(self, apps):
+        """
+        rate_limit.redis: true shares the session redis, or a key of `database`
+        """
+        redis = self._shared_redis(apps, self._limit_redis, "rate limit")
+        if redis is not None:
+            apps.rate_limiter.redis = redis
+
+    async def _init_jobs(self, apps):
+        """
+        jobs.redis: true shares the session redis, or a key of `database`
+        """
+        self.jobs.redis = self._shared_redis(apps, self._jobs_redis, "jobs")
+        await self.jobs.start()
+
+    async def _close_jobs(self, apps):
+        await self.jobs.close()
+
+    def schedule(
+        self,
+        cron: Optional[str] = None,
+        every: Optional[float] = None,
+        name: Optional[str] = None,
+        overlap: bool = False,
+    ):
+        """
+        Run a coroutine function periodically, it gets the aiohttp app when
+        it takes an argument.
+        :params cron e.g. "*/5 * * * *" or "@hourly", local time
+        :params every seconds between runs, instead of cron
+        :params name key of the task in redis, module.function by default
+        :params overlap start a run while the previous one is still going
+        """
+
+        def inner(func):
+            self.scheduler.add(func, cron=cron, every=every, name=name, overlap=overlap)
+            return func
+
+        return inner
+
+    async def _init_schedule(self, apps):
+        """
+        schedule.redis: true shares the session redis, or a key of `database`,
+        to run each task on one worker only. schedule.enabled: false turns
+        the tasks off, e.g. in `cloudoll worker` environments.
+        """
+        conf_schedule = self.config.get("schedule") or {}
+        if conf_schedule.get("enabled") is False:
+            return
+        redis_conf = conf_schedule.get("redis")
+        self.scheduler.redis = self._shared_redis(apps, redis_conf, "schedule")
+        self.scheduler.lock_ttl = float(conf_schedule.get("lock_ttl") or 60)
+        self.scheduler.start(apps)
+
+    async def _close_schedule(self, apps):
+        await self.scheduler.close()
+
+    async def _init_hub(self, apps):
+        """
+        websocket.redis: true shares the session redis, or a key of `database`,
+        to broadcast to the sockets of every worker
+        """
+        self.hub.redis = self._shared_redis(apps, self._hub_redis, "websocket hub")
+        await self.hub.start()
+
+    async def _init_templates(self, apps):
+        await self.templates.startup()
+
+    async def _close_hub(self, apps):
+        await self.hub.close()
+
+    async def _init_events(self, apps):
+        """
+        sse.redis: true shares the session redis, or a key of `database`,
+        to publish to the subscribers of every worker
+        """
+        self.events.redis = self._shared_redis(apps, self._events_redis, "sse")
+        await self.events.start()
+
+    async def _close_events(self, apps):
+        await self.events.close()
+
+    async def _close_executors(self, apps):
+        await self.executors.close()
+
+    def run_worker(self, consumer: Optional[str] = None):
+        """
+        Run the durable jobs of `jobs.redis` without serving http,
+        until SIGTERM / SIGINT.
+        :params consumer stable name of this worker, its unfinished jobs are
+            queued again when a worker of the same name starts
+        """
+        if self.app is None:
+            raise ValueError("Please create app first.like app.create()")
+        if not self._jobs_redis:
+            raise ValueError("Please set jobs.redis to run a worker.")
+        self.jobs.consume = True
+        self.jobs.consumer = consumer
+
+        async def main():
+            stop = asyncio.Event()
+            loop = asyncio.get_running_loop()
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                try:
+                    loop.add_signal_handler(sig, stop.set)
+                except NotImplementedError:  # windows
+                    pass
+            runner = web.AppRunner(self.app, handle_signals=False)
+            # on_startup opens the pools and starts consuming
+            await runner.setup()
+            info(f"Worker {os.getpid()} consuming {self.jobs.key}")
+            try:
+                await stop.wait()
+            finally:
+                info(f"Worker {os.getpid()} draining jobs.")
+                await runner.cleanup()
+
+        self._loop.run_until_complete(main())
+
     def run(self, **kw):
         """
         run app
         :params prot default  9001
         :params host default 127.0.0.1
+        :params sock a listening socket, used instead of host and port
+        :params shutdown_timeout seconds in-flight requests get to finish on
+            SIGTERM / SIGINT, default 30
         """
+        sock = kw.pop("sock", None)
         defaults = {"host": "0.0.0.0", "port": 9001, "path": None}
         conf = self.config.get("server", {})
         conf = chainMap(defaults, conf, kw)
         if self.app is None:
             raise ValueError("Please create app first.like app.create()")
+        shutdown_timeout = float(conf.get("shutdown_timeout") or 30)
 
         async def log(_):
             # make sure this tip is printed after the server starts
-            info(f"Server running on http://{conf.host}:{conf.port}")
+            self._log_timings()
+            if sock is not None:
+                info(f"Worker {os.getpid()} serving on {sock.getsockname()}")
+            else:
+                info(f"Server running on http://{conf.host}:{conf.port}")
+
+        async def draining(_):
+            # the listening sockets are closed by now, open requests may
+            # finish before on_cleanup releases the pools
+            info(
+                f"Shutting down {os.getpid()}, waiting up to {shutdown_timeout}s "
+                "for in-flight requests."
+            )
 
+        self._time_startup()
         self.app.on_startup.append(log)
-        web.run_app(
-            self.app,
+        self.app.on_shutdown.insert(0, draining)
+        options = dict(
             loop=self._loop,
-            host=conf["host"],
-            port=conf["port"],
-            path=conf["path"],
+            shutdown_timeout=shutdown_timeout,
             access_log=None,
             print=None,
         )
+        if sock is not None:
+            web.run_app(self.app, sock=sock, **options)
+            return
+        web.run_app(
+            self.app, host=conf["host"], port=conf["port"], path=conf["path"], **options
+        )
+
+    def _time_startup(self):
+        """time each startup hook, they are part of the boot too"""
+
+        def timed(hook):
+            name = getattr(hook, "__name__", type(hook).__name__)
+            if name == "_on_startup":
+                # aiohttp runs the cleanup_ctx generators from this hook
+                name = "cleanup_ctx"
+
+            async def inner(apps):
+                with self._timed(f"startup {name}"):
+                    await hook(apps)
+
+            return inner
+
+        self.app.on_startup[:] = [timed(hook) for hook in self.app.on_startup]
+
+    def _log_timings(self):
+        total = sum(self.timings.values())
+        width = max(map(len, self.timings), default=0)
+        lines = [f"Startup took {total * 1000:.1f}ms"]
+        for phase, seconds in self.timings.items():
+            lines.append(f"  {phase:<{width}}  {seconds * 1000:8.1f}ms")
+        info("\n".join(lines))
+
+    def add_router(self, path, method, name, sa_ignore, **options):
+        options = RouteOptions(sa_ignore=sa_ignore, **options)
 
-    def add_router(self, path, method, name, sa_ignore):
         def inner(handler):
-            handler = RequestHandler(handler)
+            handler = RequestHandler(handler, options)
+            if self._capture is not None:
+                self._capture.append(handler)
+                return handler
+            if self._recording is not None:
+                self._recording.append([method, path, name, "route"])
             if self.router is not None:
                 self.router.add_route(method, path, handler, name=name)
             return handler
 
-        if sa_ignore:
-            if self.app is not None:
-                hash_str = _sa_ignore_hash(method, path)
-                self.app.ignore_paths.add(hash_str)
         return inner
 
-    def add_middleware(self, func):
+    def add_view(self, path, cls):
+        if self._capture is not None:
+            self._capture.append(cls)
+            return cls
+        if self._recording is not None:
+            self._recording.append([hdrs.METH_ANY, path, None, "view"])
+        return self._route_table.view(path)(cls)
+
+    def add_middleware(self, func, tag: Optional[str] = None):
         func.__middleware_version__ = 1
-        self._middleware.append(func)
+        if tag:
+            self._route_middleware.setdefault(tag, []).append(func)
+        else:
+            self._middleware.append(func)
         return func
 
+    def _resolve_middleware(self, middlewares):
+        chain = []
+        for mw in middlewares:
+            if isinstance(mw, str):
+                if mw not in self._route_middleware:
+                    raise ValueError(f"No middleware tagged {mw!r}.")
+                chain.extend(self._route_middleware[mw])
+            else:
+                chain.append(mw)
+        return chain
+
+    async def _compile_routes(self, apps):
+        """compose each route's middleware chain once, before serving"""
+        for route in apps.router.routes():
+            # aiohttp wraps callable objects like RequestHandler in a function
+            handler = getattr(route.handler, "__wrapped__", route.handler)
+            if not isinstance(handler, LazyHandler):
+                # lazy modules are compiled when they are imported
+                self._compile_handler(handler)
+
+    def _compile_handler(self, handler):
+        options = getattr(handler, "route_options", None)
+        if options is not None and options.middlewares:
+            handler.compile(self._resolve_middleware(options.middlewares))
+
     def jwt_encode(self, payload):
         jwt_conf = self.config.get("jwt", {})
         key = jwt_conf.get("key")
@@ -416,6 +1173,8 @@ class Application(object):
         return jwt.encode(payload, key, exp)
 
     def jwt_decode(self, token):
+        if self.jwt_cache is not None:
+            return self.jwt_cache.decode(token)
         jwt_conf = self.config.get("jwt", {})
         key = jwt_conf.get("key")
         return jwt.decode(token, key)
@@ -462,7 +1221,20 @@ class Application(object):
 
 
 class View(web.View):
+    route_options: RouteOptions = DEFAULT_OPTIONS
+
+    @classmethod
+    def compile(cls, middlewares):
+        """wrap the route's own middlewares around the view"""
+        cls._chain = compose(middlewares, lambda request: cls(request)._handle())
+
     async def _iter(self) -> StreamResponse:
+        chain = self.__class__.__dict__.get("_chain")
+        if chain is not None:
+            return await chain(self.request)
+        return await self._handle()
+
+    async def _handle(self) -> StreamResponse:
         request = self.request
         if request.method not in hdrs.METH_ALL:
             self._raise_allowed_methods()
@@ -470,32 +1242,26 @@ class View(web.View):
         func = getattr(self, request.method.lower(), None)
         if func is None:
             self._raise_allowed_methods()
-        return await _render_result(request, func)
+        plans = self.__class__.__dict__.get("_dispatch_plans")
+        if plans is None:
+            plans = _view_plans(self.__class__)
+            self.__class__._dispatch_plans = plans
+        plan = plans.get(request.method)
+        options = self.route_options
+        if options.cache is not None:
+            response = await request.app.cache.fetch(
+                request,
+                options.cache,
+                lambda: _render_result(request, func, plan),
+            )
+        else:
+            response = await _render_result(request, func, plan)
+        return conditional(request, response, options.etag)
 
 
 app = Application()
 
 
-class JsonEncoder(json.JSONEncoder):
-    def default(self, o):
-        if isinstance(o, datetime) or isinstance(o, date):
-            return o.__str__()
-        elif isinstance(o, Decimal):
-            return str(o)
-        elif isinstance(o, set):
-            return list(o)
-        elif isinstance(o, Model):
-            return o.to_dict()
-        elif isinstance(o, SimpleNamespace):
-            return o.__dict__
-        elif isinstance(o, bytes):
-            return o.decode("utf-8")
-        elif isinstance(o, uuid.UUID) or isinstance(o, Exception):
-            return str(o)
-        else:
-            return super(JsonEncoder, self).default(o)
-
-
 async def WebSocket(
     request: Request,
     timeout: float = 10.0,
@@ -532,28 +1298,98 @@ async def WebStream(
     return stream
 
 
-def get(path: str, name=None, sa_ignore=False):
-    return app.add_router(path, "GET", name, sa_ignore)
+async def _aiter(rows):
+    if hasattr(rows, "__aiter__"):
+        async for row in rows:
+            yield row
+    else:
+        for row in rows:
+            yield row
+
+
+class JsonStreamResponse(StreamResponse):
+    """
+    Sends rows as the `render_json` envelope with chunked transfer, encoding
+    `chunk_size` rows at a time so memory doesn't grow with the result size.
+    """
+
+    def __init__(
+        self,
+        rows,
+        chunk_size: int = 500,
+        message: str = "OK",
+        code: int = 200,
+        status: int = 200,
+        reason: Optional[str] = None,
+        headers: Optional[LooseHeaders] = None,
+    ):
+        super().__init__(status=status, reason=reason, headers=headers)
+        self.content_type = "application/json"
+        self.charset = "utf-8"
+        self._rows = rows
+        self._chunk_size = max(1, chunk_size)
+        self._message = message
+        self._code = code
+
+    async def prepare(self, request: Request):
+        writer = await super().prepare(request)
+        if self._rows is not None:
+            rows, self._rows = self._rows, None
+            await self._write_rows(rows)
+        return writer
+
+    async def _write_rows(self, rows):
+        await self.write(b'{"data":[')
+        batch = []
+        sep = b""
+        try:
+            async for row in _aiter(rows):
+                batch.append(row)
+                if len(batch) >= self._chunk_size:
+                    await self.write(sep + encoder.dumps(batch)[1:-1])
+                    batch, sep = [], b","
+            if batch:
+                await self.write(sep + encoder.dumps(batch)[1:-1])
+        finally:
+            if hasattr(rows, "aclose"):
+                await rows.aclose()
+        tail = {
+            "message": self._message,
+            "code": self._code,
+            "timestamp": int(datetime.now().timestamp() * 1000),
+        }
+        await self.write(b"]," + encoder.dumps(tail)[1:])
+
+
+def get(path: str, name=None, sa_ignore=False, **options):
+    """
+    :params options route options, see `RouteOptions`:
+        cache, etag, middlewares, rate_limit, concurrency
+    """
+    return app.add_router(path, "GET", name, sa_ignore, **options)
+
 
+def post(path: str, name=None, sa_ignore=False, **options):
+    return app.add_router(path, "POST", name, sa_ignore, **options)
 
-def post(path: str, name=None, sa_ignore=False):
-    return app.add_router(path, "POST", name, sa_ignore)
 
+def put(path: str, name=None, sa_ignore=False, **options):
+    return app.add_router(path, "PUT", name, sa_ignore, **options)
 
-def put(path: str, name=None, sa_ignore=False):
-    return app.add_router(path, "PUT", name, sa_ignore)
 
+def delete(path: str, name=None, sa_ignore=False, **options):
+    return app.add_router(path, "DELETE", name, sa_ignore, **options)
 
-def delete(path: str, name=None, sa_ignore=False):
-    return app.add_router(path, "DELETE", name, sa_ignore)
 
+def routes(path: str, sa_ignore=False, **options):
+    options = RouteOptions(sa_ignore=sa_ignore, **options)
 
-def routes(path: str, sa_ignore=False):
-    if sa_ignore:
-        for method in hdrs.METH_ALL:
-            hash_str = _sa_ignore_hash(method, path)
-            app.app.ignore_paths.add(hash_str)
-    return app.route_table.view(path)
+    def inner(cls):
+        cls._dispatch_plans = _view_plans(cls)
+        cls.route_options = options
+        return app.add_view(path, cls)
+
+    return inner
 
 
 def render_error(msg, status=500) -> Response:
@@ -561,22 +1397,50 @@ def render_error(msg, status=500) -> Response:
 
 
 def render_json(data, **kw) -> Response:
+    """
+    :params etag a version key of the data, e.g. its update time, used as ETag
+    """
     res = {}
     if isinstance(data, dict):
         res.update(data)
     else:
         res["data"] = data
-    res.setdefault("message", kw.get("message", "OK"))
-    res.setdefault("code", kw.get("code", 200))
-
-    res["timestamp"] = int(datetime.now().timestamp() * 1000)
-    return web.json_response(
-        res, **kw, dumps=lambda x: json.dumps(x, ensure_ascii=False, cls=JsonEncoder)
-    )
-
-
-def middleware(func):
-    return app.add_middleware(func)
+    res.setdefault("message", kw.pop("message", "OK"))
+    res.setdefault("code", kw.pop("code", 200))
+    res.pop("timestamp", None)
+    etag = kw.pop("etag", None)
+
+    # the timestamp is appended last so the body before it stays hashable
+    body = encoder.dumps(res)
+    etag_length = len(body) - 1
+    timestamp = int(datetime.now().timestamp() * 1000)
+    body = b'%s,"timestamp":%d}' % (body[:-1], timestamp)
+    kw.setdefault("content_type", "application/json")
+    response = Response(body=body, charset="utf-8", **kw)
+    response.etag_length = etag_length
+    if etag is not None:
+        response.etag = make_etag(etag)
+    return response
+
+
+def render_stream(rows, chunk_size: int = 500, **kw) -> JsonStreamResponse:
+    """
+    Stream an (async) iterable of rows, e.g. `Model.stream()`, in the
+    `render_json` envelope. Handlers returning an async iterator get this
+    automatically.
+    """
+    return JsonStreamResponse(rows, chunk_size=chunk_size, **kw)
+
+
+def middleware(func=None, tag: Optional[str] = None):
+    """
+    `@middleware` runs on every request.
+    `@middleware(tag="auth")` only runs on routes that list the tag,
+    e.g. `@get("/user", middlewares=["auth"])`.
+    """
+    if func is None:
+        return lambda f: app.add_middleware(f, tag=tag)
+    return app.add_middleware(func, tag=tag)
 
 
 def render(**kw) -> Response:
@@ -584,12 +1448,12 @@ def render(**kw) -> Response:
 
 
 def render_view(template: str, *args, **kw) -> Response:
-    body = None
-    if app.env is not None:
-        body = app.env.get_template(template).render(*args)
-    view = render(body=body, **kw)
-    view.content_type = "text/html;charset=utf-8"
-    return view
+    """
+    A template response, rendered off the handler: in a thread once the
+    template's output is big, or asynchronously with `templates.enable_async`.
+    """
+    etag = kw.pop("etag", None)
+    return TemplateResponse(app.templates, template, args, etag=etag, **kw)
 
 
 def redirect(urlpath):
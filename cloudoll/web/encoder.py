@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+JSON encoding for `render_json`.
+
+The encoder writes bytes directly with one of these backends:
+
+    orjson   used by default when installed, `pip install cloudoll[json]`
+    msgspec  opt-in, serializes datetime / uuid / Decimal natively (ISO 8601),
+             `pip install cloudoll[msgspec]`
+    json     the standard library, always available
+
+Types json can't handle are converted by hooks, add your own with
+`register_json_type`.
+"""
+
+__author__ = "Qiu / smallerqiu@gmail.com"
+
+import json
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Optional
+
+from cloudoll.logging import warning
+from cloudoll.orm.model import Model
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover
+    msgspec = None
+
+
+_type_hooks: Dict[type, Callable[[Any], Any]] = {}
+# resolved hooks by concrete type, including subclasses of registered types
+_hook_cache: Dict[type, Optional[Callable[[Any], Any]]] = {}
+
+
+def register_json_type(typ: type, hook: Callable[[Any], Any]):
+    """
+    Register how instances of `typ` (and its subclasses) are serialized.
+    `hook` returns a json compatible value.
+
+    eg: register_json_type(Money, lambda m: str(m.amount))
+    """
+    _type_hooks[typ] = hook
+    _hook_cache.clear()
+    return hook
+
+
+def _find_hook(typ: type):
+    try:
+        return _hook_cache[typ]
+    except KeyError:
+        pass
+    hook = None
+    for base in typ.__mro__:
+        if base in _type_hooks:
+            hook = _type_hooks[base]
+            break
+    _hook_cache[typ] = hook
+    return hook
+
+
+def default(o):
+    hook = _find_hook(type(o))
+    if hook is None:
+        raise TypeError(
+            f"Object of type {o.__class__.__name__} is not JSON serializable"
+        )
+    return hook(o)
+
+
+register_json_type(date, str)
+register_json_type(datetime, str)
+register_json_type(Decimal, str)
+register_json_type(set, list)
+register_json_type(Model, lambda o: o.to_dict())
+register_json_type(SimpleNamespace, lambda o: o.__dict__)
+register_json_type(bytes, lambda o: o.decode("utf-8"))
+register_json_type(uuid.UUID, str)
+register_json_type(Exception, str)
+
+
+class JsonEncoder(json.JSONEncoder):
+    def default(self, o):
+        hook = _find_hook(type(o))
+        if hook is None:
+            return super(JsonEncoder, self).default(o)
+        return hook(o)
+
+
+def _stdlib_dumps(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, cls=JsonEncoder).encode("utf-8")
+
+
+def _orjson_dumps(obj) -> bytes:
+    try:
+        return orjson.dumps(obj, default=default, option=_ORJSON_OPTIONS)
+    except TypeError:
+        # e.g. integers over 64 bits, which only the stdlib supports
+        return _stdlib_dumps(obj)
+
+
+if orjson is not None:
+    # datetimes go through the hooks to keep str(datetime) output
+    _ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+_msgspec_encoder = None
+
+
+def _msgspec_dumps(obj) -> bytes:
+    try:
+        return _msgspec_encoder.encode(obj)
+    except (TypeError, OverflowError):
+        return _stdlib_dumps(obj)
+
+
+_BACKENDS = {
+    "json": _stdlib_dumps,
+    "orjson": _orjson_dumps,
+    "msgspec": _msgspec_dumps,
+}
+
+dumps: Callable[[Any], bytes] = _orjson_dumps if orjson else _stdlib_dumps
+
+
+def use_backend(name: Optional[str] = None) -> str:
+    """
+    Choose the backend of `dumps`: auto / orjson / msgspec / json.
+    Falls back to the stdlib when the package isn't installed.
+    """
+    global dumps, _msgspec_encoder
+    name = (name or "auto").lower()
+    if name == "auto":
+        name = "orjson" if orjson is not None else "json"
+    if name not in _BACKENDS:
+        raise ValueError(f"Unknown json backend: {name}")
+    if name == "orjson" and orjson is None:
+        warning("orjson is not installed, using json instead.")
+        name = "json"
+    if name == "msgspec":
+        if msgspec is None:
+            warning("msgspec is not installed, using json instead.")
+            name = "json"
+        elif _msgspec_encoder is None:
+            _msgspec_encoder = msgspec.json.Encoder(enc_hook=default)
+    dumps = _BACKENDS[name]
+    return name
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "Qiu / smallerqiu@gmail.com"
+
+import hashlib
+from typing import Any, Optional, Tuple
+
+from aiohttp import hdrs
+from aiohttp.helpers import ETAG_ANY, ETag
+from aiohttp.web import Response
+from aiohttp.web_request import Request
+
+# headers a 304 has to repeat from the full response
+_NOT_MODIFIED_HEADERS = (
+    hdrs.ETAG,
+    hdrs.CACHE_CONTROL,
+    hdrs.EXPIRES,
+    hdrs.VARY,
+    hdrs.CONTENT_LOCATION,
+    hdrs.LAST_MODIFIED,
+)
+
+
+def make_etag(value: Any) -> str:
+    """
+    Strong etag of a body or of a version key, like a row's update time.
+    """
+    if not isinstance(value, (bytes, bytearray, memoryview)):
+        value = str(value).encode("utf-8")
+    return hashlib.blake2b(value, digest_size=16).hexdigest()
+
+
+def _matches(if_none_match: Optional[Tuple[ETag, ...]], etag: ETag) -> bool:
+    if not if_none_match:
+        return False
+    for tag in if_none_match:
+        # If-None-Match uses the weak comparison
+        if tag.value == ETAG_ANY or tag.value == etag.value:
+            return True
+    return False
+
+
+def not_modified(response: Response) -> Response:
+    headers = {}
+    for name in _NOT_MODIFIED_HEADERS:
+        if name in response.headers:
+            headers[name] = response.headers[name]
+    return Response(status=304, headers=headers)
+
+
+def conditional(request: Request, response, compute: bool = True):
+    """
+    Answer 304 Not Modified when If-None-Match matches the response's ETag.
+    Without an ETag from the handler one is hashed from the body if `compute`.
+    """
+    if not isinstance(response, Response) or response.status != 200:
+        return response
+    etag = response.etag
+    if etag is None:
+        body = response.body
+        if not compute or not isinstance(body, (bytes, bytearray)):
+            return response
+        # render_json leaves its per-request timestamp out of the hash
+        length = getattr(response, "etag_length", None)
+        response.etag = make_etag(memoryview(body)[:length])
+        etag = response.etag
+    if request.method in (hdrs.METH_GET, hdrs.METH_HEAD) and _matches(
+        request.if_none_match, etag
+    ):
+        return not_modified(response)
+    return response
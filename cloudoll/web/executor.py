@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Pools of the application for CPU bound handlers, `executor=` routes:
+
+    @get("/report", executor="process")
+    def report(ctx):
+        return {"rows": build_report(ctx.qs.year)}
+
+The handler gets a picklable copy of the request (method, path, params, qs,
+body, headers, cookies, remote) instead of the request, and its result goes
+through `render_json` as usual. Process routes must be module level
+functions, they are looked up by name in the worker process. Coroutine
+functions run on a loop of their own in the worker.
+"""
+
+__author__ = "Qiu / smallerqiu@gmail.com"
+
+import asyncio
+import importlib
+import inspect
+import multiprocessing
+import os
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+
+from aiohttp.web_request import Request
+
+from cloudoll.logging import info
+from cloudoll.utils.common import Object
+
+EXECUTORS = ("thread", "process")
+
+
+def offload_context(request: Request) -> Object:
+    """what an executor handler gets instead of the request"""
+    return Object(
+        method=request.method,
+        path=request.path,
+        params=Object(request.match_info),
+        qs=Object(request.qs) if hasattr(request, "qs") else Object(),
+        body=Object(request.body) if hasattr(request, "body") else Object(),
+        headers=dict(request.headers),
+        cookies=dict(request.cookies),
+        remote=request.remote,
+    )
+
+
+def _call(func, args):
+    result = func(*args)
+    if inspect.isawaitable(result):
+        result = asyncio.run(result)
+    return result
+
+
+def _call_by_name(module: str, qualname: str, args):
+    obj = importlib.import_module(module)
+    for part in qualname.split("."):
+        obj = getattr(obj, part)
+    # the name is bound to the route's RequestHandler
+    return _call(getattr(obj, "fn", obj), args)
+
+
+class Executors(object):
+    """
+    :params threads workers of the thread pool, python's default when None
+    :params processes workers of the process pool, the cpu count shared by
+        the `workers` processes of the app when None
+    :params start_method fork / spawn / forkserver, the platform's default
+        when None
+    :params workers processes of the app, each with its own pools
+    """
+
+    def __init__(self):
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self.configure()
+
+    def configure(
+        self,
+        threads: Optional[int] = None,
+        processes: Optional[int] = None,
+        start_method: Optional[str] = None,
+        workers: int = 1,
+    ):
+        self.threads = threads
+        self.processes = processes or max(1, (os.cpu_count() or 1) // workers)
+        self.start_method = start_method
+
+    def pool(self, kind: str) -> Executor:
+        """the pool of `kind`, started on first use"""
+        if kind == "thread":
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(
+                    self.threads, thread_name_prefix="cloudoll"
+                )
+            return self._threads
+        if kind == "process":
+            if self._processes is None:
+                context = None
+                if self.start_method is not None:
+                    context = multiprocessing.get_context(self.start_method)
+                self._processes = ProcessPoolExecutor(
+                    self.processes, mp_context=context
+                )
+                info(f"executor: {self.processes} processes.")
+            return self._processes
+        raise ValueError(f"Unknown executor: {kind}")
+
+    async def run(self, kind: str, func, *args):
+        """run `func(*args)` in the pool of `kind`, a coroutine function too"""
+        loop = asyncio.get_running_loop()
+        if kind == "process":
+            if "<locals>" in func.__qualname__:
+                raise TypeError(
+                    f"{func.__qualname__} can't run in a process, "
+                    "it must be a module level function."
+                )
+            call = partial(_call_by_name, func.__module__, func.__qualname__, args)
+        else:
+            call = partial(_call, func, args)
+        return await loop.run_in_executor(self.pool(kind), call)
+
+    async def close(self):
+        """wait for the running calls, drop the queued ones on python 3.9+"""
+        pools = [p for p in (self._threads, self._processes) if p is not None]
+        self._threads = self._processes = None
+        loop = asyncio.get_running_loop()
+        for pool in pools:
+            if sys.version_info >= (3, 9):
+                shutdown = partial(pool.shutdown, wait=True, cancel_futures=True)
+            else:
+                shutdown = partial(pool.shutdown, wait=True)
+            await loop.run_in_executor(None, shutdown)
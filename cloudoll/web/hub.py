@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+WebSocket connections of the application, `app.hub`:
+
+    @get("/chat/{room}", sa_ignore=True)
+    async def chat(ctx):
+        hub = ctx.app.hub
+        async with hub.connect(ctx, rooms=[ctx.params.room]) as conn:
+            async for msg in conn:
+                if msg.type == WSMsgType.text:
+                    await hub.broadcast({"msg": msg.data}, room=ctx.params.room)
+        return conn.ws
+
+A broadcast is encoded once and put on the bounded send queue of every
+connection without awaiting any of them; each connection has a writer task
+draining its queue. A connection whose queue is full, or whose socket takes
+longer than `send_timeout` to accept a frame, is closed instead of holding
+the others back.
+
+With `websocket.redis` set broadcasts are published on a redis channel too
+and every worker delivers them to the sockets it holds.
+"""
+
+__author__ = "Qiu / smallerqiu@gmail.com"
+
+import asyncio
+import json
+import os
+import uuid
+from typing import Any, Dict, Iterable, Optional, Set, Tuple
+
+from aiohttp import WSCloseCode, WSMsgType
+from aiohttp.web_request import Request
+from aiohttp.web_ws import WebSocketResponse
+
+from cloudoll.logging import info, warning
+from cloudoll.web import encoder
+
+Frame = Tuple[bytes, WSMsgType]
+
+
+def encode(message: Any) -> Frame:
+    """str as text, bytes as binary, anything else as json text"""
+    if isinstance(message, str):
+        return message.encode("utf-8"), WSMsgType.TEXT
+    if isinstance(message, (bytes, bytearray, memoryview)):
+        return bytes(message), WSMsgType.BINARY
+    return encoder.dumps(message), WSMsgType.TEXT
+
+
+class Connection(object):
+    """
+    A websocket of the hub, `async with hub.connect(request) as conn`.
+    Iterating it yields the client's messages like the WebSocketResponse.
+    """
+
+    def __init__(self, hub: "Hub", request: Request, rooms: Iterable[str], ws_kw):
+        self.hub = hub
+        self.request = request
+        self.id = uuid.uuid4().hex
+        self.rooms: Set[str] = set()
+        self.ws = WebSocketResponse(**ws_kw)
+        self.closed = False
+        # anything the app wants to keep with the connection, e.g. the user
+        self.data: Dict[str, Any] = {}
+        self._initial_rooms = tuple(rooms)
+        self._queue: "asyncio.Queue[Frame]" = asyncio.Queue(hub.max_queue)
+        self._writer: Optional[asyncio.Task] = None
+        self._closer: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "Connection":
+        await self.ws.prepare(self.request)
+        self._writer = asyncio.create_task(self._write())
+        self.hub._add(self)
+        for room in self._initial_rooms:
+            self.hub.join(self, room)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.hub._remove(self)
+        await self._stop()
+        if not self.ws.closed:
+            await self.ws.close()
+
+    def __aiter__(self):
+        return self.ws.__aiter__()
+
+    def send(self, message: Any) -> bool:
+        """queue a message to this socket, False when it was evicted"""
+        return self.send_frame(encode(message))
+
+    def send_frame(self, frame: Frame) -> bool:
+        if self.closed:
+            return False
+        try:
+            self._queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            self.evict("send queue full")
+            return False
+
+    def evict(self, reason: str):
+        """close a connection that can't keep up"""
+        if self.closed:
+            return
+        warning(f"websocket {self.id} evicted: {reason}")
+        self.hub._remove(self)
+        self.hub.evicted += 1
+        self._closer = asyncio.create_task(
+            self._close(WSCloseCode.TRY_AGAIN_LATER, b"slow consumer")
+        )
+
+    async def _close(self, code: int, message: bytes):
+        await self._stop()
+        try:
+            await asyncio.wait_for(
+                self.ws.close(code=code, message=message), self.hub.send_timeout
+            )
+        except (asyncio.TimeoutError, ConnectionError, RuntimeError):
+            pass
+
+    async def _stop(self):
+        self.closed = True
+        writer = self._writer
+        if writer is not None and writer is not asyncio.current_task():
+            writer.cancel()
+            await asyncio.gather(writer, return_exceptions=True)
+
+    async def _write(self):
+        while True:
+            data, opcode = await self._queue.get()
+            try:
+                await asyncio.wait_for(
+                    self.ws.send_frame(data, opcode), self.hub.send_timeout
+                )
+            except asyncio.TimeoutError:
+                self.evict("send timeout")
+                return
+            except (ConnectionError, RuntimeError):
+                # the socket is gone, the handler's loop ends on its own
+                self.closed = True
+                return
+
+
+class Hub(object):
+    """
+    :params max_queue messages waiting for a slow socket before it is closed
+    :params send_timeout seconds a socket may take to accept a frame
+    :params channel redis channel of the broadcasts between workers
+    """
+
+    def __init__(self):
+        self.connections: Dict[str, Connection] = {}
+        self.rooms: Dict[str, Set[Connection]] = {}
+        self.redis = None
+        self.evicted = 0
+        # broadcasts published by this process are not delivered twice
+        self._origin = f"{os.urandom(4).hex()}:{os.getpid()}"
+        self._listener: Optional[asyncio.Task] = None
+        self.configure()
+
+    def configure(
+        self,
+        max_queue: int = 256,
+        send_timeout: float = 10,
+        channel: str = "cloudoll:ws",
+    ):
+        self.max_queue = int(max_queue)
+        self.send_timeout = float(send_timeout)
+        self.channel = channel
+
+    def connect(self, request: Request, rooms: Iterable[str] = (), **kw) -> Connection:
+        """
+        `async with hub.connect(request, rooms=[...]) as conn`, the keywords
+        are those of WebSocketResponse, e.g. heartbeat=30.
+        """
+        return Connection(self, request, rooms, kw)
+
+    def _add(self, conn: Connection):
+        self.connections[conn.id] = conn
+
+    def _remove(self, conn: Connection):
+        self.connections.pop(conn.id, None)
+        for room in list(conn.rooms):
+            self.leave(conn, room)
+
+    def join(self, conn: Connection, room: str):
+        self.rooms.setdefault(room, set()).add(conn)
+        conn.rooms.add(room)
+
+    def leave(self, conn: Connection, room: str):
+        members = self.rooms.get(room)
+        if members is not None:
+            members.discard(conn)
+            if not members:
+                del self.rooms[room]
+        conn.rooms.discard(room)
+
+    def __len__(self):
+        return len(self.connections)
+
+    def _deliver(
+        self,
+        frame: Frame,
+        rooms: Optional[Tuple[str, ...]],
+        exclude: Optional[str] = None,
+    ) -> int:
+        if rooms is None:
+            targets = list(self.connections.values())
+        elif len(rooms) == 1:
+            targets = list(self.rooms.get(rooms[0], ()))
+        else:
+            # a member of several rooms gets the message once
+            targets = set()
+            for room in rooms:
+                targets.update(self.rooms.get(room, ()))
+        sent = 0
+        for conn in targets:
+            if conn.id != exclude and conn.send_frame(frame):
+                sent += 1
+        return sent
+
+    async def broadcast(
+        self,
+        message: Any,
+        room: Optional[str] = None,
+        exclude: Optional[Connection] = None,
+    ) -> int:
+        """
+        Send to every connection, or the members of `room`, on every worker.
+        Returns the local sockets it was queued to.
+        """
+        rooms = (room,) if room is not None else None
+        return await self._publish(encode(message), rooms, exclude)
+
+    async def multicast(
+        self,
+        message: Any,
+        rooms: Iterable[str],
+        exclude: Optional[Connection] = None,
+    ) -> int:
+        """send to the members of any of `rooms`, once each"""
+        return await self._publish(encode(message), tuple(rooms), exclude)
+
+    async def _publish(self, frame: Frame, rooms, exclude) -> int:
+        exclude_id = exclude.id if exclude is not None else None
+        sent = self._deliver(frame, rooms, exclude_id)
+        if self.redis is not None:
+            header = {
+                "o": self._origin,
+                "r": rooms,
+                "x": exclude_id,
+                "b": frame[1] == WSMsgType.BINARY,
+            }
+            try:
+                await self.redis.publish(
+                    self.channel, encoder.dumps(header) + b"\n" + frame[0]
+                )
+            except Exception as e:
+                warning(f"websocket hub: redis publish failed: {e}")
+        return sent
+
+    async def start(self):
+        if self.redis is not None:
+            self._listener = asyncio.create_task(self._listen())
+            info(f"websocket hub: listening on {self.channel}.")
+
+    async def _listen(self):
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                while True:
+                    msg = await pubsub.get_message(
+                        ignore_subscribe_messages=True, timeout=1.0
+                    )
+                    if msg is not None:
+                        self._on_message(msg["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                warning(f"websocket hub: redis failed, resubscribing: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    def _on_message(self, raw):
+        if isinstance(raw, str):
+            raw = raw.encode("utf-8")
+        head, _, data = raw.partition(b"\n")
+        header = json.loads(head)
+        if header["o"] == self._origin:
+            return
+        opcode = WSMsgType.BINARY if header["b"] else WSMsgType.TEXT
+        rooms = tuple(header["r"]) if header["r"] is not None else None
+        self._deliver((data, opcode), rooms, header["x"])
+
+    async def close(self):
+        """Close every socket with 1001, on the app's shutdown."""
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        conns = list(self.connections.values())
+        for conn in conns:
+            self._remove(conn)
+        await asyncio.gather(
+            *(
+                conn._close(WSCloseCode.GOING_AWAY, b"server shutdown")
+                for conn in conns
+            ),
+            return_exceptions=True,
+        )
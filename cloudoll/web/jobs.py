@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Background jobs of the application, `app.jobs`:
+
+    @app.jobs.task(retries=5)
+    async def send_mail(to, subject):
+        ...
+
+    await request.app.jobs.enqueue(send_mail, "a@b.c", "hi")
+
+Jobs run on the app's event loop with a bounded number of workers, failed
+jobs are retried with a growing delay and the queue is drained on shutdown.
+
+With `jobs.redis` set the queue is a redis list: jobs survive restarts and
+are consumed by `cloudoll worker` processes. A job being run sits in a
+processing list of its consumer and is pushed back when that consumer
+starts again after a crash.
+"""
+
+__author__ = "Qiu / smallerqiu@gmail.com"
+
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from typing import Callable, Dict, Optional, Set
+
+from cloudoll.logging import error, info, warning
+from cloudoll.web import encoder
+
+
+class Job(object):
+    """a registered task, retries / backoff None use the queue's"""
+
+    __slots__ = ("func", "name", "retries", "backoff")
+
+    def __init__(
+        self,
+        func,
+        name: str,
+        retries: Optional[int] = None,
+        backoff: Optional[float] = None,
+    ):
+        self.func = func
+        self.name = name
+        self.retries = retries
+        self.backoff = backoff
+
+
+class JobQueue(object):
+    """
+    :params workers jobs run at the same time in this process
+    :params max_size jobs waiting in the local queue, enqueue waits when full
+    :params retries extra attempts of a failing job
+    :params backoff seconds before the first retry, doubled every time
+    :params max_backoff longest delay between retries
+    :params drain_timeout seconds queued and running jobs get on shutdown
+    :params consume run durable jobs in this process, the web app leaves them
+        to `cloudoll worker` unless it is set
+    :params key redis list of the durable queue
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, Job] = {}
+        self._names: Dict[Callable, str] = {}
+        self.redis = None
+        self.consumer: Optional[str] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: Set[asyncio.Task] = set()
+        self._stopping = False
+        self.configure()
+
+    def configure(
+        self,
+        workers: int = 4,
+        max_size: int = 1000,
+        retries: int = 3,
+        backoff: float = 1,
+        max_backoff: float = 60,
+        drain_timeout: float = 30,
+        consume: bool = False,
+        key: str = "cloudoll:jobs",
+    ):
+        self.workers = int(workers)
+        self.max_size = int(max_size)
+        self.retries = int(retries)
+        self.backoff = float(backoff)
+        self.max_backoff = float(max_backoff)
+        self.drain_timeout = float(drain_timeout)
+        self.consume = consume
+        self.key = key
+
+    @property
+    def durable(self) -> bool:
+        return self.redis is not None
+
+    def task(
+        self,
+        func=None,
+        name: Optional[str] = None,
+        retries: Optional[int] = None,
+        backoff: Optional[float] = None,
+    ):
+        """
+        Register a coroutine function as a job, required by the redis queue
+        which stores the job's name and json arguments.
+        """
+
+        def register(func):
+            job_name = name or f"{func.__module__}.{func.__qualname__}"
+            self._jobs[job_name] = Job(func, job_name, retries, backoff)
+            self._names[func] = job_name
+            return func
+
+        if func is None:
+            return register
+        return register(func)
+
+    def _job(self, func) -> Job:
+        if isinstance(func, str):
+            if func not in self._jobs:
+                raise KeyError(f"No job named {func}.")
+            return self._jobs[func]
+        name = self._names.get(func)
+        if name is not None:
+            return self._jobs[name]
+        if self.durable:
+            raise ValueError(
+                f"{func.__qualname__} is not registered, use @app.jobs.task."
+            )
+        return Job(func, func.__qualname__)
+
+    async def enqueue(self, func, *args, **kwargs) -> str:
+        """Queue `func(*args, **kwargs)`, a function or a registered name."""
+        if self._stopping:
+            raise RuntimeError("The job queue is shutting down.")
+        job = self._job(func)
+        job_id = uuid.uuid4().hex
+        if self.durable:
+            payload = {
+                "id": job_id,
+                "name": job.name,
+                "args": args,
+                "kwargs": kwargs,
+                "enqueued": time.time(),
+            }
+            await self.redis.lpush(self.key, encoder.dumps(payload))
+            return job_id
+        if self._queue is None:
+            raise RuntimeError("The job queue is not started, use it after startup.")
+        await self._queue.put((job, args, kwargs))
+        return job_id
+
+    async def start(self):
+        """Start the workers, on the app's startup."""
+        self._stopping = False
+        if self.durable:
+            if not self.consume:
+                return
+            self.consumer = self.consumer or f"{socket.gethostname()}:{os.getpid()}"
+            await self._recover()
+            target = self._consume_redis
+        else:
+            self._queue = asyncio.Queue(self.max_size)
+            target = self._consume_local
+        for _ in range(self.workers):
+            task = asyncio.create_task(target())
+            self._workers.add(task)
+            task.add_done_callback(self._workers.discard)
+        info(f"jobs: {self.workers} workers, {'redis' if self.durable else 'local'}.")
+
+    async def close(self):
+        """Stop taking jobs, let queued and running ones finish, then stop."""
+        self._stopping = True
+        if not self._workers:
+            return
+        if self.durable:
+            # redis consumers return after their current job
+            await asyncio.wait(set(self._workers), timeout=self.drain_timeout)
+        else:
+            try:
+                await asyncio.wait_for(self._queue.join(), self.drain_timeout)
+            except asyncio.TimeoutError:
+                warning(f"jobs: {self._queue.qsize()} queued jobs dropped.")
+        # a cancelled redis job stays in the processing list for _recover
+        workers = list(self._workers)
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _run(self, job: Job, args, kwargs) -> bool:
+        """run with retries, False once they are used up"""
+        retries = self.retries if job.retries is None else job.retries
+        backoff = self.backoff if job.backoff is None else job.backoff
+        attempt = 0
+        while True:
+            try:
+                await job.func(*args, **kwargs)
+                return True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt >= retries:
+                    error(f"job {job.name} failed after {attempt + 1} attempts: {e}")
+                    return False
+                delay = min(backoff * 2**attempt, self.max_backoff)
+                attempt += 1
+                warning(f"job {job.name} failed: {e}, retry {attempt} in {delay}s")
+                await asyncio.sleep(delay)
+
+    async def _consume_local(self):
+        while True:
+            job, args, kwargs = await self._queue.get()
+            try:
+                await self._run(job, args, kwargs)
+            finally:
+                self._queue.task_done()
+
+    def _processing_key(self) -> str:
+        return f"{self.key}:processing:{self.consumer}"
+
+    async def _recover(self):
+        """push back the jobs this consumer was running when it died"""
+        processing = self._processing_key()
+        count = 0
+        while await self.redis.rpoplpush(processing, self.key):
+            count += 1
+        if count:
+            warning(f"jobs: {count} unfinished jobs of {self.consumer} queued again.")
+
+    async def _consume_redis(self):
+        processing = self._processing_key()
+        while not self._stopping:
+            try:
+                raw = await self.redis.brpoplpush(self.key, processing, timeout=1)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                warning(f"jobs: redis failed: {e}")
+                await asyncio.sleep(1)
+                continue
+            if raw is None:
+                continue
+            payload = json.loads(raw)
+            job = self._jobs.get(payload["name"])
+            if job is None:
+                error(f"jobs: no job named {payload['name']}, moved to failed.")
+                ok = False
+            else:
+                ok = await self._run(job, payload["args"], payload["kwargs"])
+            if not ok:
+                await self.redis.lpush(f"{self.key}:failed", raw)
+            await self.redis.lrem(processing, 1, raw)
+
+    def __len__(self):
+        """jobs waiting in the local queue"""
+        return self._queue.qsize() if self._queue is not None else 0
@@ -4,8 +4,11 @@
 __author__ = "Qiu / smallerqiu@gmail.com"
 
 import jwt, datetime
-from cloudoll.logging import error
-from typing import Union
+import hashlib
+import time
+from collections import OrderedDict
+from cloudoll.logging import error, warning
+from typing import Optional, Union
 
 def encode(payload, key, exp: Union[int, str] = 3600)->str:
     """
@@ -22,6 +25,17 @@ def encode(payload, key, exp: Union[int, str] = 3600)->str:
     return result
 
 
+def _verify(token, key):
+    """payload of a valid token, raises otherwise"""
+    payload = jwt.decode(token, key, algorithms=['HS256'])
+    if not payload:
+        raise jwt.InvalidTokenError("empty payload")
+    now = datetime.datetime.now().timestamp()  # 当前时间
+    if int(now) > int(payload["exp"]):  # 登录时间过期
+        raise jwt.ExpiredSignatureError("Signature has expired")
+    return payload
+
+
 def decode(token, key):
     """
     jwt
@@ -29,13 +43,73 @@ def decode(token, key):
     :params key
     """
     try:
-        payload = jwt.decode(token, key, algorithms=['HS256'])
-        if not payload:
-            return None
-        now = datetime.datetime.now().timestamp()  # 当前时间
-        if int(now) > int(payload["exp"]):  # 登录时间过期
-            return None
-        return payload  # 返回自定义内容
+        return _verify(token, key)  # 返回自定义内容
     except Exception as e:
         error(e)
         return None
+
+
+class TokenCache(object):
+    """
+    Verified payloads by token digest, so a token is checked once per
+    process. An entry is dropped at its `exp`, rejected tokens are
+    remembered for `negative_ttl` seconds and logged once.
+
+    :params key jwt key
+    :params max_entries tokens kept, the least recently used go first
+    :params negative_ttl seconds a rejected token is answered from the cache
+    """
+
+    def __init__(self, key, max_entries: int = 10000, negative_ttl: float = 60):
+        self.key = key
+        self.max_entries = int(max_entries)
+        self.negative_ttl = float(negative_ttl)
+        # digest -> (payload, exp)
+        self._valid: "OrderedDict[bytes, tuple]" = OrderedDict()
+        # digest -> rejected until
+        self._rejected: "OrderedDict[bytes, float]" = OrderedDict()
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.blake2b(token.encode("utf-8"), digest_size=16).digest()
+
+    def _remember(self, cache: OrderedDict, digest: bytes, value):
+        cache[digest] = value
+        cache.move_to_end(digest)
+        while len(cache) > self.max_entries:
+            cache.popitem(last=False)
+
+    def decode(self, token: str) -> Optional[dict]:
+        """a copy of the payload, None for invalid or expired tokens"""
+        if not token:
+            return None
+        digest = self._digest(token)
+        now = time.time()
+        entry = self._valid.get(digest)
+        if entry is not None:
+            payload, exp = entry
+            if int(now) <= exp:
+                self._valid.move_to_end(digest)
+                return dict(payload)
+            del self._valid[digest]
+        else:
+            until = self._rejected.get(digest)
+            if until is not None:
+                if now < until:
+                    return None
+                del self._rejected[digest]
+        try:
+            payload = _verify(token, self.key)
+        except Exception as e:
+            warning(f"jwt rejected: {e}")
+            self._remember(self._rejected, digest, now + self.negative_ttl)
+            return None
+        self._remember(self._valid, digest, (payload, int(payload["exp"])))
+        return dict(payload)
+
+    def clear(self):
+        self._valid.clear()
+        self._rejected.clear()
+
+    def __len__(self):
+        return len(self._valid)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Manifest of the `controllers` modules, for `server.lazy_routes`.
+
+The first boot imports every module as usual and writes down, for each
+file, its mtime, size, content hash and the routes it registered. While
+no file was added, removed or changed, later boots register a stub for
+each of those routes instead of importing the module; the module is
+imported on the first request to one of its routes.
+
+A copied tree, e.g. a docker image, has other mtimes but the same hashes,
+so a manifest built once can ship with the code. Modules that register
+anything besides routes (middlewares, `@app.schedule`, `@app.jobs.task`,
+app hooks) or no route at all are always imported at startup.
+"""
+
+__author__ = "Qiu / smallerqiu@gmail.com"
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp.web_request import Request
+
+from cloudoll.logging import error, warning
+
+MANIFEST_VERSION = 1
+
+ModuleFile = Tuple[str, str, Path]
+
+
+def file_hash(py_file: Path) -> str:
+    return hashlib.blake2b(py_file.read_bytes(), digest_size=16).hexdigest()
+
+
+class Manifest(object):
+    """
+    :params path of the json file, written when the modules changed
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.modules: Dict[str, dict] = {}
+        self.changed = False
+        try:
+            data = json.loads(self.path.read_text("utf-8"))
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict) and data.get("version") == MANIFEST_VERSION:
+            self.modules = data.get("modules") or {}
+
+    def match(self, files: List[ModuleFile]) -> Optional[List[dict]]:
+        """the entries of `files` in order, None when any of them changed"""
+        if set(self.modules) != {key for key, _, _ in files}:
+            return None
+        entries = []
+        for key, module_name, py_file in files:
+            entry = self.modules[key]
+            st = py_file.stat()
+            if entry["mtime"] != st.st_mtime_ns or entry["size"] != st.st_size:
+                # touched or copied, it is the same module while its code is
+                if entry["size"] != st.st_size or entry["hash"] != file_hash(py_file):
+                    return None
+                entry["mtime"] = st.st_mtime_ns
+                self.changed = True
+            if entry["module"] != module_name:
+                return None
+            entries.append(entry)
+        return entries
+
+    def put(self, key: str, module_name: str, py_file: Path, routes, eager: bool):
+        st = py_file.stat()
+        self.modules[key] = {
+            "module": module_name,
+            "mtime": st.st_mtime_ns,
+            "size": st.st_size,
+            "hash": file_hash(py_file),
+            "eager": eager,
+            "routes": routes,
+        }
+        self.changed = True
+
+    def prune(self, files: List[ModuleFile]):
+        keys = {key for key, _, _ in files}
+        for key in list(self.modules):
+            if key not in keys:
+                del self.modules[key]
+                self.changed = True
+
+    def save(self):
+        if not self.changed:
+            return
+        data = {"version": MANIFEST_VERSION, "modules": self.modules}
+        # workers booting together each write a whole file, never a torn one
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(json.dumps(data, indent=1), "utf-8")
+            os.replace(tmp, self.path)
+            self.changed = False
+        except OSError as e:
+            warning(f"manifest {self.path} not written: {e}")
+
+
+class LazyModule(object):
+    """
+    A controllers module imported on the first request to its routes. An
+    import that fails is not tried again, its routes answer 500 until the
+    app restarts.
+    """
+
+    def __init__(self, app, module_name: str, py_file: Path, routes: list):
+        self.app = app
+        self.module_name = module_name
+        self.py_file = py_file
+        self.routes = routes
+        self._handlers: Optional[list] = None
+        self._failed: Optional[BaseException] = None
+
+    def load(self) -> list:
+        if self._handlers is None:
+            if self._failed is not None:
+                raise RuntimeError(
+                    f"{self.module_name} failed to import: {self._failed!r}"
+                ) from self._failed
+            try:
+                handlers = self.app._load_lazy_module(self.module_name, self.py_file)
+                if len(handlers) != len(self.routes):
+                    raise RuntimeError(
+                        f"{self.module_name} registered {len(handlers)} routes, "
+                        f"the manifest lists {len(self.routes)}."
+                    )
+            except Exception as e:
+                self._failed = e
+                error(f"lazy routes: {self.module_name} failed to import: {e!r}")
+                raise
+            self._handlers = handlers
+        return self._handlers
+
+
+class LazyHandler(object):
+    """The stub of a route of a `LazyModule`, the module's handler once loaded."""
+
+    def __init__(self, module: LazyModule, index: int):
+        self.module = module
+        self.index = index
+
+    @property
+    def handler(self):
+        return self.module.load()[self.index]
+
+    @property
+    def route_options(self):
+        # read by the app's middlewares before the handler runs
+        return self.handler.route_options
+
+    async def __call__(self, request: Request):
+        # a RequestHandler, or a View class whose instance is awaited
+        return await self.handler(request)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+In-memory request metrics with Prometheus text exposition.
+
+Everything runs on the event loop thread, so counters are plain ints
+updated without locks.
+"""
+
+__author__ = "Qiu / smallerqiu@gmail.com"
+
+import hmac
+import ipaddress
+import os
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from aiohttp import hdrs
+from aiohttp.web import HTTPNotFound, Response
+from aiohttp.web_request import Request
+
+# HDR style buckets: 16 linear sub buckets per power of two, ~6% precision
+_SUB_BITS = 4
+_SUB_COUNT = 1 << _SUB_BITS
+_MAX_INDEX = _SUB_COUNT * 40
+
+# exported histogram bounds, seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def _index(us: int) -> int:
+    if us < 2 * _SUB_COUNT:
+        return us if us > 0 else 0
+    shift = us.bit_length() - _SUB_BITS - 1
+    return min(shift * _SUB_COUNT + (us >> shift), _MAX_INDEX)
+
+
+def _upper(index: int) -> int:
+    """exclusive upper bound of a bucket, in microseconds"""
+    if index < 2 * _SUB_COUNT:
+        return index + 1
+    shift = index // _SUB_COUNT - 1
+    return (index - shift * _SUB_COUNT + 1) << shift
+
+
+class Histogram(object):
+    """
+    Latency histogram with sparse HDR style buckets for the quantiles, and
+    exact counts under each exported bound.
+    """
+
+    __slots__ = ("count", "sum", "counts", "bounds", "buckets")
+
+    def __init__(self, bounds: Tuple[float, ...] = BUCKETS):
+        self.count = 0
+        self.sum = 0.0
+        self.counts: Dict[int, int] = {}
+        self.bounds = bounds
+        self.buckets = [0] * len(bounds)
+
+    def record(self, seconds: float):
+        self.count += 1
+        self.sum += seconds
+        index = _index(int(seconds * 1000000))
+        self.counts[index] = self.counts.get(index, 0) + 1
+        # le="bound" counts the samples <= bound
+        pos = bisect_left(self.bounds, seconds)
+        if pos < len(self.buckets):
+            self.buckets[pos] += 1
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return _upper(index) / 1000000
+        return _upper(max(self.counts)) / 1000000
+
+    def cumulative(self) -> List[int]:
+        """count of samples <= each of `bounds`"""
+        result = []
+        seen = 0
+        for count in self.buckets:
+            seen += count
+            result.append(seen)
+        return result
+
+
+def route_name(request: Request) -> str:
+    """the route pattern, e.g. /user/{id}, so labels don't grow with ids"""
+    route = request.match_info.route
+    resource = route.resource
+    if resource is None:
+        return "unmatched"
+    return resource.canonical
+
+
+class Metrics(object):
+    """
+    :params quantiles of the latency summary
+    :params allow addresses / networks that may read the metrics, none by
+        default: behind a proxy on the same host every client is the loopback
+    :params token bearer token that also grants access, from anywhere
+    """
+
+    def __init__(
+        self,
+        quantiles: Tuple[float, ...] = QUANTILES,
+        allow: Iterable[str] = (),
+        token: Optional[str] = None,
+    ):
+        self.quantiles = quantiles
+        self.allow = [ipaddress.ip_network(net, strict=False) for net in allow]
+        self.token = token
+        self.latency: Dict[Tuple[str, str, int], Histogram] = {}
+        self.in_flight: Dict[Tuple[str, str], int] = {}
+        self.shed: Dict[Tuple[str, str], int] = {}
+
+    def start(self, method: str, route: str):
+        key = (method, route)
+        self.in_flight[key] = self.in_flight.get(key, 0) + 1
+
+    def finish(self, method: str, route: str, status: int, seconds: float):
+        key = (method, route)
+        self.in_flight[key] -= 1
+        hist_key = (method, route, status)
+        hist = self.latency.get(hist_key)
+        if hist is None:
+            hist = self.latency[hist_key] = Histogram()
+        hist.record(seconds)
+
+    def shed_request(self, method: str, route: str):
+        key = (method, route)
+        self.shed[key] = self.shed.get(key, 0) + 1
+
+    def render(self) -> str:
+        lines = []
+        name = "cloudoll_http_request_duration_seconds"
+        lines.append(f"# HELP {name} Request latency by route and status.")
+        lines.append(f"# TYPE {name} histogram")
+        for (method, route, status), hist in sorted(self.latency.items()):
+            labels = f'method="{method}",route="{_escape(route)}",status="{status}"'
+            for bound, count in zip(hist.bounds, hist.cumulative()):
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.count}')
+            lines.append(f"{name}_sum{{{labels}}} {hist.sum:.6f}")
+            lines.append(f"{name}_count{{{labels}}} {hist.count}")
+
+        name = "cloudoll_http_request_latency_seconds"
+        lines.append(f"# HELP {name} Request latency quantiles by route and status.")
+        lines.append(f"# TYPE {name} summary")
+        for (method, route, status), hist in sorted(self.latency.items()):
+            labels = f'method="{method}",route="{_escape(route)}",status="{status}"'
+            for q in self.quantiles:
+                value = hist.quantile(q)
+                lines.append(f'{name}{{{labels},quantile="{q}"}} {value:.6f}')
+            lines.append(f"{name}_sum{{{labels}}} {hist.sum:.6f}")
+            lines.append(f"{name}_count{{{labels}}} {hist.count}")
+
+        name = "cloudoll_http_requests_in_flight"
+        lines.append(f"# HELP {name} Requests being handled.")
+        lines.append(f"# TYPE {name} gauge")
+        for (method, route), value in sorted(self.in_flight.items()):
+            labels = f'method="{method}",route="{_escape(route)}"'
+            lines.append(f"{name}{{{labels}}} {value}")
+
+        name = "cloudoll_http_requests_shed_total"
+        lines.append(f"# HELP {name} Requests answered 503 by the concurrency limits.")
+        lines.append(f"# TYPE {name} counter")
+        for (method, route), value in sorted(self.shed.items()):
+            labels = f'method="{method}",route="{_escape(route)}"'
+            lines.append(f"{name}{{{labels}}} {value}")
+
+        lines.append("# TYPE cloudoll_process_info gauge")
+        lines.append(f'cloudoll_process_info{{pid="{os.getpid()}"}} 1')
+        return "\n".join(lines) + "\n"
+
+    def allowed(self, request: Request) -> bool:
+        if self.token:
+            auth = request.headers.get(hdrs.AUTHORIZATION, "")
+            if hmac.compare_digest(auth.encode(), f"Bearer {self.token}".encode()):
+                return True
+        if not request.remote:
+            # a unix socket, the proxy in front of it is every client
+            return False
+        try:
+            remote = ipaddress.ip_address(request.remote)
+        except ValueError:
+            return False
+        return any(remote in net for net in self.allow)
+
+    async def handler(self, request: Request) -> Response:
+        if not self.allowed(request):
+            # the route isn't advertised to other clients
+            raise HTTPNotFound()
+        return Response(
+            body=self.render().encode("utf-8"),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+        )
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
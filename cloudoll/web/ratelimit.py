@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Rate limiting, per client key:
+
+    token bucket    in process, for a single worker
+    sliding window  a Lua script in redis, shared by every worker
+
+The in process buckets are only touched on the event loop thread and never
+across an await, so they need no lock.
+"""
+
+__author__ = "Qiu / smallerqiu@gmail.com"
+
+import itertools
+import math
+import os
+import time
+from collections import OrderedDict
+from fractions import Fraction
+from typing import Callable, Optional, Tuple, Union
+
+from aiohttp import hdrs
+from aiohttp.web_request import Request
+from cloudoll.logging import warning
+
+_UNITS = {
+    "s": 1,
+    "sec": 1,
+    "second": 1,
+    "m": 60,
+    "min": 60,
+    "minute": 60,
+    "h": 3600,
+    "hour": 3600,
+    "d": 86400,
+    "day": 86400,
+}
+
+# KEYS[1] window key, ARGV: window ms, limit, unique member
+_SLIDING_WINDOW = """
+local t = redis.call('TIME')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, now - window)
+local count = redis.call('ZCARD', KEYS[1])
+if count < limit then
+    redis.call('ZADD', KEYS[1], now, ARGV[3])
+    redis.call('PEXPIRE', KEYS[1], window)
+    return {1, limit - count - 1, 0}
+end
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+return {0, 0, tonumber(oldest[2]) + window - now}
+"""
+
+
+def client_ip(request: Request) -> str:
+    return request.remote or "-"
+
+
+def jwt_subject(request: Request) -> str:
+    """`sub` (or `id` / `username`) of the bearer token, the ip without one"""
+    token = request.headers.get(hdrs.AUTHORIZATION)
+    if token:
+        payload = request.app.jwt_decode(token.replace("Bearer", "").strip())
+        if payload:
+            subject = payload.get("sub") or payload.get("id") or payload.get("username")
+            if subject is not None:
+                return f"jwt:{subject}"
+    return client_ip(request)
+
+
+KEY_FUNCS = {"ip": client_ip, "jwt": jwt_subject}
+
+
+class RateLimit(object):
+    """
+    Rate limit of a route, or the default of every route.
+
+    :params rate requests allowed every `per` seconds
+    :params per window in seconds
+    :params burst size of the token bucket, `rate` by default, redis ignores it
+    :params key ip / jwt or a function of the request returning a str
+    :params redis count in redis when the app has one
+    """
+
+    __slots__ = ("rate", "per", "burst", "key", "redis")
+
+    def __init__(
+        self,
+        rate: float,
+        per: float = 1,
+        burst: Optional[float] = None,
+        key: Union[str, Callable[[Request], str]] = "ip",
+        redis: bool = True,
+    ):
+        if isinstance(key, str):
+            if key not in KEY_FUNCS:
+                raise ValueError(f"Unknown rate limit key: {key}")
+            key = KEY_FUNCS[key]
+        if float(rate) <= 0 or float(per) <= 0:
+            raise ValueError(f"Rate limit must be positive: {rate}/{per}s")
+        self.rate = float(rate)
+        self.per = float(per)
+        # a bucket holds at least one request, 0.5/s lets one through every 2s
+        self.burst = max(1.0, float(burst or rate))
+        self.key = key
+        self.redis = redis
+
+    @classmethod
+    def parse(cls, limit: Union[None, bool, str, int, float, dict, "RateLimit"]):
+        """rate_limit="10/s", rate_limit=100, rate_limit={"rate": 5, "per": 60}"""
+        if limit is None or limit is False:
+            return None
+        if isinstance(limit, RateLimit):
+            return limit
+        if isinstance(limit, dict):
+            limit = dict(limit)
+            rate = limit.pop("rate")
+            if isinstance(rate, str):
+                rate, per = _parse_rate(rate)
+                limit.setdefault("per", per)
+            return cls(rate, **limit)
+        if isinstance(limit, str):
+            rate, per = _parse_rate(limit)
+            return cls(rate, per)
+        return cls(limit)
+
+    def window(self) -> Tuple[int, int]:
+        """
+        (requests, ms) of the redis sliding window, in whole requests:
+        0.5/s is 1 per 2000ms, 2.5/s is 5 per 2000ms
+        """
+        ratio = Fraction(self.rate).limit_denominator(1000)
+        return ratio.numerator, max(1, int(self.per * ratio.denominator * 1000))
+
+
+def _parse_rate(text: str) -> Tuple[float, float]:
+    """ "100/m", "5/10s", "1000/hour" """
+    rate, _, unit = text.replace(" ", "").partition("/")
+    if not unit:
+        return float(rate), 1
+    digits = "".join(itertools.takewhile(lambda c: c.isdigit() or c == ".", unit))
+    name = unit[len(digits) :].lower()
+    if name.endswith("s") and name[:-1] in _UNITS:
+        name = name[:-1]
+    if name not in _UNITS:
+        raise ValueError(f"Unknown rate limit unit: {text}")
+    return float(rate), float(digits or 1) * _UNITS[name]
+
+
+class TokenBucket(object):
+    """In process token buckets, the least recently used are dropped first."""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        # key -> [tokens, updated at]
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    def take(self, key: str, limit: RateLimit) -> Tuple[bool, float]:
+        """(allowed, seconds until a token is back)"""
+        now = time.monotonic()
+        refill = limit.rate / limit.per
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [limit.burst, now]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(limit.burst, bucket[0] + (now - bucket[1]) * refill)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return True, 0.0
+        return False, (1 - bucket[0]) / refill
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class RateLimiter(object):
+    """
+    Checks requests against their `RateLimit`, through redis when it is set,
+    falling back to the local buckets when redis fails.
+    """
+
+    def __init__(self, redis=None, prefix="cloudoll:ratelimit:", max_keys=100000):
+        self.redis = redis
+        self.prefix = prefix
+        self.local = TokenBucket(max_keys)
+        self._script = None
+        self._seq = itertools.count()
+        # zset members must be unique across hosts and workers
+        self._member = f"{os.urandom(4).hex()}:{os.getpid()}"
+
+    async def check(self, request: Request, limit: RateLimit, scope: str):
+        """(allowed, retry after seconds) of the request's client in `scope`"""
+        key = f"{scope}:{limit.key(request)}"
+        if self.redis is None or not limit.redis:
+            return self.local.take(key, limit)
+        if self._script is None:
+            self._script = self.redis.register_script(_SLIDING_WINDOW)
+        member = f"{self._member}:{next(self._seq)}"
+        count, window = limit.window()
+        try:
+            allowed, _, wait = await self._script(
+                keys=[self.prefix + key], args=[window, count, member]
+            )
+        except Exception as e:
+            warning(f"rate limit redis failed, counting locally: {e}")
+            return self.local.take(key, limit)
+        return bool(int(allowed)), int(wait) / 1000
+
+
+def retry_after(seconds: float) -> str:
+    return str(max(1, math.ceil(seconds)))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Per-route options, attached to the handler when the route is registered
+and read back from `request.match_info.route` by the middlewares.
+"""
+
+__author__ = "Qiu / smallerqiu@gmail.com"
+
+from typing import Awaitable, Callable, Iterable
+
+from aiohttp.web_request import Request
+from aiohttp.web_response import StreamResponse
+
+from cloudoll.web.cache import CachePolicy
+from cloudoll.web.concurrency import ConcurrencyLimit
+from cloudoll.web.executor import EXECUTORS
+from cloudoll.web.ratelimit import RateLimit
+from cloudoll.web.upload import UploadLimit
+
+
+class RouteOptions(object):
+    """
+    :params sa_ignore the auth middlewares let the route through
+    :params cache seconds or a dict of `CachePolicy` options to cache the response
+    :params etag hash the body into an ETag and answer 304 to If-None-Match
+    :params middlewares run for this route only, `(request, handler)` functions
+        or tags of `@middleware(tag=...)`, outermost first
+    :params rate_limit "10/s" or a dict of `RateLimit` options, replaces the
+        default `rate_limit` of the config, False turns it off for the route
+    :params concurrency in-flight limit of the route, an int or a dict of
+        `ConcurrencyLimit` options, False skips the server wide limit too
+    :params upload stream multipart bodies through `Upload` instead of
+        buffering them, True, a max size in bytes or a dict of `UploadLimit`
+    :params executor "thread" or "process", run the handler in a pool of the
+        app with a picklable copy of the request, for CPU bound work
+    :params session load a redis / memcached session before the handler,
+        by default when the handler's code reads `ctx.session`
+    """
+
+    __slots__ = (
+        "sa_ignore",
+        "cache",
+        "etag",
+        "middlewares",
+        "rate_limit",
+        "concurrency",
+        "upload",
+        "executor",
+        "session",
+    )
+
+    def __init__(
+        self,
+        sa_ignore: bool = False,
+        cache=None,
+        etag: bool = False,
+        middlewares: Iterable = (),
+        rate_limit=None,
+        concurrency=None,
+        upload=None,
+        executor=None,
+        session=None,
+    ):
+        self.sa_ignore = bool(sa_ignore)
+        self.cache = CachePolicy.parse(cache)
+        self.etag = etag
+        self.middlewares = tuple(middlewares or ())
+        self.rate_limit = False if rate_limit is False else RateLimit.parse(rate_limit)
+        self.concurrency = (
+            False if concurrency is False else ConcurrencyLimit.parse(concurrency)
+        )
+        self.upload = UploadLimit.parse(upload)
+        if executor is not None and executor not in EXECUTORS:
+            raise ValueError(f"Unknown executor: {executor}")
+        self.executor = executor
+        self.session = session
+
+
+DEFAULT_OPTIONS = RouteOptions()
+
+
+def route_options(request: Request) -> RouteOptions:
+    """options of the matched route, defaults for 404 / 405 and foreign routes"""
+    handler = request.match_info.route.handler
+    # aiohttp wraps callable objects in a function, the lazy routes' options
+    # are a property of the object
+    handler = getattr(handler, "__wrapped__", handler)
+    options = getattr(handler, "route_options", None)
+    # a mock or a foreign handler's attribute of the same name is no option
+    return options if isinstance(options, RouteOptions) else DEFAULT_OPTIONS
+
+
+Handler = Callable[[Request], Awaitable[StreamResponse]]
+
+
+def compose(middlewares: Iterable[Callable], handler: Handler) -> Handler:
+    """Bind `middlewares` around `handler` once, the first one outermost."""
+    for mw in reversed(list(middlewares)):
+        handler = _bind(mw, handler)
+    return handler
+
+
+def _bind(mw, handler: Handler) -> Handler:
+    async def call(request: Request):
+        return await mw(request, handler)
+
+    return call
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Periodic tasks on the app's event loop:
+
+    @app.schedule("*/5 * * * *")
+    async def refresh(app):
+        await app.db.mysql.query(...)
+
+    @app.schedule(every=30)
+    async def heartbeat():
+        ...
+
+A run is skipped while the previous one of the same task is still going.
+With `schedule.redis` set, workers race for a redis key per run time so
+only one of them starts each run, and a task without `overlap` holds a
+lock in redis for as long as it runs, refreshed every `lock_ttl / 3`
+seconds, so a run outlasting its interval isn't overlapped by the next
+one on another worker. When redis fails the run is skipped rather than
+started on every worker.
+"""
+
+__author__ = "Qiu / smallerqiu@gmail.com"
+
+import asyncio
+import inspect
+import math
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from cloudoll.logging import error, info, warning
+
+_ALIASES = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+
+# KEYS[1] task lock, ARGV: token, ttl ms; only the holder extends / frees it
+_REFRESH = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# minute, hour, day of month, month, day of week (0 is sunday, 7 too)
+_BOUNDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+
+def _parse_field(field: str, low: int, high: int) -> Set[int]:
+    values = set()
+    for part in field.split(","):
+        expr, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if expr == "*":
+            start, end = low, high
+        elif "-" in expr:
+            start, end = (int(v) for v in expr.split("-", 1))
+        else:
+            start = int(expr)
+            end = high if step > 1 else start
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError(f"Invalid cron field: {field}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class Cron(object):
+    """5 field cron expression, local time"""
+
+    __slots__ = ("expr", "minutes", "hours", "days", "months", "weekdays", "_any_day")
+
+    def __init__(self, expr: str):
+        self.expr = expr
+        fields = _ALIASES.get(expr.strip(), expr).split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron needs 5 fields: {expr}")
+        sets = [_parse_field(f, *b) for f, b in zip(fields, _BOUNDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = sets
+        self.weekdays = {d % 7 for d in weekdays}
+        # cron runs on either day field when both are restricted
+        self._any_day = (fields[2] == "*", fields[4] == "*")
+
+    def _day_matches(self, dt: datetime) -> bool:
+        day = dt.day in self.days
+        weekday = (dt.weekday() + 1) % 7 in self.weekdays
+        any_dom, any_dow = self._any_day
+        if any_dom or any_dow:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, dt: datetime) -> datetime:
+        dt = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # a few years covers every valid expression, like 29 feb
+        limit = dt + timedelta(days=366 * 5)
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1) + timedelta(days=32)).replace(
+                    day=1, hour=0, minute=0
+                )
+                continue
+            if not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+                continue
+            if dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+                continue
+            return dt
+        raise ValueError(f"Cron never runs: {self.expr}")
+
+
+class ScheduledTask(object):
+    def __init__(
+        self,
+        func,
+        cron: Optional[str] = None,
+        every: Optional[float] = None,
+        name: Optional[str] = None,
+        overlap: bool = False,
+    ):
+        if (cron is None) == (every is None):
+            raise ValueError("Schedule needs one of cron or every.")
+        self.func = func
+        self.cron = Cron(cron) if cron is not None else None
+        self.every = float(every) if every is not None else None
+        self.name = name or f"{func.__module__}.{func.__qualname__}"
+        self.overlap = overlap
+        self.pass_app = len(inspect.signature(func).parameters) > 0
+        self.running: Set[asyncio.Task] = set()
+
+    def next_run(self, now: float) -> float:
+        """next run time as a unix timestamp"""
+        if self.every is not None:
+            # aligned to the epoch, so every worker agrees on the run times
+            return (math.floor(now / self.every) + 1) * self.every
+        return self.cron.next_after(datetime.fromtimestamp(now)).timestamp()
+
+
+class Scheduler(object):
+    """
+    :params lock_ttl seconds the redis lock of a running task lives without
+        being refreshed, e.g. after its worker died
+    """
+
+    def __init__(self):
+        self.tasks: List[ScheduledTask] = []
+        self.redis = None
+        self.prefix = "cloudoll:schedule:"
+        self.lock_ttl = 60.0
+        self._loops: Dict[str, asyncio.Task] = {}
+
+    def add(self, func, **kw) -> ScheduledTask:
+        task = ScheduledTask(func, **kw)
+        self.tasks.append(task)
+        return task
+
+    def start(self, app):
+        for task in self.tasks:
+            self._loops[task.name] = asyncio.create_task(self._loop(app, task))
+        if self.tasks:
+            info(f"schedule: {len(self.tasks)} tasks.")
+
+    async def close(self, timeout: float = 30):
+        """stop scheduling, give running tasks `timeout` seconds"""
+        loops = list(self._loops.values())
+        for loop in loops:
+            loop.cancel()
+        await asyncio.gather(*loops, return_exceptions=True)
+        self._loops.clear()
+        running = [run for task in self.tasks for run in task.running]
+        if running:
+            _, pending = await asyncio.wait(running, timeout=timeout)
+            for run in pending:
+                run.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+
+    def _lock_key(self, task: ScheduledTask) -> str:
+        return f"{self.prefix}{task.name}:lock"
+
+    async def _claim(
+        self, task: ScheduledTask, at: float, ttl: float
+    ) -> Tuple[bool, Optional[str]]:
+        """(run it here, token of the task lock held for the run)"""
+        if self.redis is None:
+            return True, None
+        try:
+            key = f"{self.prefix}{task.name}:{int(at)}"
+            px = max(1000, int(ttl * 1000))
+            if not await self.redis.set(key, "1", nx=True, px=px):
+                return False, None
+            if task.overlap:
+                return True, None
+            token = uuid.uuid4().hex
+            px = max(1000, int(self.lock_ttl * 1000))
+            if not await self.redis.set(self._lock_key(task), token, nx=True, px=px):
+                warning(f"schedule: {task.name} is running on another worker, skipped.")
+                return False, None
+            return True, token
+        except Exception as e:
+            warning(f"schedule: redis failed, {task.name} skipped: {e}")
+            return False, None
+
+    async def _loop(self, app, task: ScheduledTask):
+        at = task.next_run(time.time())
+        while True:
+            await asyncio.sleep(max(0, at - time.time()))
+            following = task.next_run(max(time.time(), at))
+            if task.running and not task.overlap:
+                warning(f"schedule: {task.name} is still running, skipped.")
+            else:
+                elected, token = await self._claim(task, at, following - at)
+                if elected:
+                    run = asyncio.create_task(self._run(app, task, token))
+                    task.running.add(run)
+                    run.add_done_callback(task.running.discard)
+            at = following
+
+    async def _keep_lock(self, task: ScheduledTask, token: str):
+        key = self._lock_key(task)
+        px = max(1000, int(self.lock_ttl * 1000))
+        while True:
+            await asyncio.sleep(self.lock_ttl / 3)
+            try:
+                if not await self.redis.eval(_REFRESH, 1, key, token, px):
+                    warning(f"schedule: the lock of {task.name} expired.")
+                    return
+            except Exception as e:
+                warning(f"schedule: refreshing the lock of {task.name} failed: {e}")
+
+    async def _run(self, app, task: ScheduledTask, token: Optional[str] = None):
+        keeper = None
+        if token is not None:
+            keeper = asyncio.create_task(self._keep_lock(task, token))
+        try:
+            if task.pass_app:
+                await task.func(app)
+            else:
+                await task.func()
+        except Exception as e:
+            error(f"schedule: {task.name} failed: {e}")
+        finally:
+            if keeper is not None:
+                keeper.cancel()
+                await asyncio.gather(keeper, return_exceptions=True)
+                try:
+                    await self.redis.eval(_RELEASE, 1, self._lock_key(task), token)
+                except Exception as e:
+                    warning(f"schedule: releasing the lock of {task.name} failed: {e}")
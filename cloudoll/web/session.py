@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+__author__ = "Qiu / smallerqiu@gmail.com"
+
+import types
+from typing import Optional
+
+from aiohttp.web_request import Request
+from aiohttp_session import SESSION_KEY, STORAGE_KEY, Session, get_session
+from aiohttp_session.cookie_storage import EncryptedCookieStorage
+from cryptography.fernet import InvalidToken
+
+from cloudoll.logging import warning
+
+
+class CookieStorage(EncryptedCookieStorage):
+    """
+    The encrypted cookie storage of the app. Loading it needs no I/O, so
+    `request.session` decrypts the cookie on first use only.
+    """
+
+    def load_now(self, request: Request) -> Session:
+        cookie = self.load_cookie(request)
+        if cookie is not None:
+            try:
+                data = self._fernet.decrypt(cookie.encode("utf-8"), ttl=self.max_age)
+                return Session(
+                    None,
+                    data=self._decoder(data.decode("utf-8")),
+                    new=False,
+                    max_age=self.max_age,
+                )
+            except InvalidToken:
+                warning("Cannot decrypt the session cookie, starting a new session.")
+        return Session(None, data=None, new=True, max_age=self.max_age)
+
+    async def load_session(self, request: Request) -> Session:
+        return self.load_now(request)
+
+
+def reads_session(func) -> bool:
+    """
+    Whether the code of `func`, its nested functions included, reads an
+    attribute named `session`, e.g. `ctx.session["uid"]`.
+    """
+    func = getattr(func, "__func__", func)
+    code = getattr(func, "__code__", None)
+    if code is None:
+        # a View class, or a callable object
+        call = getattr(func, "__call__", None)
+        code = getattr(getattr(call, "__func__", call), "__code__", None)
+        if code is None:
+            return True
+    stack = [code]
+    while stack:
+        code = stack.pop()
+        if "session" in code.co_names:
+            return True
+        stack.extend(c for c in code.co_consts if isinstance(c, types.CodeType))
+    return False
+
+
+class LazySession(object):
+    """
+    `request.session`, loaded from the storage on first use only. The
+    session middleware saves it back only when it was changed.
+
+    The cookie storage is decrypted on first access. Redis / memcached need
+    a round trip: `await ctx.session` loads them, routes whose handler
+    reads `ctx.session`, or declared with `session=True`, get it loaded
+    before the handler runs.
+    """
+
+    __slots__ = ("_request", "_session")
+
+    def __init__(self, request: Request):
+        self._request = request
+        self._session: Optional[Session] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._session is not None or SESSION_KEY in self._request
+
+    def _get(self) -> Session:
+        if self._session is None:
+            session = self._request.get(SESSION_KEY)
+            if session is None:
+                storage = self._request[STORAGE_KEY]
+                if not isinstance(storage, CookieStorage):
+                    raise RuntimeError(
+                        "The session isn't loaded, `await ctx.session` first "
+                        "or declare the route with session=True."
+                    )
+                session = storage.load_now(self._request)
+                self._request[SESSION_KEY] = session
+            self._session = session
+        return self._session
+
+    async def load(self) -> Session:
+        if self._session is None and not isinstance(
+            self._request.get(STORAGE_KEY), CookieStorage
+        ):
+            self._session = await get_session(self._request)
+        return self._get()
+
+    def __await__(self):
+        return self.load().__await__()
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+    def __getitem__(self, key):
+        return self._get()[key]
+
+    def __setitem__(self, key, value):
+        self._get()[key] = value
+
+    def __delitem__(self, key):
+        del self._get()[key]
+
+    def __contains__(self, key):
+        return key in self._get()
+
+    def __iter__(self):
+        return iter(self._get())
+
+    def __len__(self):
+        return len(self._get())
+
+    def __repr__(self):
+        if not self.loaded:
+            return "<LazySession not loaded>"
+        return repr(self._get())
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Server-Sent Events.
+
+A single stream, written by the handler:
+
+    @get("/progress", sa_ignore=True)
+    async def progress(ctx):
+        async with EventStream(ctx) as stream:
+            for x in range(10):
+                await stream.send({"done": x}, event="progress")
+        return stream.response
+
+A client leaving raises ConnectionError from `send`, which ends the
+`async with` block like its last event did.
+
+A channel, published to from anywhere and followed by many clients:
+
+    @get("/news", sa_ignore=True)
+    async def news(ctx):
+        return await ctx.app.events("news").subscribe(ctx)
+
+    await app.events("news").publish({"title": "..."}, event="news")
+
+An event is framed once and queued to every subscriber. The last `buffer`
+events are kept, so a client reconnecting with `Last-Event-ID` gets only
+the ones it missed. One timer per channel sends the heartbeat comments;
+idle subscribers just wait on their queue. A client whose queue fills up
+or whose socket takes longer than `write_timeout` to accept a write is
+dropped.
+
+Channels live in the process: without `sse.redis` an event reaches the
+clients of the worker it was published on only. With it the ids come from
+a redis counter shared by the workers and every event is published on a
+redis channel, so each worker delivers it, and buffers it for replay, too.
+"""
+
+__author__ = "Qiu / smallerqiu@gmail.com"
+
+import asyncio
+import json
+import os
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from aiohttp import hdrs
+from aiohttp.web_request import Request
+from aiohttp.web_response import StreamResponse
+
+from cloudoll.logging import info, warning
+from cloudoll.web import encoder
+
+HEARTBEAT = b": ping\n\n"
+
+# the shared counter never falls behind the clock, ids keep growing after
+# redis lost it the way the ids of a single process do
+_NEXT_ID = """
+local id = redis.call('INCR', KEYS[1])
+local now = tonumber(ARGV[1])
+if id < now then
+    redis.call('SET', KEYS[1], ARGV[1])
+    id = now
+end
+return id
+"""
+
+
+def format_event(
+    data: Any,
+    event: Optional[str] = None,
+    id: Optional[str] = None,
+    retry: Optional[int] = None,
+) -> bytes:
+    """one event frame, data that is not str / bytes is sent as json"""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    elif not isinstance(data, (bytes, bytearray)):
+        data = encoder.dumps(data)
+    lines = []
+    if event is not None:
+        lines.append(b"event: " + event.encode("utf-8"))
+    if id is not None:
+        lines.append(b"id: " + str(id).encode("utf-8"))
+    if retry is not None:
+        lines.append(b"retry: %d" % retry)
+    for line in bytes(data).splitlines() or (b"",):
+        lines.append(b"data: " + line)
+    return b"\n".join(lines) + b"\n\n"
+
+
+class EventStream(object):
+    """
+    A text/event-stream response.
+
+    :params write_timeout seconds a write may wait on the client
+    :params retry reconnect delay the client should use, ms
+    :params max_queue events queued for a slow client before it is dropped
+    """
+
+    def __init__(
+        self,
+        request: Request,
+        write_timeout: float = 10,
+        retry: Optional[int] = None,
+        max_queue: int = 256,
+    ):
+        self.request = request
+        self.write_timeout = write_timeout
+        self.retry = retry
+        self.max_queue = max_queue
+        self.response = StreamResponse(
+            headers={
+                hdrs.CONTENT_TYPE: "text/event-stream",
+                hdrs.CACHE_CONTROL: "no-cache",
+                # nginx would buffer the stream otherwise
+                "X-Accel-Buffering": "no",
+            }
+        )
+        self.closed = False
+        self._queue: "deque[Optional[bytes]]" = deque()
+        self._ready = asyncio.Event()
+
+    @property
+    def last_event_id(self) -> Optional[str]:
+        return self.request.headers.get("Last-Event-ID")
+
+    async def prepare(self) -> "EventStream":
+        await self.response.prepare(self.request)
+        if self.retry is not None:
+            await self.write(b"retry: %d\n\n" % self.retry)
+        return self
+
+    async def __aenter__(self) -> "EventStream":
+        return await self.prepare()
+
+    async def __aexit__(self, *exc):
+        if exc[0] is not None and issubclass(exc[0], ConnectionError):
+            # the client went away, the stream just ends
+            self.closed = True
+            return True
+        if exc[0] is None and not self.closed:
+            await self.response.write_eof()
+
+    async def write(self, frame: bytes):
+        """write with a deadline, a stalled client is dropped"""
+        if self.closed:
+            raise ConnectionResetError("The event stream is closed.")
+        try:
+            await asyncio.wait_for(self.response.write(frame), self.write_timeout)
+        except asyncio.TimeoutError:
+            self.drop("write timeout")
+            raise ConnectionResetError("The client stopped reading.")
+        except ConnectionError:
+            self.closed = True
+            raise
+
+    async def send(
+        self,
+        data: Any,
+        event: Optional[str] = None,
+        id: Optional[str] = None,
+    ):
+        await self.write(format_event(data, event, id))
+
+    def drop(self, reason: str):
+        if self.closed:
+            return
+        warning(f"event stream of {self.request.remote} dropped: {reason}")
+        self.closed = True
+        transport = self.request.transport
+        if transport is not None:
+            transport.close()
+
+    def push(self, frame: Optional[bytes], force: bool = False) -> bool:
+        """queue a frame for `run`, None ends the stream"""
+        if self.closed:
+            return False
+        if not force and frame is not None and len(self._queue) >= self.max_queue:
+            self.drop("queue full")
+            self._queue.append(None)
+            self._ready.set()
+            return False
+        self._queue.append(frame)
+        self._ready.set()
+        return True
+
+    @property
+    def idle(self) -> bool:
+        return not self._queue
+
+    async def run(self):
+        """write queued frames until the stream ends or the client leaves"""
+        while True:
+            await self._ready.wait()
+            while self._queue:
+                frame = self._queue.popleft()
+                if frame is None or self.closed:
+                    return
+                try:
+                    await self.write(frame)
+                except ConnectionError:
+                    return
+            self._ready.clear()
+
+
+class EventChannel(object):
+    """
+    :params name of the channel
+    :params buffer events kept for clients reconnecting with Last-Event-ID
+    :params heartbeat seconds between the comments keeping proxies from
+        closing idle streams
+    :params bridge the `EventChannels` sharing the events between workers
+    """
+
+    def __init__(
+        self,
+        name: str,
+        buffer: int = 1000,
+        heartbeat: float = 15,
+        bridge: Optional["EventChannels"] = None,
+    ):
+        self.name = name
+        self.heartbeat = heartbeat
+        self.bridge = bridge
+        self._buffer: "deque[tuple]" = deque(maxlen=buffer)
+        # ids keep growing across restarts, an old Last-Event-ID replays all
+        self._next_id = int(time.time() * 1000)
+        self._streams = set()
+        self._timer: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self._streams)
+
+    async def publish(self, data: Any, event: Optional[str] = None) -> int:
+        """Send an event to every subscriber, on every worker, returns its id."""
+        if self.bridge is not None and self.bridge.redis is not None:
+            event_id = await self.bridge.next_id(self)
+        else:
+            event_id = self._next_id
+            self._next_id += 1
+        frame = format_event(data, event, event_id)
+        self._deliver(event_id, frame)
+        if self.bridge is not None:
+            await self.bridge.publish(self.name, event_id, frame)
+        return event_id
+
+    def _deliver(self, event_id: int, frame: bytes):
+        self._buffer.append((event_id, frame))
+        for stream in list(self._streams):
+            stream.push(frame)
+
+    def _missed(self, last_event_id: Optional[str]):
+        if last_event_id is None:
+            return
+        try:
+            last = int(last_event_id)
+        except ValueError:
+            return
+        for event_id, frame in self._buffer:
+            if event_id > last:
+                yield frame
+
+    async def subscribe(self, request: Request, **kw) -> StreamResponse:
+        """
+        Stream the channel to the client until it leaves or shutdown, the
+        keywords are those of `EventStream`.
+        """
+        stream = EventStream(request, **kw)
+        await stream.prepare()
+        for frame in self._missed(stream.last_event_id):
+            stream.push(frame, force=True)
+        self._streams.add(stream)
+        if self._timer is None:
+            self._timer = asyncio.create_task(self._beat())
+        try:
+            await stream.run()
+        finally:
+            self._streams.discard(stream)
+        return stream.response
+
+    async def _beat(self):
+        try:
+            while self._streams:
+                await asyncio.sleep(self.heartbeat)
+                for stream in list(self._streams):
+                    if stream.idle:
+                        stream.push(HEARTBEAT)
+        finally:
+            self._timer = None
+
+    async def close(self):
+        """end every stream, on the app's shutdown"""
+        for stream in list(self._streams):
+            stream.push(None, force=True)
+        if self._timer is not None:
+            self._timer.cancel()
+
+
+class EventChannels(object):
+    """
+    The channels of an app by name, `app.events(name)`.
+
+    :params channel redis channel of the events between workers, also the
+        prefix of the id counters
+    """
+
+    def __init__(self):
+        self.channels: Dict[str, EventChannel] = {}
+        self.redis = None
+        # events published by this process are not delivered twice
+        self._origin = f"{os.urandom(4).hex()}:{os.getpid()}"
+        self._listener: Optional[asyncio.Task] = None
+        self.configure()
+
+    def configure(
+        self,
+        buffer: int = 1000,
+        heartbeat: float = 15,
+        channel: str = "cloudoll:sse",
+    ):
+        self.buffer = int(buffer)
+        self.heartbeat = float(heartbeat)
+        self.channel = channel
+
+    def __call__(self, name: str) -> EventChannel:
+        channel = self.channels.get(name)
+        if channel is None:
+            channel = self.channels[name] = EventChannel(
+                name, self.buffer, self.heartbeat, self
+            )
+        return channel
+
+    async def next_id(self, channel: EventChannel) -> int:
+        """the next id of `channel` from the shared counter, local without redis"""
+        try:
+            event_id = int(
+                await self.redis.eval(
+                    _NEXT_ID,
+                    1,
+                    f"{self.channel}:{channel.name}:id",
+                    int(time.time() * 1000),
+                )
+            )
+        except Exception as e:
+            warning(f"sse: redis id failed, using a local one: {e}")
+            event_id = channel._next_id
+        channel._next_id = max(channel._next_id, event_id + 1)
+        return event_id
+
+    async def publish(self, name: str, event_id: int, frame: bytes):
+        if self.redis is None:
+            return
+        header = {"o": self._origin, "c": name, "i": event_id}
+        try:
+            await self.redis.publish(
+                self.channel, encoder.dumps(header) + b"\n" + frame
+            )
+        except Exception as e:
+            warning(f"sse: redis publish failed: {e}")
+
+    async def start(self):
+        if self.redis is not None:
+            self._listener = asyncio.create_task(self._listen())
+            info(f"sse: listening on {self.channel}.")
+
+    async def _listen(self):
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                while True:
+                    msg = await pubsub.get_message(
+                        ignore_subscribe_messages=True, timeout=1.0
+                    )
+                    if msg is not None:
+                        self._on_message(msg["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                warning(f"sse: redis failed, resubscribing: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    def _on_message(self, raw):
+        if isinstance(raw, str):
+            raw = raw.encode("utf-8")
+        head, _, frame = raw.partition(b"\n")
+        header = json.loads(head)
+        if header["o"] == self._origin:
+            return
+        self(header["c"])._deliver(header["i"], frame)
+
+    async def close(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        await asyncio.gather(*(c.close() for c in self.channels.values()))
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Static files without a proxy in front.
+
+Small files are kept in memory, checked against their mtime at most once a
+`check_interval`, and compressed once per encoding. Bigger files go through
+aiohttp's FileResponse, which uses sendfile. Precompressed app.js.br /
+app.js.gz siblings are preferred by both, whatever the size of the file. Both answer Range,
+If-None-Match and If-Modified-Since. Fingerprinted names like
+app.3f2a9c1b.js are cached by browsers for a year.
+"""
+
+__author__ = "Qiu / smallerqiu@gmail.com"
+
+import asyncio
+import mimetypes
+import os
+import re
+import stat
+import time
+from collections import OrderedDict
+from email.utils import formatdate
+from typing import Dict, Iterable, Optional
+
+from aiohttp import hdrs
+from aiohttp.web import FileResponse, HTTPForbidden, HTTPNotFound, Response
+from aiohttp.web_exceptions import HTTPRequestRangeNotSatisfiable
+from aiohttp.web_request import Request
+
+from cloudoll.web.compress import COMPRESSORS, _compressible, negotiate
+
+# a hex hash of 8+ chars before the extension: app.3f2a9c1b.js, app-3f2a9c1b.css
+FINGERPRINT = re.compile(r"[.-][0-9a-f]{8,}\.[^./]+$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+# precompressed siblings, in FileResponse's order of preference
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+REVALIDATE = "no-cache"
+
+
+class CachedFile(object):
+    __slots__ = (
+        "body",
+        "mtime_ns",
+        "size",
+        "etag",
+        "last_modified",
+        "mtime",
+        "content_type",
+        "checked",
+        "encoded",
+        "precompressed",
+    )
+
+    def __init__(self, body: bytes, st: os.stat_result, content_type: str):
+        self.body = body
+        self.mtime_ns = st.st_mtime_ns
+        self.size = st.st_size
+        # the same etag FileResponse sends for big files
+        self.etag = f"{st.st_mtime_ns:x}-{st.st_size:x}"
+        self.mtime = st.st_mtime
+        self.last_modified = formatdate(st.st_mtime, usegmt=True)
+        self.content_type = content_type
+        self.checked = time.monotonic()
+        # coding -> compressed body, None when it doesn't get smaller
+        self.encoded: Dict[str, Optional[bytes]] = {}
+        # coding -> body of the .br / .gz sibling
+        self.precompressed: Dict[str, bytes] = {}
+
+    @property
+    def weight(self) -> int:
+        return self.size + sum(len(b) for b in self.precompressed.values())
+
+
+class StaticFiles(object):
+    """
+    GET handler of `prefix/{filename:.*}`.
+
+    :params directory the root of the files
+    :params cache_size bytes of small files kept in memory
+    :params cache_file_size files up to this size are cached
+    :params check_interval seconds before a cached file is stat()ed again
+    :params follow_symlinks serve symlinks pointing out of `directory`
+    :params compress_level level of the compressed copies of cached files
+    :params encodings server preference of the compressed copies
+    """
+
+    def __init__(
+        self,
+        directory,
+        cache_size: int = 32 * 1024 * 1024,
+        cache_file_size: int = 256 * 1024,
+        check_interval: float = 1,
+        follow_symlinks: bool = False,
+        compress_level: int = 6,
+        encodings: Iterable[str] = ("zstd", "br", "gzip"),
+    ):
+        self.root = os.path.realpath(directory)
+        self.cache_size = cache_size
+        self.cache_file_size = cache_file_size
+        self.check_interval = check_interval
+        self.follow_symlinks = follow_symlinks
+        self.compress_level = compress_level
+        self.encodings = tuple(e for e in encodings if e in COMPRESSORS)
+        self._cache: "OrderedDict[str, CachedFile]" = OrderedDict()
+        self._cached_bytes = 0
+
+    def _resolve(self, filename: str) -> str:
+        if not filename or "\\" in filename or "\x00" in filename:
+            raise HTTPNotFound()
+        path = os.path.normpath(os.path.join(self.root, filename))
+        if not path.startswith(self.root + os.sep):
+            raise HTTPForbidden()
+        return path
+
+    def _load(self, path: str):
+        """(CachedFile or None for big files, stat), runs in a thread"""
+        if not self.follow_symlinks:
+            real = os.path.realpath(path)
+            if real != self.root and not real.startswith(self.root + os.sep):
+                raise HTTPForbidden()
+        try:
+            st = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            raise HTTPNotFound()
+        except PermissionError:
+            raise HTTPForbidden()
+        if not stat.S_ISREG(st.st_mode):
+            raise HTTPNotFound()
+        if st.st_size > self.cache_file_size:
+            return None, st
+        with open(path, "rb") as f:
+            body = f.read()
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        entry = CachedFile(body, st, content_type)
+        for coding, extension in PRECOMPRESSED:
+            try:
+                with open(path + extension, "rb") as f:
+                    entry.precompressed[coding] = f.read()
+            except OSError:
+                pass
+        return entry, st
+
+    def _remember(self, path: str, entry: CachedFile):
+        self._forget(path)
+        self._cache[path] = entry
+        self._cached_bytes += entry.weight
+        while self._cached_bytes > self.cache_size and self._cache:
+            _, evicted = self._cache.popitem(last=False)
+            self._cached_bytes -= evicted.weight
+
+    def _forget(self, path: str):
+        entry = self._cache.pop(path, None)
+        if entry is not None:
+            self._cached_bytes -= entry.weight
+
+    async def _entry(self, path: str) -> Optional[CachedFile]:
+        loop = asyncio.get_running_loop()
+        entry = self._cache.get(path)
+        if entry is not None:
+            now = time.monotonic()
+            if now - entry.checked < self.check_interval:
+                self._cache.move_to_end(path)
+                return entry
+            try:
+                st = await loop.run_in_executor(None, os.stat, path)
+            except OSError:
+                st = None
+            if st is not None and st.st_mtime_ns == entry.mtime_ns:
+                if st.st_size == entry.size:
+                    entry.checked = now
+                    self._cache.move_to_end(path)
+                    return entry
+            self._forget(path)
+        entry, _ = await loop.run_in_executor(None, self._load, path)
+        if entry is not None:
+            self._remember(path, entry)
+        return entry
+
+    async def _encoded(self, entry: CachedFile, coding: str) -> Optional[bytes]:
+        if coding not in entry.encoded:
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(
+                None, COMPRESSORS[coding], entry.body, self.compress_level
+            )
+            entry.encoded[coding] = data if len(data) < entry.size else None
+        return entry.encoded[coding]
+
+    def _headers(self, filename: str, entry: CachedFile = None) -> dict:
+        cache_control = IMMUTABLE if FINGERPRINT.search(filename) else REVALIDATE
+        headers = {hdrs.CACHE_CONTROL: cache_control}
+        if entry is not None:
+            headers[hdrs.ETAG] = f'"{entry.etag}"'
+            headers[hdrs.LAST_MODIFIED] = entry.last_modified
+            headers[hdrs.ACCEPT_RANGES] = "bytes"
+        return headers
+
+    def _not_modified(self, request: Request, entry: CachedFile) -> bool:
+        if_none_match = request.if_none_match
+        if if_none_match:
+            return any(tag.value in (entry.etag, "*") for tag in if_none_match)
+        since = request.if_modified_since
+        return since is not None and int(entry.mtime) <= since.timestamp()
+
+    async def __call__(self, request: Request):
+        filename = request.match_info["filename"]
+        path = self._resolve(filename)
+        entry = await self._entry(path)
+        if entry is None:
+            # big file, sendfile with range and conditional support
+            return FileResponse(path, headers=self._headers(filename))
+
+        headers = self._headers(filename, entry)
+        if self._not_modified(request, entry):
+            return Response(status=304, headers=headers)
+
+        if_range = request.headers.get(hdrs.IF_RANGE)
+        if hdrs.RANGE in request.headers and (
+            if_range is None or if_range in (f'"{entry.etag}"', entry.last_modified)
+        ):
+            try:
+                rng = request.http_range
+            except ValueError:
+                rng = slice(None)
+            start, stop, _ = rng.indices(entry.size)
+            if rng.start is not None or rng.stop is not None:
+                if start >= stop:
+                    raise HTTPRequestRangeNotSatisfiable(
+                        headers={hdrs.CONTENT_RANGE: f"bytes */{entry.size}"}
+                    )
+                headers[hdrs.CONTENT_RANGE] = f"bytes {start}-{stop - 1}/{entry.size}"
+                return Response(
+                    status=206,
+                    body=entry.body[start:stop],
+                    content_type=entry.content_type,
+                    headers=headers,
+                )
+
+        body = entry.body
+        accept_encoding = request.headers.get(hdrs.ACCEPT_ENCODING)
+        if entry.precompressed:
+            # the sibling a big file would be sent from, before compressing
+            headers[hdrs.VARY] = hdrs.ACCEPT_ENCODING
+            coding = negotiate(accept_encoding, tuple(entry.precompressed))
+            if coding is not None:
+                headers[hdrs.CONTENT_ENCODING] = coding
+                headers[hdrs.ETAG] = f'W/"{entry.etag}"'
+                return Response(
+                    body=entry.precompressed[coding],
+                    content_type=entry.content_type,
+                    headers=headers,
+                )
+        if self.encodings and entry.size >= 256 and _compressible(entry.content_type):
+            headers[hdrs.VARY] = hdrs.ACCEPT_ENCODING
+            coding = negotiate(accept_encoding, self.encodings)
+            if coding is not None:
+                encoded = await self._encoded(entry, coding)
+                if encoded is not None:
+                    body = encoded
+                    headers[hdrs.CONTENT_ENCODING] = coding
+                    # the same representation, weak for the compressed bytes
+                    headers[hdrs.ETAG] = f'W/"{entry.etag}"'
+        return Response(body=body, content_type=entry.content_type, headers=headers)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Jinja templates of the `templates` directory.
+
+Templates are compiled once at startup into a bytecode cache on disk, so
+the next workers load them without parsing. `render_view` renders on the
+loop until a template's output grows over `thread_size`, then in a thread,
+or with `render_async` when `enable_async` is set.
+
+Parts of a page can be cached for a number of seconds:
+
+    {% cache "sidebar-" ~ user.id, 300 %}
+        ... expensive ...
+    {% endcache %}
+"""
+
+__author__ = "Qiu / smallerqiu@gmail.com"
+
+import asyncio
+import inspect
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Union
+
+from aiohttp.web import Response
+from jinja2 import (
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    TemplateError,
+    nodes,
+)
+from jinja2.ext import Extension
+
+from cloudoll.logging import info, warning
+from cloudoll.web.cache import LRUCache
+from cloudoll.web.etag import make_etag
+
+
+class FragmentCacheExtension(Extension):
+    """`{% cache key, ttl %}...{% endcache %}`, ttl in seconds, 300 by default"""
+
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=LRUCache(1024))
+        self._lock = threading.Lock()
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        # fragments of different templates never share a key
+        args = [nodes.Const(parser.name or ""), parser.parse_expression()]
+        if parser.stream.skip_if("comma"):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(300))
+        body = parser.parse_statements(["name:endcache"], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_cached", args), [], [], body
+        ).set_lineno(lineno)
+
+    def _cached(self, template, key, ttl, caller):
+        cache = self.environment.fragment_cache
+        key = f"{template}:{key}"
+        with self._lock:
+            body = cache.get(key)
+        if body is not None:
+            return body
+
+        def store(body):
+            with self._lock:
+                cache.set(key, body, ttl)
+            return body
+
+        body = caller()
+        if inspect.isawaitable(body):
+            # enable_async, the caller renders asynchronously
+
+            async def finish():
+                return store(await body)
+
+            return finish()
+        return store(body)
+
+
+class Templates(object):
+    """
+    :params directory of the templates
+    :params enable_async render with jinja's async mode, templates may then
+        await coroutines
+    :params bytecode_cache True for the default temp directory, a path, or
+        False
+    :params thread_size templates whose last output was this many chars or
+        more render in a thread
+    :params fragment_cache entries of `{% cache %}` fragments kept
+    :params auto_reload check the templates' mtime on every render
+    :params precompile compile every template at startup
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        enable_async: bool = False,
+        bytecode_cache: Union[bool, str] = True,
+        thread_size: int = 64 * 1024,
+        fragment_cache: int = 1024,
+        auto_reload: bool = True,
+        precompile: bool = True,
+    ):
+        # code compiled for async mode doesn't run in sync mode, and back
+        pattern = "__jinja2_%s.async.cache" if enable_async else "__jinja2_%s.cache"
+        if bytecode_cache is True:
+            bcc = FileSystemBytecodeCache(pattern=pattern)
+        elif bytecode_cache:
+            Path(bytecode_cache).mkdir(parents=True, exist_ok=True)
+            bcc = FileSystemBytecodeCache(str(bytecode_cache), pattern)
+        else:
+            bcc = None
+        self.env = Environment(
+            loader=FileSystemLoader(directory),
+            autoescape=True,
+            enable_async=enable_async,
+            bytecode_cache=bcc,
+            auto_reload=auto_reload,
+            extensions=[FragmentCacheExtension],
+        )
+        self.env.fragment_cache.max_entries = int(fragment_cache)
+        self.enable_async = enable_async
+        self.thread_size = int(thread_size)
+        self.precompile_on_startup = precompile
+        # output size of the last render of each template
+        self._sizes: Dict[str, int] = {}
+
+    def precompile(self) -> int:
+        """load every template, filling the bytecode cache"""
+        count = 0
+        for name in self.env.list_templates():
+            try:
+                self.env.get_template(name)
+                count += 1
+            except TemplateError as e:
+                warning(f"template {name}: {e}")
+        return count
+
+    async def startup(self):
+        if self.precompile_on_startup:
+            loop = asyncio.get_running_loop()
+            count = await loop.run_in_executor(None, self.precompile)
+            info(f"templates: {count} compiled.")
+
+    async def render(self, name: str, *args, **kw) -> str:
+        template = self.env.get_template(name)
+        if self.enable_async:
+            return await template.render_async(*args, **kw)
+        if self._sizes.get(name, 0) >= self.thread_size:
+            loop = asyncio.get_running_loop()
+            body = await loop.run_in_executor(
+                None, lambda: template.render(*args, **kw)
+            )
+        else:
+            body = template.render(*args, **kw)
+        self._sizes[name] = len(body)
+        return body
+
+
+class TemplateResponse(Response):
+    """The response of `render_view`, rendered before it is sent."""
+
+    def __init__(
+        self,
+        templates: Optional[Templates],
+        template: str,
+        args=(),
+        context=None,
+        etag=None,
+        **kw,
+    ):
+        super().__init__(**kw)
+        self.content_type = "text/html;charset=utf-8"
+        if etag is not None:
+            self.etag = make_etag(etag)
+        self._templates = templates
+        self._pending = (template, args, context or {})
+
+    async def render(self):
+        if self._pending is None:
+            return
+        template, args, context = self._pending
+        self._pending = None
+        if self._templates is not None:
+            body = await self._templates.render(template, *args, **context)
+            self.body = body.encode("utf-8")
+
+    async def prepare(self, request):
+        await self.render()
+        return await super().prepare(request)
@@ -0,0 +1,80 @@
+import asyncio
+
+from cloudoll.web.concurrency import ConcurrencyLimit
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_acquire_up_to_the_limit_then_shed():
+    async def main():
+        limit = ConcurrencyLimit(2)
+        assert await limit.acquire()
+        assert await limit.acquire()
+        assert not await limit.acquire()
+        limit.release()
+        assert limit.in_flight == 1
+
+    run(main())
+
+
+def test_release_hands_the_slot_to_a_waiter():
+    async def main():
+        limit = ConcurrencyLimit(1, queue=1, timeout=1)
+        assert await limit.acquire()
+        waiting = asyncio.ensure_future(limit.acquire())
+        await asyncio.sleep(0)
+        assert limit.waiting == 1
+        limit.release()
+        assert await waiting
+        assert limit.in_flight == 1
+        limit.release()
+        assert limit.in_flight == 0
+
+    run(main())
+
+
+def test_queue_times_out():
+    async def main():
+        limit = ConcurrencyLimit(1, queue=1, timeout=0.01)
+        assert await limit.acquire()
+        assert not await limit.acquire()
+        assert limit.waiting == 0
+        assert limit.in_flight == 1
+
+    run(main())
+
+
+def test_a_slot_handed_over_as_the_wait_times_out_is_given_back(monkeypatch):
+    limit = ConcurrencyLimit(1, queue=1)
+
+    async def late_wait_for(waiter, timeout):
+        # the holder released in the same iteration the wait timed out
+        limit.release()
+        assert waiter.done()
+        raise asyncio.TimeoutError()
+
+    async def main():
+        assert await limit.acquire()
+        monkeypatch.setattr(asyncio, "wait_for", late_wait_for)
+        assert not await limit.acquire()
+        monkeypatch.undo()
+        assert limit.in_flight == 0
+
+    run(main())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def main():
+        limit = ConcurrencyLimit(1, queue=1, timeout=1)
+        assert await limit.acquire()
+        waiting = asyncio.ensure_future(limit.acquire())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert limit.waiting == 0
+        limit.release()
+        assert limit.in_flight == 0
+
+    run(main())
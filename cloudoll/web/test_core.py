@@ -0,0 +1,77 @@
+import asyncio
+import json
+from functools import partial
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer, make_mocked_request
+
+from cloudoll.utils.common import Object
+from cloudoll.web.core import DispatchPlan, LazyRequest, _render_result
+
+JSON = {"Content-Type": "application/json"}
+
+
+def serve(*handlers):
+    """the app's dispatch of `handlers` at /0, /1... with lazy requests"""
+    app = web.Application()
+    app._make_request = partial(app._make_request, _cls=LazyRequest)
+    for index, fn in enumerate(handlers):
+        plan = DispatchPlan(fn)
+
+        async def handle(request, fn=fn, plan=plan):
+            return await _render_result(request, fn, plan)
+
+        app.router.add_post(f"/{index}", handle)
+    return TestClient(TestServer(app))
+
+
+def test_body_and_qs_are_plain_objects_decoded_on_first_access():
+    seen = []
+
+    async def ignores(ctx):
+        seen.append(dict(ctx.__dict__))
+        return {"ok": 1}
+
+    async def echoes(ctx):
+        assert type(ctx.body) is Object and type(ctx.qs) is Object
+        return {"body": ctx.body, "qs": ctx.qs, "a": ctx.body.a}
+
+    async def main():
+        async with serve(ignores, echoes) as client:
+            # never parsed, the broken json goes unnoticed
+            response = await client.post("/0", data="{", headers=JSON)
+            assert response.status == 200
+            response = await client.post("/1?x=1&x=2", json={"a": [1]})
+            return await response.json()
+
+    data = asyncio.run(main())
+    assert data["body"] == {"a": [1]} and data["a"] == [1]
+    assert data["qs"] == {"x": "1"}
+    assert "_body" not in seen[0] and "_qs" not in seen[0]
+
+
+def test_a_mocked_request_is_decoded_up_front():
+    async def handler(ctx):
+        return {"qs": ctx.qs}
+
+    request = make_mocked_request("GET", "/?a=1")
+    response = asyncio.run(_render_result(request, handler))
+    assert json.loads(response.body)["qs"] == {"a": "1"}
+    assert type(request.qs) is Object
+
+
+
+def test_plan_loads_the_session_for_handlers_reading_it():
+    async def reads(ctx):
+        return ctx.session["uid"]
+
+    async def ignores(ctx):
+        return {}
+
+    class Page(object):
+        async def get(self):
+            return self.request.session["uid"]
+
+    assert DispatchPlan(reads).session
+    assert not DispatchPlan(ignores).session
+    assert DispatchPlan(Page.get).session
@@ -0,0 +1,79 @@
+import asyncio
+
+from aiohttp.test_utils import make_mocked_request
+from aiohttp.web import Response
+
+from cloudoll.web.cache import CachedResponse, CachePolicy, ResponseCache
+from cloudoll.web.core import render_json
+from cloudoll.web.etag import conditional, make_etag
+
+
+def request(if_none_match=None, method="GET"):
+    headers = {"If-None-Match": if_none_match} if if_none_match else {}
+    return make_mocked_request(method, "/", headers=headers)
+
+
+def test_make_etag_is_stable():
+    assert make_etag(b"abc") == make_etag("abc")
+    assert make_etag(b"abc") != make_etag(b"abd")
+    assert len(make_etag(42)) == 32
+
+
+def test_conditional_hashes_the_body():
+    response = conditional(request(), Response(body=b"hello"))
+    assert response.status == 200
+    assert response.etag.value == make_etag(b"hello")
+
+
+def test_conditional_answers_304():
+    etag = make_etag(b"hello")
+    response = conditional(request(f'"{etag}"'), Response(body=b"hello"))
+    assert response.status == 304
+    assert response.headers["ETag"] == f'"{etag}"'
+    assert conditional(request("*"), Response(body=b"hello")).status == 304
+
+
+def test_conditional_skips_unsafe_methods_and_errors():
+    etag = make_etag(b"hello")
+    response = conditional(request(f'"{etag}"', "POST"), Response(body=b"hello"))
+    assert response.status == 200
+    response = conditional(request(), Response(body=b"x", status=404))
+    assert response.etag is None
+    response = conditional(request(), Response(body=b"x"), compute=False)
+    assert response.etag is None
+
+
+def test_render_json_etag_ignores_the_timestamp():
+    first = conditional(request(), render_json({"a": 1}))
+    second = conditional(request(), render_json({"a": 1}))
+    assert first.etag == second.etag
+
+
+def test_cached_response_keeps_the_etag():
+    cache = ResponseCache()
+    policy = CachePolicy(ttl=10, redis=False)
+
+    async def compute():
+        return render_json({"a": 1})
+
+    async def fetch(if_none_match=None):
+        req = request(if_none_match)
+        return conditional(req, await cache.fetch(req, policy, compute))
+
+    async def main():
+        miss = await fetch()
+        hit = await fetch()
+        assert hit.body == miss.body
+        assert hit.etag == miss.etag
+        assert (await fetch(f'"{miss.etag.value}"')).status == 304
+
+    asyncio.run(main())
+
+
+def test_cached_response_round_trip():
+    entry = CachedResponse.from_response(render_json({"a": 1}), 10)
+    loaded = CachedResponse.loads(entry.dumps())
+    assert loaded.body == entry.body
+    assert loaded.etag_length == entry.etag_length
+    old = b'[200, "application/json", "utf-8", [], 0]\n{}'
+    assert CachedResponse.loads(old).etag_length is None
@@ -0,0 +1,27 @@
+import asyncio
+
+from cloudoll.web import executor
+from cloudoll.web.executor import Executors
+
+
+def test_workers_share_the_cpus(monkeypatch):
+    monkeypatch.setattr(executor.os, "cpu_count", lambda: 8)
+    pools = Executors()
+    assert pools.processes == 8
+    pools.configure(workers=4)
+    assert pools.processes == 2
+    pools.configure(workers=16)
+    assert pools.processes == 1
+    pools.configure(processes=3, workers=4)
+    assert pools.processes == 3
+
+
+def test_close_stops_the_pools():
+    pools = Executors()
+
+    async def main():
+        assert await pools.run("thread", sum, [1, 2]) == 3
+        await pools.close()
+
+    asyncio.run(main())
+    assert pools._threads is None
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import sys
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from cloudoll.web import core
+from cloudoll.web.manifest import LazyHandler
+
+MODULE = """
+import os
+from cloudoll.web import get, routes, View
+
+with open(os.path.join(os.path.dirname(__file__), "imports.log"), "a") as f:
+    f.write("x")
+if os.environ.get("CLOUDOLL_TEST_BROKEN"):
+    raise ImportError("broken")
+
+
+@get("/open", sa_ignore=True)
+async def open_(ctx):
+    return {"ignored": ctx.is_sa_ignore}
+
+
+@get("/limited", sa_ignore=True, rate_limit="1/m")
+async def limited(ctx):
+    return {"ok": 1}
+
+
+@routes("/view", sa_ignore=True)
+class Page(View):
+    async def get(self):
+        return {"view": 1}
+"""
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    controllers = tmp_path / "controllers"
+    controllers.mkdir()
+    (controllers / "pages.py").write_text(MODULE)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("CLOUDOLL_TEST_BROKEN", raising=False)
+    yield tmp_path
+    for name in [m for m in sys.modules if m.split(".")[0] == "controllers"]:
+        del sys.modules[name]
+
+
+def boot(project, monkeypatch, *paths):
+    """a fresh app over `project`, the statuses / json of GET `paths`"""
+    monkeypatch.setattr(core, "app", core.Application())
+    sys.modules.pop("controllers.pages", None)
+    config = {"server": {"lazy_routes": True, "manifest": "manifest.json"}}
+
+    async def main():
+        application = core.app.create(env=None, entry_model=None, config=config)
+        handlers = {
+            r.resource.canonical: r.handler for r in application.app.router.routes()
+        }
+        imported = "controllers.pages" in sys.modules
+        results = []
+        async with TestClient(TestServer(application.app)) as client:
+            for path in paths:
+                response = await client.get(path)
+                results.append((response.status, await response.text()))
+        return handlers, imported, results
+
+    return asyncio.run(main())
+
+
+def imports(project):
+    path = project / "controllers" / "imports.log"
+    return len(path.read_text()) if path.exists() else 0
+
+
+def test_manifest_round_trip(project, monkeypatch):
+    # first boot: every module is imported and the manifest written
+    _, imported, _ = boot(project, monkeypatch)
+    assert imported and imports(project) == 1
+    manifest = json.loads((project / "manifest.json").read_text())
+    [entry] = manifest["modules"].values()
+    assert not entry["eager"] and len(entry["routes"]) == 3
+
+    # second boot: stubs, the module is imported by the first request
+    handlers, imported, results = boot(
+        project, monkeypatch, "/open", "/limited", "/limited", "/view"
+    )
+    assert not imported
+    assert isinstance(handlers["/open"].__wrapped__, LazyHandler)
+    assert imports(project) == 2
+    statuses = [status for status, _ in results]
+    assert statuses == [200, 200, 429, 200]
+    assert json.loads(results[0][1])["ignored"] is True
+    assert json.loads(results[3][1])["view"] == 1
+
+    # a changed file is imported at startup again
+    pages = project / "controllers" / "pages.py"
+    pages.write_text(pages.read_text() + "\n# changed\n")
+    _, imported, results = boot(project, monkeypatch, "/open")
+    assert imported and imports(project) == 3
+    assert results[0][0] == 200
+
+
+def test_a_failed_lazy_import_is_not_retried(project, monkeypatch):
+    boot(project, monkeypatch)
+    monkeypatch.setenv("CLOUDOLL_TEST_BROKEN", "1")
+    _, imported, results = boot(project, monkeypatch, "/open", "/open", "/view")
+    assert not imported
+    assert [status for status, _ in results] == [500, 500, 500]
+    # the first boot and the one failed attempt
+    assert imports(project) == 2
@@ -0,0 +1,59 @@
+from aiohttp.test_utils import make_mocked_request
+
+from cloudoll.web.metrics import BUCKETS, Histogram, Metrics
+
+
+def test_histogram_bucket_bounds_are_exact():
+    hist = Histogram()
+    # 1ms sits on a bound, 0.00101 just over it, inside the same HDR bucket
+    for seconds in (0.0005, 0.001, 0.00101, 0.0024, 7, 20):
+        hist.record(seconds)
+    counts = dict(zip(BUCKETS, hist.cumulative()))
+    assert counts[0.001] == 2
+    assert counts[0.0025] == 4
+    assert counts[5] == 4
+    assert counts[10] == 5
+    assert hist.count == 6
+
+
+def test_histogram_quantiles_are_close():
+    hist = Histogram()
+    for ms in range(1, 1001):
+        hist.record(ms / 1000)
+    assert abs(hist.quantile(0.5) - 0.5) / 0.5 < 0.07
+    assert abs(hist.quantile(0.99) - 0.99) / 0.99 < 0.07
+    assert Histogram().quantile(0.5) == 0.0
+
+
+def test_render_exports_the_histogram():
+    metrics = Metrics()
+    metrics.start("GET", "/a")
+    metrics.finish("GET", "/a", 200, 0.002)
+    text = metrics.render()
+    assert (
+        'cloudoll_http_request_duration_seconds_bucket{method="GET",route="/a",'
+        'status="200",le="0.0025"} 1' in text
+    )
+    assert 'cloudoll_http_requests_in_flight{method="GET",route="/a"} 0' in text
+
+
+def request(remote, headers=None):
+    req = make_mocked_request("GET", "/metrics", headers=headers or {})
+    return req.clone(remote=remote)
+
+
+def test_metrics_are_closed_by_default():
+    metrics = Metrics()
+    # a proxy on the same host makes every client the loopback
+    assert not metrics.allowed(request("127.0.0.1"))
+    assert not metrics.allowed(request("::1"))
+    assert not metrics.allowed(request("203.0.113.7"))
+    assert Metrics(allow=["127.0.0.1/32"]).allowed(request("127.0.0.1"))
+
+
+def test_metrics_allow_and_token():
+    metrics = Metrics(allow=["10.0.0.0/8"], token="s3cret")
+    assert metrics.allowed(request("10.1.2.3"))
+    assert not metrics.allowed(request("127.0.0.1"))
+    assert metrics.allowed(request("203.0.113.7", {"Authorization": "Bearer s3cret"}))
+    assert not metrics.allowed(request("203.0.113.7", {"Authorization": "Bearer x"}))
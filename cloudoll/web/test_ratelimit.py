@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+from aiohttp.test_utils import make_mocked_request
+
+from cloudoll.web import ratelimit
+from cloudoll.web.ratelimit import RateLimit, RateLimiter, TokenBucket
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", clock)
+    return clock
+
+
+def test_parse():
+    limit = RateLimit.parse("5/10s")
+    assert (limit.rate, limit.per, limit.burst) == (5, 10, 5)
+    assert RateLimit.parse("100/m").per == 60
+    assert RateLimit.parse("1000/hour").per == 3600
+    assert RateLimit.parse(20).rate == 20
+    limit = RateLimit.parse({"rate": "10/s", "burst": 30})
+    assert (limit.rate, limit.per, limit.burst) == (10, 1, 30)
+    assert RateLimit.parse(None) is None
+    assert RateLimit.parse(False) is None
+    with pytest.raises(ValueError):
+        RateLimit.parse("5/fortnight")
+    with pytest.raises(ValueError):
+        RateLimit.parse(0)
+
+
+def test_window_is_in_whole_requests():
+    assert RateLimit(100, 60).window() == (100, 60000)
+    assert RateLimit(0.5, 1).window() == (1, 2000)
+    assert RateLimit(2.5, 1).window() == (5, 2000)
+
+
+def test_token_bucket_burst_then_refill(clock):
+    bucket = TokenBucket()
+    limit = RateLimit(2, 1, burst=3)
+    assert [bucket.take("a", limit)[0] for _ in range(4)] == [True] * 3 + [False]
+    allowed, wait = bucket.take("a", limit)
+    assert not allowed and wait == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.take("a", limit) == (True, 0.0)
+    # other keys have their own bucket
+    assert bucket.take("b", limit)[0]
+
+
+def test_token_bucket_fractional_rate(clock):
+    bucket = TokenBucket()
+    limit = RateLimit(0.5, 1)
+    assert bucket.take("a", limit)[0]
+    assert not bucket.take("a", limit)[0]
+    clock.now += 2
+    assert bucket.take("a", limit)[0]
+
+
+def test_token_bucket_drops_the_least_recent_keys(clock):
+    bucket = TokenBucket(max_keys=2)
+    limit = RateLimit(1)
+    for key in ("a", "b", "c"):
+        bucket.take(key, limit)
+    assert len(bucket) == 2
+
+
+class FakeRedis(object):
+    def __init__(self):
+        self.calls = []
+
+    def register_script(self, script):
+        async def run(keys, args):
+            self.calls.append(args)
+            return [1, 0, 0]
+
+        return run
+
+
+def test_redis_gets_the_whole_request_window():
+    redis = FakeRedis()
+    limiter = RateLimiter(redis=redis)
+    request = make_mocked_request("GET", "/")
+    allowed, _ = asyncio.run(limiter.check(request, RateLimit(0.5, 1), "r"))
+    assert allowed
+    window, count, _ = redis.calls[0]
+    assert (window, count) == (2000, 1)
@@ -0,0 +1,31 @@
+import asyncio
+from unittest import mock
+
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+from cloudoll.web.route import DEFAULT_OPTIONS, RouteOptions, route_options
+
+
+def matched(handler):
+    app = web.Application()
+    app.router.add_get("/", handler)
+    request = make_mocked_request("GET", "/", app=app)
+    request._match_info = asyncio.run(app.router.resolve(request))
+    return request
+
+
+def test_route_options_of_a_mocked_request_are_the_defaults():
+    # make_mocked_request's route is a Mock answering every attribute
+    assert route_options(make_mocked_request("GET", "/")) is DEFAULT_OPTIONS
+
+
+def test_route_options_of_the_handler():
+    async def handler(request):
+        return web.Response()
+
+    assert route_options(matched(handler)) is DEFAULT_OPTIONS
+    handler.route_options = mock.Mock()
+    assert route_options(matched(handler)) is DEFAULT_OPTIONS
+    handler.route_options = RouteOptions(executor="thread")
+    assert route_options(matched(handler)).executor == "thread"
@@ -0,0 +1,144 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from cloudoll.web import schedule
+from cloudoll.web.schedule import Cron, ScheduledTask, Scheduler
+
+
+def test_cron_fields():
+    cron = Cron("*/15 9-17 * * 1-5")
+    assert cron.minutes == {0, 15, 30, 45}
+    assert cron.hours == set(range(9, 18))
+    assert cron.weekdays == {1, 2, 3, 4, 5}
+    assert Cron("0 0 * * 7").weekdays == {0}
+    assert Cron("@hourly").minutes == {0}
+    assert Cron("5/20 * * * *").minutes == {5, 25, 45}
+
+
+@pytest.mark.parametrize(
+    "expr", ["* * * *", "60 * * * *", "* 24 * * *", "5-1 * * * *", "*/0 * * * *"]
+)
+def test_cron_rejects_invalid_expressions(expr):
+    with pytest.raises(ValueError):
+        Cron(expr)
+
+
+def test_next_after():
+    now = datetime(2024, 1, 31, 23, 59, 30)
+    assert Cron("* * * * *").next_after(now) == datetime(2024, 2, 1, 0, 0)
+    assert Cron("*/5 * * * *").next_after(datetime(2024, 1, 1, 10, 7)) == datetime(
+        2024, 1, 1, 10, 10
+    )
+    assert Cron("@daily").next_after(now) == datetime(2024, 2, 1, 0, 0)
+    assert Cron("0 0 29 2 *").next_after(now) == datetime(2024, 2, 29, 0, 0)
+    assert Cron("0 0 29 2 *").next_after(datetime(2024, 3, 1)) == datetime(
+        2028, 2, 29, 0, 0
+    )
+    # 2024-01-01 is a monday
+    assert Cron("30 8 * * 1").next_after(datetime(2024, 1, 1, 9)) == datetime(
+        2024, 1, 8, 8, 30
+    )
+
+
+def test_next_after_either_day_field():
+    # the 15th or any sunday, whichever comes first
+    cron = Cron("0 0 15 * 0")
+    assert cron.next_after(datetime(2024, 1, 1)) == datetime(2024, 1, 7)
+    assert cron.next_after(datetime(2024, 1, 14, 1)) == datetime(2024, 1, 15)
+
+
+def test_cron_that_never_runs():
+    with pytest.raises(ValueError):
+        Cron("0 0 31 2 *").next_after(datetime(2024, 1, 1))
+
+
+def test_every_is_aligned_to_the_epoch():
+    async def tick():
+        pass
+
+    task = ScheduledTask(tick, every=30)
+    assert task.next_run(1000) == 1020
+    assert task.next_run(1020) == 1050
+    assert not task.pass_app
+    with pytest.raises(ValueError):
+        ScheduledTask(tick)
+
+
+class FakeRedis(object):
+    def __init__(self, fail=False):
+        self.data = {}
+        self.fail = fail
+
+    async def set(self, key, value, nx=False, px=None):
+        if self.fail:
+            raise ConnectionError("down")
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def eval(self, script, numkeys, key, token, *args):
+        if self.data.get(key) != token:
+            return 0
+        if script == schedule._RELEASE:
+            del self.data[key]
+        return 1
+
+
+def scheduler(redis):
+    s = Scheduler()
+    s.redis = redis
+    return s
+
+
+def test_one_worker_claims_each_run():
+    async def main():
+        redis = FakeRedis()
+        task = ScheduledTask(lambda: None, every=10, name="t", overlap=True)
+        first = await scheduler(redis)._claim(task, 100, 10)
+        second = await scheduler(redis)._claim(task, 100, 10)
+        assert first == (True, None)
+        assert second == (False, None)
+
+    asyncio.run(main())
+
+
+def test_a_running_task_holds_its_lock_across_workers():
+    async def main():
+        redis = FakeRedis()
+        release = asyncio.Event()
+        ran = []
+
+        async def slow():
+            ran.append(1)
+            await release.wait()
+
+        task = ScheduledTask(slow, every=10, name="t")
+        a, b = scheduler(redis), scheduler(redis)
+        elected, token = await a._claim(task, 100, 10)
+        assert elected and token
+        run = asyncio.create_task(a._run(None, task, token))
+        await asyncio.sleep(0)
+        # the next run time, on another worker, while the first still runs
+        assert await b._claim(task, 110, 10) == (False, None)
+        release.set()
+        await run
+        assert "cloudoll:schedule:t:lock" not in redis.data
+        assert (await b._claim(task, 120, 10))[0]
+        assert ran == [1]
+
+    asyncio.run(main())
+
+
+def test_runs_are_skipped_when_redis_fails():
+    async def main():
+        task = ScheduledTask(lambda: None, every=10, name="t")
+        assert await scheduler(FakeRedis(fail=True))._claim(task, 100, 10) == (
+            False,
+            None,
+        )
+        assert await scheduler(None)._claim(task, 100, 10) == (True, None)
+
+    asyncio.run(main())
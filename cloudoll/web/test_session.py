@@ -0,0 +1,105 @@
+import asyncio
+
+from aiohttp.test_utils import make_mocked_request
+from aiohttp.web import Response
+import pytest
+from aiohttp_session import SESSION_KEY, STORAGE_KEY, AbstractStorage, Session
+
+from cloudoll.web.session import CookieStorage, LazySession, reads_session
+
+KEY = b"0" * 32
+
+
+def request(storage, cookie=None):
+    headers = {"Cookie": f"{storage.cookie_name}={cookie}"} if cookie else {}
+    req = make_mocked_request("GET", "/", headers=headers)
+    req[STORAGE_KEY] = storage
+    return req
+
+
+def saved_cookie(storage, data) -> str:
+    session = Session(None, data=None, new=True, max_age=None)
+    session.update(data)
+    response = Response()
+    asyncio.run(storage.save_session(request(storage), response, session))
+    return response.cookies[storage.cookie_name].value
+
+
+def test_lazy_session_decrypts_on_first_use():
+    storage = CookieStorage(KEY, cookie_name="S")
+    req = request(storage, saved_cookie(storage, {"uid": 7}))
+    session = LazySession(req)
+    assert not session.loaded
+    assert session["uid"] == 7
+    assert session.loaded
+    assert req[SESSION_KEY] is session._get()
+
+
+def test_lazy_session_without_cookie_is_new():
+    storage = CookieStorage(KEY, cookie_name="S")
+    session = LazySession(request(storage))
+    assert "uid" not in session
+    session["uid"] = 1
+    assert session.new
+
+
+def test_lazy_session_with_a_bad_cookie_is_new():
+    storage = CookieStorage(KEY, cookie_name="S")
+    session = LazySession(request(storage, "garbage"))
+    assert len(session) == 0
+    assert session.new
+
+
+def test_lazy_session_can_be_awaited():
+    storage = CookieStorage(KEY, cookie_name="S")
+    req = request(storage, saved_cookie(storage, {"uid": 7}))
+    session = asyncio.run(LazySession(req).load())
+    assert isinstance(session, Session)
+    assert session["uid"] == 7
+
+
+class RemoteStorage(AbstractStorage):
+    """a redis-like storage counting its round trips"""
+
+    def __init__(self):
+        super().__init__(cookie_name="S")
+        self.loads = 0
+
+    async def load_session(self, request):
+        self.loads += 1
+        return Session("id", data={"session": {"uid": 7}}, new=False)
+
+    async def save_session(self, request, response, session):
+        pass
+
+
+def test_remote_session_is_loaded_on_await_only():
+    storage = RemoteStorage()
+    req = request(storage)
+    session = LazySession(req)
+    with pytest.raises(RuntimeError):
+        session["uid"]
+    assert storage.loads == 0
+    assert asyncio.run(session.load())["uid"] == 7
+    assert session["uid"] == 7
+    assert storage.loads == 1
+
+
+def test_reads_session():
+    async def uses(ctx):
+        return ctx.session["uid"]
+
+    async def nested(ctx):
+        return [ctx.session.get(k) for k in "ab"]
+
+    async def ignores(ctx):
+        return ctx.params
+
+    class View(object):
+        async def __call__(self, ctx):
+            return ctx.session
+
+    assert reads_session(uses)
+    assert reads_session(nested)
+    assert not reads_session(ignores)
+    assert reads_session(View())
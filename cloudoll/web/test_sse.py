@@ -0,0 +1,98 @@
+import asyncio
+
+from aiohttp import web
+
+from cloudoll.web.sse import EventChannels, EventStream, format_event
+
+
+class FakeRedis(object):
+    """the id counter and the pubsub channel shared by the workers"""
+
+    def __init__(self):
+        self.counters = {}
+        self.published = []
+
+    async def eval(self, script, numkeys, key, now):
+        value = self.counters.get(key, 0) + 1
+        self.counters[key] = max(value, int(now))
+        return self.counters[key]
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+
+
+def test_format_event():
+    assert format_event("a\nb", event="x", id=3) == (
+        b"event: x\nid: 3\ndata: a\ndata: b\n\n"
+    )
+    assert format_event({"n": 1}) == b'data: {"n":1}\n\n'
+
+
+def test_ids_are_local_without_redis():
+    events = EventChannels()
+    first = asyncio.run(events("news").publish("a"))
+    assert asyncio.run(events("news").publish("b")) == first + 1
+
+
+def test_events_reach_the_other_workers():
+    redis = FakeRedis()
+    workers = [EventChannels(), EventChannels()]
+    for events in workers:
+        events.redis = redis
+
+    async def publish(events, data):
+        return await events("news").publish(data, event="news")
+
+    ids = [asyncio.run(publish(workers[0], "a")), asyncio.run(publish(workers[1], "b"))]
+    # one counter for both workers
+    assert ids[1] == ids[0] + 1
+    for channel, message in redis.published:
+        assert channel == "cloudoll:sse"
+        for events in workers:
+            events._on_message(message)
+    for events in workers:
+        # each event once, its own worker skips its own message
+        assert [event_id for event_id, _ in events("news")._buffer] in (
+            ids,
+            ids[::-1],
+        )
+        assert list(events("news")._missed(str(ids[0]))) == [
+            format_event("b", "news", ids[1])
+        ]
+
+
+def test_client_leaving_mid_stream_ends_it_quietly():
+    sent = []
+    finished = []
+
+    async def handler(request):
+        async with EventStream(request) as stream:
+            for x in range(100):
+                await stream.send({"n": x})
+                sent.append(x)
+                await asyncio.sleep(0.01)
+        finished[0].set_result(stream.closed)
+        return stream.response
+
+    async def main():
+        finished.append(asyncio.get_running_loop().create_future())
+        app = web.Application()
+        app.router.add_get("/", handler)
+        # a real site, the test server cancels the handler instead
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET / HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            await writer.drain()
+            assert b"data:" in await reader.readuntil(b"\n\n")
+            writer.close()
+            return await asyncio.wait_for(finished[0], 5)
+        finally:
+            await runner.cleanup()
+
+    assert asyncio.run(main()) is True
+    assert len(sent) < 100
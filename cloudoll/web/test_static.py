@@ -0,0 +1,52 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from cloudoll.web.static import StaticFiles
+
+
+def fetch(directory, names, accept):
+    async def main():
+        app = web.Application()
+        app.router.add_get("/static/{filename:.*}", StaticFiles(directory))
+        found = {}
+        async with TestClient(TestServer(app)) as client:
+            for name in names:
+                response = await client.get(
+                    f"/static/{name}",
+                    headers={"Accept-Encoding": accept},
+                    auto_decompress=False,
+                )
+                found[name] = (
+                    response.headers.get("Content-Encoding"),
+                    await response.read(),
+                )
+        return found
+
+    return asyncio.run(main())
+
+
+def test_precompressed_siblings_whatever_the_size(tmp_path):
+    (tmp_path / "small.js").write_bytes(b"s" * 1024)
+    (tmp_path / "small.js.br").write_bytes(b"small-br")
+    (tmp_path / "small.js.gz").write_bytes(b"small-gz")
+    (tmp_path / "big.js").write_bytes(b"b" * 512 * 1024)
+    (tmp_path / "big.js.br").write_bytes(b"big-br")
+    (tmp_path / "big.js.gz").write_bytes(b"big-gz")
+    names = ["small.js", "big.js"]
+    assert fetch(tmp_path, names, "gzip, br, zstd") == {
+        "small.js": ("br", b"small-br"),
+        "big.js": ("br", b"big-br"),
+    }
+    assert fetch(tmp_path, names, "gzip") == {
+        "small.js": ("gzip", b"small-gz"),
+        "big.js": ("gzip", b"big-gz"),
+    }
+    assert fetch(tmp_path, names, "identity")["small.js"] == (None, b"s" * 1024)
+
+
+def test_small_files_without_siblings_are_compressed_in_memory(tmp_path):
+    (tmp_path / "app.css").write_bytes(b"a" * 4096)
+    coding, body = fetch(tmp_path, ["app.css"], "gzip")["app.css"]
+    assert coding == "gzip" and len(body) < 4096
@@ -0,0 +1,43 @@
+import asyncio
+
+from aiohttp import FormData, web
+from aiohttp.test_utils import TestClient, TestServer
+
+from cloudoll.web.upload import Upload, UploadLimit, unique_path
+
+
+def test_unique_path_keeps_existing_files(tmp_path):
+    target = tmp_path / "a.txt"
+    assert unique_path(target) == target
+    other = unique_path(target)
+    assert other != target and other.parent == tmp_path
+    assert other.name.startswith("a-") and other.suffix == ".txt"
+
+
+def upload_twice(directory):
+    async def handler(request):
+        files = await Upload(request, UploadLimit()).save(directory)
+        return web.json_response([str(f.path) for f in files])
+
+    async def main():
+        app = web.Application()
+        app.router.add_post("/", handler)
+        paths = []
+        async with TestClient(TestServer(app)) as client:
+            for body in (b"first", b"second"):
+                form = FormData()
+                form.add_field("file", body, filename="same.txt")
+                response = await client.post("/", data=form)
+                paths += await response.json()
+        return paths
+
+    return asyncio.run(main())
+
+
+def test_same_name_uploads_do_not_overwrite(tmp_path):
+    first, second = upload_twice(tmp_path)
+    assert first == str(tmp_path / "same.txt")
+    assert first != second
+    assert open(first, "rb").read() == b"first"
+    assert open(second, "rb").read() == b"second"
+    assert not list(tmp_path.glob("*.part"))
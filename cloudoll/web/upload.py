@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Streaming multipart uploads, routes declared with `upload=`:
+
+    @post("/api/upload", upload={"max_size": 2 * 1024**3, "max_files": 5})
+    async def upload(ctx, upload):
+        files = await upload.save("static/upload")
+        return {"files": [f.to_dict() for f in files], "fields": upload.fields}
+
+Parts are read chunk by chunk, written to disk in a thread or handed to an
+async sink, hashed and counted against the route's limits as they arrive,
+so memory stays at a chunk whatever the size of the upload.
+"""
+
+__author__ = "Qiu / smallerqiu@gmail.com"
+
+import asyncio
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+from aiohttp import BodyPartReader
+from aiohttp.web import HTTPBadRequest, HTTPRequestEntityTooLarge
+from aiohttp.web_request import Request
+
+
+class UploadLimit(object):
+    """
+    :params max_size bytes of the whole request body
+    :params max_file_size bytes of a single file, `max_size` by default
+    :params max_files files in a request
+    :params max_field_size bytes of a plain form field
+    :params hashes hashlib names computed over every file
+    :params chunk_size bytes read from the socket at once
+    """
+
+    __slots__ = (
+        "max_size",
+        "max_file_size",
+        "max_files",
+        "max_field_size",
+        "hashes",
+        "chunk_size",
+    )
+
+    def __init__(
+        self,
+        max_size: int = 1024**3,
+        max_file_size: Optional[int] = None,
+        max_files: int = 10,
+        max_field_size: int = 1024**2,
+        hashes: Iterable[str] = ("sha256",),
+        chunk_size: int = 256 * 1024,
+    ):
+        self.max_size = int(max_size)
+        self.max_file_size = int(max_file_size or max_size)
+        self.max_files = int(max_files)
+        self.max_field_size = int(max_field_size)
+        self.hashes = tuple(hashes)
+        for name in self.hashes:
+            hashlib.new(name)  # unknown names fail at startup
+        self.chunk_size = int(chunk_size)
+
+    @classmethod
+    def parse(cls, limit: Union[None, bool, int, dict, "UploadLimit"]):
+        """upload=True, upload=1024**3, upload={"max_size": ..., "max_files": 5}"""
+        if limit is None or limit is False:
+            return None
+        if isinstance(limit, UploadLimit):
+            return limit
+        if limit is True:
+            return cls()
+        if isinstance(limit, dict):
+            return cls(**limit)
+        return cls(limit)
+
+
+class UploadedFile(object):
+    __slots__ = ("name", "filename", "content_type", "size", "hashes", "path")
+
+    def __init__(self, name, filename, content_type, size, hashes, path=None):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.size = size
+        # hashlib name -> hex digest
+        self.hashes: Dict[str, str] = hashes
+        self.path: Optional[Path] = path
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "filename": self.filename,
+            "content_type": self.content_type,
+            "size": self.size,
+            "hashes": self.hashes,
+            "path": str(self.path) if self.path is not None else None,
+        }
+
+
+def safe_filename(filename: Optional[str]) -> str:
+    """the client's file name without directories, a random one when unusable"""
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    if name in ("", ".", "..") or "\x00" in name:
+        return uuid.uuid4().hex
+    return name
+
+
+def unique_path(path: Path) -> Path:
+    """
+    Create `path`, or `name-<random>.ext` next to it when it exists, and
+    return it; the name is claimed atomically, never an existing file's
+    """
+    candidate = path
+    while True:
+        try:
+            os.close(os.open(candidate, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+            return candidate
+        except FileExistsError:
+            candidate = path.with_name(
+                f"{path.stem}-{uuid.uuid4().hex[:8]}{path.suffix}"
+            )
+
+
+class _FileSink(object):
+    """
+    writes and hashes in the default executor, into a `.part` file moved
+    to `path`, or to a free name next to it when a file is already there
+    """
+
+    def __init__(self, path: Path, hashes):
+        self.path = path
+        self.tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.part")
+        self.hashes = hashes
+        self.f = None
+
+    def _write(self, chunk: bytes):
+        if self.f is None:
+            self.f = open(self.tmp, "wb")
+        self.f.write(chunk)
+        for h in self.hashes:
+            h.update(chunk)
+
+    def _close(self, ok: bool):
+        if self.f is None:
+            self.f = open(self.tmp, "wb")  # empty file
+        self.f.close()
+        if ok:
+            self.path = unique_path(self.path)
+            try:
+                os.replace(self.tmp, self.path)
+            except OSError:
+                os.unlink(self.path)
+                raise
+        else:
+            os.unlink(self.tmp)
+
+
+class Upload(object):
+    """
+    The multipart body of a request, iterated part by part:
+
+        async for part in upload:
+            if part.filename:
+                await upload.save_part(part, sink)
+            else:
+                value = await upload.read_field(part)
+
+    `sink` is a path or an async function called with every chunk.
+    """
+
+    def __init__(self, request: Request, limit: UploadLimit):
+        self.request = request
+        self.limit = limit
+        self.fields: Dict[str, str] = {}
+        self.files: List[UploadedFile] = []
+        self.size = 0
+        self._reader = None
+        length = request.content_length
+        if length is not None and length > limit.max_size:
+            raise HTTPRequestEntityTooLarge(limit.max_size, length)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> BodyPartReader:
+        if self._reader is None:
+            if self.request.content_type != "multipart/form-data":
+                raise HTTPBadRequest(text="multipart/form-data expected")
+            self._reader = await self.request.multipart()
+        part = await self._reader.next()
+        if part is None:
+            raise StopAsyncIteration
+        if not isinstance(part, BodyPartReader):
+            raise HTTPBadRequest(text="nested multipart is not supported")
+        return part
+
+    async def _chunks(self, part: BodyPartReader, max_size: int):
+        size = 0
+        while True:
+            chunk = await part.read_chunk(self.limit.chunk_size)
+            if not chunk:
+                return
+            size += len(chunk)
+            self.size += len(chunk)
+            if size > max_size:
+                raise HTTPRequestEntityTooLarge(max_size, size)
+            if self.size > self.limit.max_size:
+                raise HTTPRequestEntityTooLarge(self.limit.max_size, self.size)
+            yield chunk
+
+    async def read_field(self, part: BodyPartReader) -> str:
+        """a plain form field, also kept in `fields`"""
+        data = bytearray()
+        async for chunk in self._chunks(part, self.limit.max_field_size):
+            data.extend(chunk)
+        value = bytes(data).decode(part.get_charset("utf-8"))
+        self.fields[part.name] = value
+        return value
+
+    async def save_part(
+        self,
+        part: BodyPartReader,
+        sink: Union[str, Path, Callable],
+    ) -> UploadedFile:
+        """
+        Stream a file part to `sink`, a path or `async def write(chunk)`.
+        An existing file is never overwritten, the part is saved as
+        `name-<random>.ext` instead, see `UploadedFile.path`.
+        """
+        if len(self.files) >= self.limit.max_files:
+            raise HTTPRequestEntityTooLarge(
+                self.limit.max_files,
+                len(self.files) + 1,
+                text=f"At most {self.limit.max_files} files are allowed.",
+            )
+        hashes = [hashlib.new(name) for name in self.limit.hashes]
+        chunks = self._chunks(part, self.limit.max_file_size)
+        size = 0
+        path = None
+        if callable(sink):
+            async for chunk in chunks:
+                for h in hashes:
+                    h.update(chunk)
+                size += len(chunk)
+                await sink(chunk)
+        else:
+            path = Path(sink)
+            loop = asyncio.get_running_loop()
+            writer = _FileSink(path, hashes)
+            ok = False
+            try:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    await loop.run_in_executor(None, writer._write, chunk)
+                ok = True
+            finally:
+                await loop.run_in_executor(None, writer._close, ok)
+            path = writer.path
+        uploaded = UploadedFile(
+            part.name,
+            part.filename,
+            part.headers.get("Content-Type", "application/octet-stream"),
+            size,
+            {h.name: h.hexdigest() for h in hashes},
+            path,
+        )
+        self.files.append(uploaded)
+        return uploaded
+
+    async def save(
+        self,
+        directory: Union[str, Path],
+        filename: Optional[Callable[[BodyPartReader], str]] = None,
+    ) -> List[UploadedFile]:
+        """
+        Save every file into `directory` and read every field into `fields`,
+        the saved files are removed again when a limit is hit.
+
+        :params filename name of a part on disk, the client's base name by
+            default, a random one when it has none
+        """
+        directory = Path(directory)
+        await asyncio.get_running_loop().run_in_executor(
+            None, lambda: directory.mkdir(parents=True, exist_ok=True)
+        )
+        saved = len(self.files)
+        try:
+            async for part in self:
+                if part.filename is None:
+                    await self.read_field(part)
+                    continue
+                name = filename(part) if filename else safe_filename(part.filename)
+                await self.save_part(part, directory / safe_filename(name))
+        except BaseException:
+            # a rejected request leaves nothing behind
+            for uploaded in self.files[saved:]:
+                try:
+                    uploaded.path.unlink()
+                except FileNotFoundError:
+                    pass
+            raise
+        return self.files